@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+A two-tier cache backend: a small in-process cache (L1) in front of a cache that all the
+processes share (L2), such as a DatabaseCache or FileBasedCache.
+
+Every gunicorn worker has its own L1, a LocMemCache that keeps up to L1_MAX_ENTRIES of the least
+recently used values for at most L1_TIMEOUT seconds, so that the values read most are read without
+a round trip to the L2. Values are written to both tiers.
+
+A value that is set or deleted in one worker can still be read from the other workers' L1 until it
+expires there, so values should be cached under keys that change with them. This project puts version
+numbers in its cache keys, which are bumped with incr(). Integers, such as these version numbers, are
+kept in the L1 for only L1_COUNTER_TIMEOUT seconds, so that a bump reaches every worker within
+L1_COUNTER_TIMEOUT seconds without the other values having to leave the L1.
+
+See new_version() for the number to start a version key at.
+
+Configure it with the alias of the L2 cache, e.g.:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'signbank.cache.TwoTierCache',
+            'LOCATION': 'signbank-l1',
+            'OPTIONS': {'L2': 'shared', 'L1_MAX_ENTRIES': 1000, 'L1_TIMEOUT': 30, 'L1_COUNTER_TIMEOUT': 1},
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'signbank_cache',
+        },
+    }
+
+The number of hits and misses of each tier is counted per process, see stats().
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Hit and miss counts of each cache, by its LOCATION. Django creates a cache instance per thread,
+# the counts are shared by all the threads of the process.
+_stats = {}
+_stats_lock = threading.Lock()
+_missing = object()
+
+
+def new_version():
+    """
+    Return a number to start a version key at. A version key can be culled from a cache that has too
+    many entries, and then started again, so it is started at the current time in nanoseconds rather
+    than at 1, which could bring back the entries of an earlier version.
+    """
+    return time.time_ns()
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super(TwoTierCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options['L2']
+        self._l1_timeout = int(options.get('L1_TIMEOUT', 30))
+        self._l1_counter_timeout = float(options.get('L1_COUNTER_TIMEOUT', 1))
+        # LocMemCaches with the same name share their storage, across the threads of the process.
+        self._l1 = LocMemCache(location, {
+            'TIMEOUT': self._l1_timeout,
+            'OPTIONS': {'MAX_ENTRIES': int(options.get('L1_MAX_ENTRIES', 1000))},
+        })
+        self._location = location
+        with _stats_lock:
+            _stats.setdefault(location, Counter())
+
+    @property
+    def _l2(self):
+        return caches[self._l2_alias]
+
+    def _count(self, name):
+        with _stats_lock:
+            _stats[self._location][name] += 1
+
+    def stats(self):
+        """Return the numbers of 'l1_hits', 'l2_hits' and 'misses' of this cache in this process."""
+        with _stats_lock:
+            counts = _stats[self._location]
+            return {name: counts[name] for name in ('l1_hits', 'l2_hits', 'misses')}
+
+    def _l1_timeout_for(self, value, timeout=DEFAULT_TIMEOUT):
+        l1_timeout = self._l1_counter_timeout if type(value) is int else self._l1_timeout
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return l1_timeout
+        return min(timeout, l1_timeout)
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_timeout = self._l1_timeout_for(value, timeout)
+        if l1_timeout > 0:
+            self._l1.set(key, value, l1_timeout, version=version)
+
+    def get(self, key, default=None, version=None):
+        value = self._l1.get(key, _missing, version=version)
+        if value is not _missing:
+            self._count('l1_hits')
+            return value
+        value = self._l2.get(key, _missing, version=version)
+        if value is _missing:
+            self._count('misses')
+            return default
+        self._count('l2_hits')
+        self._l1_set(key, value, version=version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version=version)
+        self._l1_set(key, value, timeout, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self._l2.add(key, value, timeout, version=version):
+            return False
+        self._l1_set(key, value, timeout, version=version)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self._l1.get(key, _missing, version=version)
+        if value is not _missing:
+            self._l1.touch(key, self._l1_timeout_for(value, timeout), version=version)
+        return self._l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1.delete(key, version=version)
+        return self._l2.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self._l2.incr(key, delta, version=version)
+        self._l1.delete(key, version=version)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version=version) is not _missing
+
+    def clear(self):
+        self._l1.clear()
+        self._l2.clear()
@@ -20,9 +20,9 @@ from django_comments.admin import CommentsAdmin
 from django_comments.forms import CommentForm
 from django_comments.models import Comment
 from django_comments.signals import comment_was_posted
-from guardian.shortcuts import get_objects_for_user
 from notifications.signals import notify
 
+from signbank.dictionary.permissions import datasets_for_user
 from signbank.tagging.models import TaggedItem
 
 from signbank.tagging.utils import add_tag, filter_queryset_with_all_tags, tags_for_selection
@@ -116,15 +116,13 @@ class CommentListView(ListView):
         if 'user_name' in get and get['user_name'] != '':
             qs = qs.filter(user_name__icontains=get['user_name'])
         if 'tag' in get and get['tag'] != '':
-            tag_names = [get['tag']]
-            tagged = filter_queryset_with_all_tags(Comment.objects.all(), tag_names)
-            qs = qs.filter(id__in=tagged.values_list('id', flat=True))
+            qs = filter_queryset_with_all_tags(qs, [get['tag']])
 
         qs = qs.filter(is_removed=False)
 
         qs = qs.prefetch_related('content_object', 'content_object__dataset', 'user')
         # Filter in only objects in the datasets the user has permissions to.
-        allowed_datasets = get_objects_for_user(self.request.user, 'dictionary.view_dataset')
+        allowed_datasets = datasets_for_user(self.request.user)
         qs = qs.filter(id__in=[x.id for x in qs if hasattr(x.content_object, 'dataset') and x.content_object.dataset in allowed_datasets])
 
         return qs.order_by('-submit_date')
@@ -16,10 +16,13 @@ from signbank.tagging.models import TaggedItem
 
 from signbank.tagging.utils import tags_for_selection, tags_used_for_model
 
-from .models import (AllowedTags, Dataset, Dialect, FieldChoice, Gloss, Lemma,
+from .artifacts import mark_dataset_artifacts_stale
+from .glosscache import invalidate_public_gloss_context
+from .models import (AllowedTags, Dataset, DatasetArtifact, Dialect, ExportJob, FieldChoice, Gloss, Lemma,
                      GlossRelation, GlossTranslations, GlossURL, Language,
                      ManualValidationAggregation, ShareValidationAggregation,
-                     SignLanguage, Translation, ValidationRecord)
+                     SignLanguage, Task, Translation, ValidationRecord)
+from .taskqueue import retry_tasks
 from ..video.admin import GlossVideoInline
 
 
@@ -143,12 +146,24 @@ class GlossTranslationsInline(admin.TabularInline):
         return False
 
 
+def update_glosses(queryset, **values):
+    """
+    Update the glosses of `queryset` with `values`. update() doesn't send the signals that mark the
+    artifacts of the glosses' datasets stale and replace the cached public pages of the glosses, so
+    that is done here.
+    """
+    glosses = list(queryset.values_list("pk", "dataset_id"))
+    queryset.update(**values)
+    mark_dataset_artifacts_stale({dataset_id for _pk, dataset_id in glosses})
+    invalidate_public_gloss_context(pk for pk, _dataset_id in glosses)
+
+
 def publish(modeladmin, request, queryset):
-    queryset.update(published=True)
+    update_glosses(queryset, published=True)
 
 
 def unpublish(modeladmin, request, queryset):
-    queryset.update(published=False)
+    update_glosses(queryset, published=False)
 
 
 publish.short_description = _("Publish selected glosses")
@@ -156,11 +171,11 @@ unpublish.short_description = _("Unpublish selected glosses")
 
 
 def exclude_from_ecv(modeladmin, request, queryset):
-    queryset.update(exclude_from_ecv=True)
+    update_glosses(queryset, exclude_from_ecv=True)
 
 
 def include_in_ecv(modeladmin, request, queryset):
-    queryset.update(exclude_from_ecv=False)
+    update_glosses(queryset, exclude_from_ecv=False)
 
 
 exclude_from_ecv.short_description = _("Exclude glosses from ECV")
@@ -330,6 +345,33 @@ class ValidationRecordAdmin(admin.ModelAdmin):
     list_filter = [GlossFilter, "sign_seen"]
 
 
+class ExportJobAdmin(admin.ModelAdmin):
+    model = ExportJob
+    list_display = ("export_format", "status", "rows_written", "total_rows", "created_by", "created_at", "expires_at")
+    list_filter = ["status", "export_format"]
+    readonly_fields = ("started_at", "finished_at")
+
+
+class DatasetArtifactAdmin(admin.ModelAdmin):
+    model = DatasetArtifact
+    list_display = ("dataset", "kind", "stale", "generated_at")
+    list_filter = ["kind", "stale"]
+    readonly_fields = ("file", "etag", "generated_at")
+
+
+class TaskAdmin(admin.ModelAdmin):
+    model = Task
+    list_display = ("name", "status", "attempts", "max_attempts", "run_after", "created_at", "finished_at")
+    list_filter = ["status", "name"]
+    readonly_fields = ("attempts", "error", "result", "created_at", "started_at", "finished_at")
+    actions = ["retry"]
+
+    @admin.action(description=_("Retry the selected failed tasks"))
+    def retry(self, request, queryset):
+        count = retry_tasks(queryset)
+        self.message_user(request, _("%(count)d tasks queued again.") % {"count": count})
+
+
 class UserAdmin(AuthUserAdmin):
     inlines = [AssignedGlossInline]
 
@@ -345,6 +387,9 @@ admin.site.register(Lemma)
 admin.site.register(ShareValidationAggregation, ShareValidationAggregationAdmin)
 admin.site.register(ManualValidationAggregation, ManualValidationAggregationAdmin)
 admin.site.register(ValidationRecord, ValidationRecordAdmin)
+admin.site.register(ExportJob, ExportJobAdmin)
+admin.site.register(DatasetArtifact, DatasetArtifactAdmin)
+admin.site.register(Task, TaskAdmin)
 
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
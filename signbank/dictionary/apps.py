@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class DictionaryConfig(AppConfig):
+    name = 'signbank.dictionary'
+    label = 'dictionary'
+    verbose_name = 'Dictionary'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Files generated from the glosses of a dataset ahead of time, see DatasetArtifact.
+
+Building the public ECV or the CSV of a dataset reads every gloss in it, and ELAN clients request
+the ECV all the time. Instead the file is built once and kept in EXPORT_FILE_STORAGE, and requests
+are answered with the file, with an ETag and Last-Modified so that clients can revalidate it cheaply.
+Changes to a dataset's glosses mark its artifacts stale (see signals.py), which queues a task that
+rebuilds them, see taskqueue.py.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import tempfile
+
+import djqscsv
+from django.core.files import File
+from django.db import transaction
+from django.http import FileResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .ecv import ecv_lines
+from .models import DatasetArtifact, Gloss
+from .taskqueue import enqueue
+
+#: The task that rebuilds the stale artifacts.
+BUILD_TASK = "signbank.dictionary.artifacts.build_stale_dataset_artifacts"
+
+
+def public_ecv_glosses(dataset):
+    return Gloss.objects.filter(dataset=dataset, published=True, exclude_from_ecv=False)
+
+
+def csv_glosses(dataset):
+    return Gloss.objects.filter(dataset=dataset, exclude_from_ecv=False)
+
+
+def write_public_ecv(dataset, artifact_file):
+    for line in ecv_lines(dataset, public_ecv_glosses(dataset)):
+        artifact_file.write(line.encode("utf-8"))
+
+
+def write_csv(dataset, artifact_file):
+    djqscsv.write_csv(csv_glosses(dataset), artifact_file)
+
+
+#: The kinds of artifacts, and their filename, content type and the function that writes their contents.
+ARTIFACT_KINDS = {
+    DatasetArtifact.Kind.PUBLIC_ECV: ("ecv.xml", "text/xml", write_public_ecv),
+    DatasetArtifact.Kind.CSV: ("gloss_export.csv", "text/csv", write_csv),
+}
+
+
+class ArtifactBuildError(Exception):
+    """Some artifacts could not be built. They are marked stale again."""
+
+
+class HashingFile(object):
+    """Writes to `file`, keeping a SHA-256 hash of what was written."""
+
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.file.write(data)
+
+
+def mark_dataset_artifacts_stale(dataset_ids):
+    """
+    Mark the artifacts of the given datasets to be rebuilt, and queue their rebuild. Artifacts that are
+    already stale have a rebuild queued, so only the ones that weren't queue another.
+    """
+    if DatasetArtifact.objects.filter(dataset_id__in=dataset_ids, stale=False).update(stale=True):
+        enqueue(BUILD_TASK)
+
+
+def claim_next_stale_artifact():
+    """
+    Mark the next stale DatasetArtifact as fresh and return it, or return None if there is nothing to do.
+    It is marked before being built, so that changes made to the glosses while it is built mark it stale again.
+    Rows locked by other workers are skipped, so several workers can run at once.
+    """
+    with transaction.atomic():
+        artifact = DatasetArtifact.objects.select_for_update(skip_locked=True)\
+            .select_related("dataset")\
+            .filter(stale=True)\
+            .order_by("pk")\
+            .first()
+        if artifact is None:
+            return None
+        artifact.stale = False
+        artifact.save(update_fields=["stale"])
+    return artifact
+
+
+def build_dataset_artifact(artifact):
+    """Write the file of `artifact` to its storage, replacing the previous one."""
+    filename, _content_type, write = ARTIFACT_KINDS[artifact.kind]
+    previous_file = artifact.file.name if artifact.file else None
+    # Spooled to disk like the files of export jobs, see exports.run_export_job().
+    with tempfile.TemporaryFile() as artifact_file:
+        hashing_file = HashingFile(artifact_file)
+        write(artifact.dataset, hashing_file)
+        artifact_file.seek(0)
+        artifact.file.save("%s-%s" % (artifact.dataset_id, filename), File(artifact_file), save=False)
+    artifact.etag = hashing_file.hash.hexdigest()
+    artifact.generated_at = timezone.now()
+    artifact.save(update_fields=["file", "etag", "generated_at"])
+    if previous_file and previous_file != artifact.file.name:
+        artifact.file.storage.delete(previous_file)
+    return artifact
+
+
+def build_stale_dataset_artifacts():
+    """
+    Task that rebuilds the stale DatasetArtifacts, and returns the number of artifacts built. Artifacts
+    that fail to build are marked stale again, and the task raises an ArtifactBuildError so that it is
+    retried for them.
+    """
+    built = 0
+    failed = {}
+    while (artifact := claim_next_stale_artifact()) is not None:
+        try:
+            build_dataset_artifact(artifact)
+        except Exception as e:
+            failed[artifact.pk] = "%s: %s" % (artifact, e)
+        else:
+            built += 1
+    # Marked stale again after the loop, so that they are only built again when the task is retried.
+    if failed:
+        DatasetArtifact.objects.filter(pk__in=failed.keys()).update(stale=True)
+        raise ArtifactBuildError("Failed to build %d artifacts: %s" % (len(failed), "; ".join(failed.values())))
+    return built
+
+
+def dataset_artifact_response(request, dataset, kind):
+    """
+    Return a response with the file of the `kind` of artifact of `dataset`, or a 304 Not Modified if the
+    client's copy is up to date. Returns None if the file has not been built yet, it is then queued to be.
+    """
+    artifact, created = DatasetArtifact.objects.get_or_create(dataset=dataset, kind=kind)
+    if created:
+        enqueue(BUILD_TASK)
+    if not artifact.file:
+        return None
+
+    etag = quote_etag(artifact.etag)
+    last_modified = int(artifact.generated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        _filename, content_type, _write = ARTIFACT_KINDS[kind]
+        response = FileResponse(artifact.file.open("rb"), content_type=content_type)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
@@ -4,34 +4,78 @@ from __future__ import unicode_literals
 import codecs
 import csv
 import datetime
-import random
 import re
-import threading
 
 from _collections import defaultdict
 from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.sites.models import Site
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import transaction
-from django.http import HttpResponseRedirect
-from django.shortcuts import render, reverse
-from django.utils.timezone import get_current_timezone
+from django.http import HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, render, reverse
+from django.utils import timezone
 from django.utils.translation import gettext as _
-from django_comments.models import Comment
-from guardian.shortcuts import get_objects_for_user, get_perms
 from signbank.tagging.models import Tag, TaggedItem
 
 from .forms import CSVFileOnlyUpload, CSVUploadForm
-from .models import (Dataset, FieldChoice, Gloss, GlossTranslations, Language,
-                     ManualValidationAggregation, ShareValidationAggregation, ValidationRecord)
-from .tasks import retrieve_videos_for_glosses
+from .models import Gloss, ImportBatch, ManualValidationAggregation, ValidationRecord
+from .artifacts import mark_dataset_artifacts_stale
+from .permissions import datasets_for_user, has_dataset_perm
+from .search import update_gloss_search_documents
+from .share_import import (glosses_by_share_id, imported_glosses, queue_nzsl_share_import,
+                           resume_nzsl_share_import)
 from ..video.models import GlossVideo
 
-User = get_user_model()
+#: Number of rows looked up or created per query in the gloss CSV import.
+BULK_BATCH_SIZE = 1000
+
+
+def existing_glosses(dataset, idglosses):
+    """Return a dict of idgloss -> Gloss of the glosses of `dataset` with one of the given idglosses."""
+    idglosses = list(idglosses)
+    existing = {}
+    for start in range(0, len(idglosses), BULK_BATCH_SIZE):
+        for gloss in Gloss.objects.filter(dataset=dataset, idgloss__in=idglosses[start:start + BULK_BATCH_SIZE]):
+            existing[gloss.idgloss] = gloss
+    return existing
+
+
+def import_batch_session_key(kind):
+    return "import_batch_%s" % kind
+
+
+def stage_import_batch(request, kind, data, dataset=None):
+    """
+    Store the rows parsed for the preview of an import in an ImportBatch, replacing any earlier one of
+    the user of the same kind, and keep only its id in the session.
+    """
+    discard_import_batch(request, kind)
+    # Queued and running imports are kept however old they are.
+    ImportBatch.objects.filter(
+        created_at__lt=timezone.now() - datetime.timedelta(seconds=settings.IMPORT_BATCH_MAX_AGE),
+        status__in=[ImportBatch.Status.STAGED, ImportBatch.Status.DONE, ImportBatch.Status.FAILED]).delete()
+    batch = ImportBatch.objects.create(kind=kind, created_by=request.user, dataset=dataset, data=data)
+    request.session[import_batch_session_key(kind)] = batch.pk
+    return batch
+
+
+def get_import_batch(request, kind):
+    """Return the ImportBatch of the preview of the user's import of `kind`, or None if it has expired."""
+    batch_id = request.session.get(import_batch_session_key(kind))
+    if batch_id is None:
+        return None
+    return ImportBatch.objects.select_related("dataset").filter(
+        pk=batch_id, kind=kind, created_by=request.user, status=ImportBatch.Status.STAGED,
+        created_at__gte=timezone.now() - datetime.timedelta(seconds=settings.IMPORT_BATCH_MAX_AGE)).first()
+
+
+def discard_import_batch(request, kind):
+    """Delete the ImportBatch of the user's import of `kind`, if there is one."""
+    batch_id = request.session.pop(import_batch_session_key(kind), None)
+    if batch_id is not None:
+        ImportBatch.objects.filter(pk=batch_id, created_by=request.user, status=ImportBatch.Status.STAGED).delete()
 
 
 @login_required
@@ -39,19 +83,18 @@ User = get_user_model()
 def import_gloss_csv(request):
     """
     Check which objects exist and which not. Then show the user a list of glosses that will be added if user confirms.
-    Store the glosses to be added into sessions.
+    Store the glosses to be added into an ImportBatch.
     """
     glosses_new = []
     glosses_exists = []
-    # Make sure that the session variables are flushed before using this view.
-    if 'dataset_id' in request.session: del request.session['dataset_id']
-    if 'glosses_new' in request.session: del request.session['glosses_new']
+    # Make sure that the rows of an earlier import are discarded before using this view.
+    discard_import_batch(request, ImportBatch.Kind.GLOSS)
 
     if request.method == 'POST':
         form = CSVUploadForm(request.POST, request.FILES)
         if form.is_valid():
             dataset = form.cleaned_data['dataset']
-            if 'view_dataset' not in get_perms(request.user, dataset):
+            if not has_dataset_perm(request.user, dataset):
                 # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
                 msg = _("You do not have permissions to import glosses to this lexicon.")
                 messages.error(request, msg)
@@ -59,9 +102,6 @@ def import_gloss_csv(request):
             try:
                 glossreader = csv.reader(codecs.iterdecode(form.cleaned_data['file'], 'utf-8'), delimiter=',', quotechar='"')
             except csv.Error as e:
-                # Can't open file, remove session variables
-                if 'dataset_id' in request.session: del request.session['dataset_id']
-                if 'glosses_new' in request.session: del request.session['glosses_new']
                 # Set a message to be shown so that the user knows what is going on.
                 messages.add_message(request, messages.ERROR, _('Cannot open the file:' + str(e)))
                 return render(request, 'dictionary/import_gloss_csv.html', {'import_csv_form': CSVUploadForm()}, )
@@ -70,25 +110,32 @@ def import_gloss_csv(request):
                 messages.add_message(request, messages.ERROR, _('File must be UTF-8 encoded!'))
                 return render(request, 'dictionary/import_gloss_csv.html', {'import_csv_form': CSVUploadForm()}, )
 
+            rows = []
             for row in glossreader:
                 if glossreader.line_num == 1:
                     # Skip first line of CSV file.
                     continue
-                try:
-                    # Find out if the gloss already exists, if it does add to list of glosses not to be added.
-                    gloss = Gloss.objects.get(dataset=dataset, idgloss=row[0])
-                    glosses_exists.append(gloss)
-                except Gloss.DoesNotExist:
-                    # If gloss is not already in list, add glossdata to list of glosses to be added as a tuple.
-                    if not any(row[0] in s for s in glosses_new):
-                        glosses_new.append(tuple(row))
-                except IndexError:
-                    # If row[0] does not exist, continue to next iteration of loop.
+                # Skip rows without an idgloss.
+                if row and row[0]:
+                    rows.append(row)
+
+            # Look up the glosses that already exist in bulk, instead of a query per row.
+            existing = existing_glosses(dataset, {row[0] for row in rows})
+            seen = set()
+            for row in rows:
+                if row[0] in seen:
+                    # Only the first row of an idgloss that appears several times in the file is used.
                     continue
+                seen.add(row[0])
+                if row[0] in existing:
+                    # The gloss already exists, add it to the list of glosses not to be added.
+                    glosses_exists.append(existing[row[0]])
+                else:
+                    # Add glossdata to the list of glosses to be added as a tuple.
+                    glosses_new.append(tuple(row))
 
-            # Store dataset's id and the list of glosses to be added in session.
-            request.session['dataset_id'] = dataset.id
-            request.session['glosses_new'] = glosses_new
+            # Store dataset's id and the list of glosses to be added in an ImportBatch.
+            stage_import_batch(request, ImportBatch.Kind.GLOSS, {'glosses_new': glosses_new}, dataset=dataset)
 
             return render(request, 'dictionary/import_gloss_csv_confirmation.html',
                           {'glosses_new': glosses_new,
@@ -102,7 +149,7 @@ def import_gloss_csv(request):
     else:
         # If request type is not POST, return to the original form.
         csv_form = CSVUploadForm()
-        allowed_datasets = get_objects_for_user(request.user, 'dictionary.view_dataset')
+        allowed_datasets = datasets_for_user(request.user)
         # Make sure we only list datasets the user has permissions to.
         csv_form.fields["dataset"].queryset = csv_form.fields["dataset"].queryset.filter(
             id__in=[x.id for x in allowed_datasets])
@@ -116,38 +163,44 @@ def confirm_import_gloss_csv(request):
     """This view adds the data to database if the user confirms the action"""
     if request.method == 'POST':
         if 'cancel' in request.POST:
-            # If user cancels adding data, flush session variables
-            if 'dataset_id' in request.session: del request.session['dataset_id']
-            if 'glosses_new' in request.session: del request.session['glosses_new']
+            # If user cancels adding data, discard the rows of the import
+            discard_import_batch(request, ImportBatch.Kind.GLOSS)
             # Set a message to be shown so that the user knows what is going on.
             messages.add_message(request, messages.WARNING, _('Cancelled adding CSV data.'))
             return HttpResponseRedirect(reverse('dictionary:import_gloss_csv'))
 
         elif 'confirm' in request.POST:
-            glosses_added = []
-            dataset = None
-            if 'glosses_new' and 'dataset_id' in request.session:
-                dataset = Dataset.objects.get(id=request.session['dataset_id'])
-                for gloss in request.session['glosses_new']:
-
-                    # If the Gloss does not already exist, continue adding.
-                    if not Gloss.objects.filter(dataset=dataset, idgloss=gloss[0]).exists():
-                        try:
-                            new_gloss = Gloss(dataset=dataset, idgloss=gloss[0], idgloss_mi=gloss[1],
-                                          created_by=request.user, updated_by=request.user)
-                        except IndexError:
-                            # If we get IndexError, idgloss_mi was probably not provided
-                            new_gloss = Gloss(dataset=dataset, idgloss=gloss[0],
-                                              created_by=request.user, updated_by=request.user)
-
-                        new_gloss.save()
-                        glosses_added.append((new_gloss.idgloss, new_gloss.idgloss_mi))
-
-                # Flush request.session['glosses_new'] and request.session['dataset']
-                del request.session['glosses_new']
-                del request.session['dataset_id']
-                # Set a message to be shown so that the user knows what is going on.
-                messages.add_message(request, messages.SUCCESS, _('Glosses were added successfully.'))
+            batch = get_import_batch(request, ImportBatch.Kind.GLOSS)
+            if batch is None:
+                # The preview has expired, or the import was already confirmed.
+                messages.add_message(request, messages.ERROR,
+                                     _("The import has expired, please upload the file again."))
+                return HttpResponseRedirect(reverse('dictionary:import_gloss_csv'))
+
+            dataset = batch.dataset
+            glosses = batch.data['glosses_new']
+            # Glosses may have been added to the dataset since the preview.
+            existing = existing_glosses(dataset, {gloss[0] for gloss in glosses})
+            new_glosses = []
+            for gloss in glosses:
+                # If the Gloss does not already exist, continue adding.
+                if gloss[0] not in existing:
+                    # idgloss_mi is optional.
+                    new_glosses.append(Gloss(dataset=dataset, idgloss=gloss[0],
+                                             idgloss_mi=gloss[1] if len(gloss) > 1 else None,
+                                             created_by=request.user, updated_by=request.user))
+
+            with transaction.atomic():
+                created = Gloss.objects.bulk_create(new_glosses, batch_size=BULK_BATCH_SIZE)
+                # bulk_create() doesn't send the signals that maintain the search documents
+                update_gloss_search_documents(gloss.pk for gloss in created)
+                mark_dataset_artifacts_stale([dataset.pk])
+            glosses_added = [(gloss.idgloss, gloss.idgloss_mi) for gloss in created]
+
+            # Discard the rows of the import
+            discard_import_batch(request, ImportBatch.Kind.GLOSS)
+            # Set a message to be shown so that the user knows what is going on.
+            messages.add_message(request, messages.SUCCESS, _('Glosses were added successfully.'))
             return render(request, "dictionary/import_gloss_csv_confirmation.html", {'glosses_added': glosses_added,
                                                                                      'dataset': dataset.name})
         else:
@@ -182,14 +235,13 @@ def import_nzsl_share_gloss_csv(request):
     """
     Import a file containing glosses from NZSL Share.
     """
-    # Make sure that the session variables are flushed before using this view.
-    request.session.pop("dataset_id", None)
-    request.session.pop("glosses_new", None)
+    # Make sure that the rows of an earlier import are discarded before using this view.
+    discard_import_batch(request, ImportBatch.Kind.NZSL_SHARE)
 
     if not request.method == "POST":
         # If request type is not POST, return to the original form.
         csv_form = CSVUploadForm()
-        allowed_datasets = get_objects_for_user(request.user, "dictionary.view_dataset")
+        allowed_datasets = datasets_for_user(request.user)
         # Make sure we only list datasets the user has permissions to.
         csv_form.fields["dataset"].queryset = csv_form.fields["dataset"].queryset.filter(
             id__in=[x.id for x in allowed_datasets])
@@ -208,7 +260,7 @@ def import_nzsl_share_gloss_csv(request):
 
     new_glosses = []
     dataset = form.cleaned_data["dataset"]
-    if "view_dataset" not in get_perms(request.user, dataset):
+    if not has_dataset_perm(request.user, dataset):
         # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
         msg = _("You do not have permissions to import glosses to this lexicon.")
         messages.error(request, msg)
@@ -222,37 +274,25 @@ def import_nzsl_share_gloss_csv(request):
         )
 
         skipped_existing_glosses = []
-        existing_nzsl_share_ids = set(
-            Gloss.objects.exclude(nzsl_share_id__exact="").values_list(
-                "nzsl_share_id", flat=True
-            )
-        )
-
-        for row in glossreader:
-            if glossreader.line_num == 1:
-                continue
-            if row["id"] in existing_nzsl_share_ids:
+        rows = [row for row in glossreader if glossreader.line_num != 1]
+        # Look up the glosses that already have the share ids in bulk, instead of a query per row.
+        existing_glosses_by_share_id = glosses_by_share_id(row["id"] for row in rows)
 
+        for row in rows:
+            existing = existing_glosses_by_share_id.get(row["id"])
+            if not existing:
+                new_glosses.append(row)
+            elif len(existing) > 1:
                 # nzsl_share_id is not a reliable index, due to manual intervention
-                try:
-                    gloss = Gloss.objects.filter(nzsl_share_id=row["id"]).get()
-                except (Gloss.DoesNotExist, Gloss.MultipleObjectsReturned) as e:
-                    print(f"nzsl_share_id = {row['id']} {str(e)}")
-                    skipped_existing_glosses.append(row)
-                    continue
-
+                print(f"nzsl_share_id = {row['id']} matches {len(existing)} glosses")
+                skipped_existing_glosses.append(row)
+            elif existing[0].has_videos:
                 # if gloss has video/s we skip it, otherwise we add it anyway
-                if gloss.glossvideo_set.all().exists():
-                    skipped_existing_glosses.append(row)
-                else:
-                    new_glosses.append(row)
+                skipped_existing_glosses.append(row)
             else:
                 new_glosses.append(row)
 
     except csv.Error as e:
-        # Can't open file, remove session variables
-        request.session.pop("dataset_id", None)
-        request.session.pop("glosses_new", None)
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.ERROR, _("Cannot open the file:" + str(e)))
         return render(request, "dictionary/import_nzsl_share_gloss_csv.html",
@@ -263,9 +303,8 @@ def import_nzsl_share_gloss_csv(request):
         return render(request, "dictionary/import_nzsl_share_gloss_csv.html",
                       {"import_csv_form": CSVUploadForm()}, )
 
-    # Store dataset's id and the list of glosses to be added in session.
-    request.session["dataset_id"] = dataset.id
-    request.session["glosses_new"] = new_glosses
+    # Store dataset's id and the list of glosses to be added in an ImportBatch.
+    stage_import_batch(request, ImportBatch.Kind.NZSL_SHARE, {"glosses_new": new_glosses}, dataset=dataset)
 
     return render(request, "dictionary/import_nzsl_share_gloss_csv_confirmation.html",
                   {
@@ -275,324 +314,82 @@ def import_nzsl_share_gloss_csv(request):
                   })
 
 
-def update_retrieval_videos(videos, gloss_data):
-    """ prep videos, illustrations and usage example for video retrieval """
-
-    gloss_pk = gloss_data["gloss"].pk
-    gloss_word = gloss_data["word"]
-
-    if gloss_data.get("videos", None):
-        video_url = gloss_data["videos"]
-        extension = video_url[-3:]
-        file_name = (
-            f"{gloss_pk}-{gloss_word}.{gloss_pk}_video.{extension}"
-        )
-
-        glossvideo = {
-            "url": video_url,
-            "file_name": file_name,
-            "gloss_pk": gloss_pk,
-            "video_type": "main",
-            "version": 0
-        }
-        videos.append(glossvideo)
-
-    if gloss_data.get("illustrations", None):
-        for i, video_url in enumerate(gloss_data["illustrations"].split("|")):
-            extension = video_url[-3:]
-            file_name = (
-                f"{gloss_pk}-{gloss_word}.{gloss_pk}_illustration_{i + 1}.{extension}"
-            )
-
-            glossvideo = {
-                "url": video_url,
-                "file_name": file_name,
-                "gloss_pk": gloss_pk,
-                "video_type": "main",
-                "version": i
-            }
-            videos.append(glossvideo)
-
-    if gloss_data.get("usage_examples", None):
-        for i, video_url in enumerate(gloss_data["usage_examples"].split("|")):
-            extension = video_url[-3:]
-            file_name = (
-                f"{gloss_pk}-{gloss_word}.{gloss_pk}_usageexample_{i + 1}.{extension}"
-            )
-
-            glossvideo = {
-                "url": video_url,
-                "file_name": file_name,
-                "gloss_pk": gloss_pk,
-                "video_type": f"finalexample{i + 1}",
-                "version": i
-            }
-            videos.append(glossvideo)
-
 @login_required
 @permission_required("dictionary.import_csv")
-@transaction.atomic()
 def confirm_import_nzsl_share_gloss_csv(request):
-    """This view adds the data to database if the user confirms the action"""
+    """This view queues the data to be added to the database if the user confirms the action"""
     if not request.method == "POST":
         # If request method is not POST, redirect to the import form
         return HttpResponseRedirect(reverse("dictionary:import_nzsl_share_gloss_csv"))
 
     if "cancel" in request.POST:
-        # If user cancels adding data, flush session variables
-        request.session.pop("dataset_id", None)
-        request.session.pop("glosses_new", None)
+        # If user cancels adding data, discard the rows of the import
+        discard_import_batch(request, ImportBatch.Kind.NZSL_SHARE)
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.WARNING, _("Cancelled adding CSV data."))
         return HttpResponseRedirect(reverse("dictionary:import_nzsl_share_gloss_csv"))
     elif not "confirm" in request.POST:
         return HttpResponseRedirect(reverse("dictionary:import_nzsl_share_gloss_csv"))
 
-    glosses_added = []
-    dataset = None
-    translations = []
-    comments = []
-    videos = []
-    new_glosses = {}
-    bulk_create_gloss = []
-    bulk_update_glosses = []
-    bulk_semantic_fields = []
-    bulk_tagged_items = []
-    contributors = []
-    bulk_share_validation_aggregations = []
-    video_import_only_glosses_data = []
-
-    if "glosses_new" and "dataset_id" in request.session:
-        dataset = Dataset.objects.get(id=request.session["dataset_id"])
-        language_en = Language.objects.get(name="English")
-        language_mi = Language.objects.get(name="Māori")
-        gloss_content_type = ContentType.objects.get_for_model(Gloss)
-        site = Site.objects.get_current()
-        comment_submit_date = datetime.datetime.now(tz=get_current_timezone())
-        semantic_fields = FieldChoice.objects.filter(
-            field="semantic_field"
-        ).values_list("english_name", "pk")
-        semantic_fields_dict = {field[0]: field[1] for field in semantic_fields}
-        signers = FieldChoice.objects.filter(field="signer")
-        signer_dict = {signer.english_name: signer for signer in signers}
-        existing_machine_values = [
-            mv for mv in FieldChoice.objects.all().values_list("machine_value", flat=True)
-        ]
-        not_public_tag = Tag.objects.get(name="not public")
-        nzsl_share_tag = Tag.objects.get(name="nzsl-share")
-        import_user = User.objects.get(
-            username="nzsl_share_importer",
-            first_name="Importer",
-            last_name="NZSL Share",
-        )
-
-        for row_num, gloss_data in enumerate(request.session["glosses_new"]):
-            # will iterate over these glosses again after bulk creating
-            # and to ensure we get the correct gloss_data for words that appear multiple
-            # times we'll use the row_num as the identifier for the gloss data
-
-            # if the gloss already exists at this point, it can only mean that
-            # it has no videos and we want to import videos for it
-            # try-except saves us a db call
-            try:
-                gloss = Gloss.objects.filter(nzsl_share_id=gloss_data["id"]).get()
-                gloss_data_copy = gloss_data.copy()
-                gloss_data_copy["gloss"] = gloss
-                video_import_only_glosses_data.append(gloss_data_copy)
-                continue
-            except Gloss.DoesNotExist:
-                pass
-
-            new_glosses[str(row_num)] = gloss_data
-            bulk_create_gloss.append(Gloss(
-                dataset=dataset,
-                nzsl_share_id=gloss_data["id"],
-                # need to make idgloss unique in dataset,
-                # but gloss word can appear in multiple rows, so
-                # idgloss will be updated to word:pk in second step
-                idgloss=f"{gloss_data['word']}_row{row_num}",
-                idgloss_mi=gloss_data.get("maori", None),
-                created_by=import_user,
-                updated_by=import_user,
-                exclude_from_ecv=True,
-            ))
-            contributors.append(gloss_data["contributor_username"])
-
-        bulk_created = Gloss.objects.bulk_create(bulk_create_gloss)
-
-        # Create new signers for contributors that do not exist as signers yet
-        contributors = set(contributors)
-        create_signers = []
-        signers = signer_dict.keys()
-        for contributor in contributors:
-            if contributor not in signers:
-                new_machine_value = random.randint(0, 99999999)
-                while new_machine_value in existing_machine_values:
-                    new_machine_value = random.randint(0, 99999999)
-                existing_machine_values.append(new_machine_value)
-                create_signers.append(FieldChoice(
-                    field="signer",
-                    english_name=contributor,
-                    machine_value=new_machine_value
-                ))
-        new_signers = FieldChoice.objects.bulk_create(create_signers)
-        for signer in new_signers:
-            signer_dict[signer.english_name] = signer
-
-        for gloss in bulk_created:
-            word_en, row_num = gloss.idgloss.split("_row")
-            gloss_data = new_glosses[row_num]
-            gloss_data["gloss"] = gloss
-
-            # get semantic fields for gloss_data topics
-            if gloss_data.get("topic_names", None):
-                gloss_topics = gloss_data["topic_names"].split("|")
-                # ignore all signs and All signs
-                cleaned_gloss_topics = [
-                    x for x in gloss_topics if x not in ["all signs", "All signs"]
-                ]
-                add_miscellaneous = False
-
-                for topic in cleaned_gloss_topics:
-                    if topic in semantic_fields_dict.keys():
-                        bulk_semantic_fields.append(
-                            Gloss.semantic_field.through(
-                                gloss_id=gloss.id,
-                                fieldchoice_id=semantic_fields_dict[topic]
-                            )
-                        )
-                    else:
-                        # add the miscellaneous semantic field if a topic does not exist
-                        add_miscellaneous = True
-
-                if add_miscellaneous:
-                    bulk_semantic_fields.append(
-                        Gloss.semantic_field.through(
-                            gloss_id=gloss.id,
-                            fieldchoice_id=semantic_fields_dict["Miscellaneous"]
-                        )
-                    )
-
-            # create GlossTranslations for english and maori words
-            translations.append(GlossTranslations(
-                gloss=gloss,
-                language=language_en,
-                translations=gloss_data["word"],
-                translations_secondary=gloss_data.get("secondary", None)
-            ))
-            if gloss_data.get("maori", None):
-                # There is potentially several comma separated maori words
-                maori_words = gloss_data["maori"].split(", ")
-
-                # Update idgloss_mi using first maori word, then create translation
-                gloss.idgloss_mi = f"{maori_words[0]}:{gloss.pk}"
-
-                translation = GlossTranslations(
-                    gloss=gloss,
-                    language=language_mi,
-                    translations=maori_words[0]
-                )
-                if len(maori_words) > 1:
-                    translation.translations_secondary = ", ".join(maori_words[1:])
-
-                translations.append(translation)
-
-            # Prepare new idgloss and signer fields for bulk update
-            gloss.idgloss = f"{word_en}:{gloss.pk}"
-            gloss.signer = signer_dict[gloss_data["contributor_username"]]
-            bulk_update_glosses.append(gloss)
-
-            # Create comment for gloss_data notes
-            comments.append(Comment(
-                content_type=gloss_content_type,
-                object_pk=gloss.pk,
-                user_name=gloss_data.get("contributor_username", ""),
-                comment=gloss_data.get("notes", ""),
-                site=site,
-                is_public=False,
-                submit_date=comment_submit_date
-            ))
-            if gloss_data.get("sign_comments", None):
-                # create Comments for all gloss_data sign_comments
-                for comment in gloss_data["sign_comments"].split("|"):
-                    try:
-                        comment_content = comment.split(":")
-                        user_name = comment_content[0]
-                        comment_content = comment_content[1]
-                    except IndexError:
-                        comment_content = comment
-                        user_name = "Unknown"
-                    comments.append(Comment(
-                        content_type=gloss_content_type,
-                        object_pk=gloss.pk,
-                        user_name=user_name,
-                        comment=comment_content,
-                        site=site,
-                        is_public=False,
-                        submit_date=comment_submit_date
-                    ))
-
-            # Add ShareValidationAggregation
-            bulk_share_validation_aggregations.append(ShareValidationAggregation(
-                gloss=gloss,
-                agrees=int(gloss_data["agrees"]),
-                disagrees=int(gloss_data["disagrees"])
-            ))
-
-            # prep videos, illustrations and usage example for video retrieval
-            update_retrieval_videos(videos, gloss_data)
+    batch = get_import_batch(request, ImportBatch.Kind.NZSL_SHARE)
+    if batch is None:
+        messages.add_message(request, messages.ERROR,
+                             _("The import has expired, please upload the file again."))
+        return HttpResponseRedirect(reverse("dictionary:import_nzsl_share_gloss_csv"))
 
-            glosses_added.append(gloss)
+    queue_nzsl_share_import(batch)
+    # The batch now belongs to the queued import, rather than to the preview.
+    request.session.pop(import_batch_session_key(ImportBatch.Kind.NZSL_SHARE), None)
+    messages.add_message(request, messages.SUCCESS, _("The glosses are being added in the background."))
+    return HttpResponseRedirect(reverse("dictionary:nzsl_share_import_progress", kwargs={"batch_id": batch.pk}))
 
-            bulk_tagged_items.append(TaggedItem(
-                content_type=gloss_content_type,
-                object_id=gloss.pk,
-                tag=nzsl_share_tag
 
-            ))
-            bulk_tagged_items.append(TaggedItem(
-                content_type=gloss_content_type,
-                object_id=gloss.pk,
-                tag=not_public_tag
-
-            ))
+def import_batch_status_data(batch):
+    return {
+        "id": batch.pk,
+        "status": batch.status,
+        "progress": batch.progress,
+        "rows_done": batch.rows_done,
+        "rows_total": batch.rows_total,
+        "error": batch.error,
+        "status_url": reverse("dictionary:nzsl_share_import_status", kwargs={"batch_id": batch.pk}),
+    }
 
-        # Bulk create entities related to the gloss, and bulk update the glosses' idgloss
-        Comment.objects.bulk_create(comments)
-        GlossTranslations.objects.bulk_create(translations)
-        Gloss.objects.bulk_update(bulk_update_glosses, ["idgloss", "idgloss_mi", "signer"])
-        Gloss.semantic_field.through.objects.bulk_create(bulk_semantic_fields)
-        TaggedItem.objects.bulk_create(bulk_tagged_items)
-        ShareValidationAggregation.objects.bulk_create(bulk_share_validation_aggregations)
-
-        # Add the video-update only glosses
-        for video_import_gloss_data in video_import_only_glosses_data:
-            # prep videos, illustrations and usage example for video retrieval
-            update_retrieval_videos(videos, video_import_gloss_data)
-            glosses_added.append(video_import_gloss_data["gloss"])
-
-        # start Thread to process gloss video retrieval in the background
-        t = threading.Thread(
-            target=retrieve_videos_for_glosses,
-            args=[videos],
-            daemon=True
-        )
-        t.start()
 
-        del request.session["glosses_new"]
-        del request.session["dataset_id"]
+@login_required
+@permission_required("dictionary.import_csv")
+def nzsl_share_import_progress(request, batch_id):
+    """
+    Show the progress of a queued NZSL Share import, and the glosses added so far.
+    A failed import is resumed when the form of the page is posted.
+    """
+    batch = get_object_or_404(ImportBatch, pk=batch_id, kind=ImportBatch.Kind.NZSL_SHARE,
+                              created_by=request.user, status__in=[
+                                  ImportBatch.Status.QUEUED, ImportBatch.Status.RUNNING,
+                                  ImportBatch.Status.DONE, ImportBatch.Status.FAILED])
+    if request.method == "POST" and "resume" in request.POST and batch.status == ImportBatch.Status.FAILED:
+        resume_nzsl_share_import(batch)
+        return HttpResponseRedirect(reverse("dictionary:nzsl_share_import_progress", kwargs={"batch_id": batch.pk}))
 
-        # Set a message to be shown so that the user knows what is going on.
-        messages.add_message(request, messages.SUCCESS, _("Glosses were added successfully."))
     return render(
         request, "dictionary/import_nzsl_share_gloss_csv_confirmation.html",
         {
-            "glosses_added": glosses_added,
-            "dataset": dataset.name
+            "batch": batch,
+            "batch_status": import_batch_status_data(batch),
+            "glosses_added": imported_glosses(batch),
+            "dataset": batch.dataset.name
         }
     )
 
 
+@login_required
+@permission_required("dictionary.import_csv")
+def nzsl_share_import_status(request, batch_id):
+    """Returns the status and progress of a queued NZSL Share import as JSON."""
+    batch = get_object_or_404(ImportBatch, pk=batch_id, kind=ImportBatch.Kind.NZSL_SHARE,
+                              created_by=request.user)
+    return JsonResponse(import_batch_status_data(batch))
+
 
 @login_required
 @permission_required("dictionary.import_csv")
@@ -600,10 +397,8 @@ def import_qualtrics_csv(request):
     """
     Import ValidationRecords from a CSV export from Qualtrics
     """
-    # Make sure that the session variables are flushed before using this view.
-    request.session.pop("validation_records", None)
-    request.session.pop("question_numbers", None)
-    request.session.pop("question_gloss_map", None)
+    # Make sure that the rows of an earlier import are discarded before using this view.
+    discard_import_batch(request, ImportBatch.Kind.QUALTRICS)
 
     if not request.method == "POST":
         # If request type is not POST, return to the original form.
@@ -664,10 +459,6 @@ def import_qualtrics_csv(request):
                 validation_records.append(row)
 
     except csv.Error as e:
-        # Can't open file, remove session variables
-        request.session.pop("validation_records", None)
-        request.session.pop("question_numbers", None)
-        request.session.pop("question_gloss_map", None)
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.ERROR, _("Cannot open the file:" + str(e)))
         return render(request, "dictionary/import_qualtrics_csv.html",
@@ -678,10 +469,12 @@ def import_qualtrics_csv(request):
         return render(request, "dictionary/import_qualtrics_csv.html",
                       {"import_csv_form": CSVFileOnlyUpload()}, )
 
-    # Store dataset's id and the list of glosses to be added in session.
-    request.session["validation_records"] = validation_records
-    request.session["question_numbers"] = question_numbers
-    request.session["question_glossvideo_map"] = question_to_glossvideo_map
+    # Store the validation records and questions in an ImportBatch.
+    stage_import_batch(request, ImportBatch.Kind.QUALTRICS, {
+        "validation_records": validation_records,
+        "question_numbers": question_numbers,
+        "question_glossvideo_map": question_to_glossvideo_map,
+    })
 
     return render(request, "dictionary/import_qualtrics_csv_confirmation.html",
                   {"validation_records": validation_records, "skipped_rows": skipped_rows})
@@ -697,10 +490,8 @@ def confirm_import_qualtrics_csv(request):
         return HttpResponseRedirect(reverse("dictionary:import_qualtrics_csv"))
 
     if "cancel" in request.POST:
-        # If user cancels adding data, flush session variables
-        request.session.pop("validation_records", None)
-        request.session.pop("question_numbers", None)
-        request.session.pop("question_glossvideo_map", None)
+        # If user cancels adding data, discard the rows of the import
+        discard_import_batch(request, ImportBatch.Kind.QUALTRICS)
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.WARNING, _("Cancelled adding CSV data."))
         return HttpResponseRedirect(reverse("dictionary:import_qualtrics_csv"))
@@ -714,17 +505,18 @@ def confirm_import_qualtrics_csv(request):
     bulk_tagged_items = []
     gloss_pks = set()
 
-    if "validation_records" and "question_numbers" and "question_glossvideo_map" in request.session:
+    batch = get_import_batch(request, ImportBatch.Kind.QUALTRICS)
+    if batch is not None:
         # Retrieve glosses
-        glossvideo_pk_list = request.session["question_glossvideo_map"].values()
+        glossvideo_pk_list = batch.data["question_glossvideo_map"].values()
         glossvideo_dict = GlossVideo.objects.select_related("gloss").in_bulk(glossvideo_pk_list)
         gloss_content_type = ContentType.objects.get_for_model(Gloss)
         check_result_tag = Tag.objects.get(name=settings.TAG_VALIDATION_CHECK_RESULTS)
         ready_for_validation_tag = Tag.objects.get(name=settings.TAG_READY_FOR_VALIDATION)
 
-        questions_numbers = request.session["question_numbers"]
-        question_glossvideo_map = request.session["question_glossvideo_map"]
-        validation_records = request.session["validation_records"]
+        questions_numbers = batch.data["question_numbers"]
+        question_glossvideo_map = batch.data["question_glossvideo_map"]
+        validation_records = batch.data["validation_records"]
 
         # Go through csv data
         for record in validation_records:
@@ -771,9 +563,7 @@ def confirm_import_qualtrics_csv(request):
             tag=ready_for_validation_tag
         ).delete()
 
-        del request.session["validation_records"]
-        del request.session["question_numbers"]
-        del request.session["question_glossvideo_map"]
+        discard_import_batch(request, ImportBatch.Kind.QUALTRICS)
 
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.SUCCESS,
@@ -808,9 +598,8 @@ def import_manual_validation(request):
     """
     Import ManualValidationAggregations from a CSV file
     """
-    # Make sure that the session variables are flushed before using this view.
-    request.session.pop("group_row_map", None)
-    request.session.pop("glosses", None)
+    # Make sure that the rows of an earlier import are discarded before using this view.
+    discard_import_batch(request, ImportBatch.Kind.MANUAL_VALIDATION)
 
     if request.method != "POST":
         # If request type is not POST, return to the original form.
@@ -847,8 +636,6 @@ def import_manual_validation(request):
         )
         missing_headers = set(required_headers) - set(validation_record_reader.fieldnames)
         if missing_headers != set():
-            request.session.pop("group_row_map", None)
-            request.session.pop("glosses", None)
             # Set a message to be shown so that the user knows what is going on.
             messages.add_message(request, messages.ERROR,
                                  _(f"CSV is missing required columns: {missing_headers}"))
@@ -865,17 +652,12 @@ def import_manual_validation(request):
             glosses.append(row["idgloss"].split(":")[1])
 
     except ValidationError as e:
-        request.session.pop("group_row_map", None)
-        request.session.pop("glosses", None)
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.ERROR, _("File contains non-compliant data:" + str(e)))
         return render(request, "dictionary/import_manual_validation_csv.html",
                       {"import_csv_form": CSVFileOnlyUpload()}, )
 
     except csv.Error as e:
-        # Can't open file, remove session variables
-        request.session.pop("group_row_map", None)
-        request.session.pop("glosses", None)
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.ERROR, _("Cannot open the file:" + str(e)))
         return render(request, "dictionary/import_manual_validation_csv.html",
@@ -886,9 +668,11 @@ def import_manual_validation(request):
         return render(request, "dictionary/import_manual_validation_csv.html",
                       {"import_csv_form": CSVFileOnlyUpload()}, )
 
-    # Store dataset's id and the list of glosses to be added in session.
-    request.session["group_row_map"] = group_row_map
-    request.session["glosses"] = list(set(glosses))
+    # Store the rows by group and the glosses they are for in an ImportBatch.
+    stage_import_batch(request, ImportBatch.Kind.MANUAL_VALIDATION, {
+        "group_row_map": group_row_map,
+        "glosses": list(set(glosses)),
+    })
 
     return render(
         request, "dictionary/import_manual_validation_csv_confirmation.html",
@@ -910,9 +694,8 @@ def confirm_import_manual_validation(request):
         return HttpResponseRedirect(reverse("dictionary:import_manual_validation_csv"))
 
     if "cancel" in request.POST:
-        # If user cancels adding data, flush session variables
-        request.session.pop("group_row_map", None)
-        request.session.pop("glosses", None)
+        # If user cancels adding data, discard the rows of the import
+        discard_import_batch(request, ImportBatch.Kind.MANUAL_VALIDATION)
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.WARNING, _("Cancelled adding CSV data."))
         return HttpResponseRedirect(reverse("dictionary:import_manual_validation_csv"))
@@ -923,11 +706,12 @@ def confirm_import_manual_validation(request):
     manual_validation_aggregations = []
     missing_glosses = []
 
-    if "group_row_map" and "glosses" in request.session:
-        gloss_pk_list = request.session["glosses"]
+    batch = get_import_batch(request, ImportBatch.Kind.MANUAL_VALIDATION)
+    if batch is not None:
+        gloss_pk_list = batch.data["glosses"]
         gloss_dict = Gloss.objects.in_bulk(gloss_pk_list)
 
-        gloss_row_map = request.session["group_row_map"]
+        gloss_row_map = batch.data["group_row_map"]
 
         # Go through csv data
         for group, rows in gloss_row_map.items():
@@ -951,8 +735,7 @@ def confirm_import_manual_validation(request):
 
         ManualValidationAggregation.objects.bulk_create(manual_validation_aggregations)
 
-        del request.session["group_row_map"]
-        del request.session["glosses"]
+        discard_import_batch(request, ImportBatch.Kind.MANUAL_VALIDATION)
 
         # Set a message to be shown so that the user knows what is going on.
         messages.add_message(request, messages.SUCCESS,
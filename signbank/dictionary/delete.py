@@ -5,16 +5,16 @@ from django.contrib import messages
 from django.utils.translation import gettext as _
 from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed
 
-from guardian.shortcuts import get_perms
 
 from .models import GlossURL
+from .permissions import has_dataset_perm
 
 
 @permission_required('dictionary.delete_glossurl')
 def glossurl(request, glossurl):
     if request.method == 'POST':
         glossurl = get_object_or_404(GlossURL, id=glossurl)
-        if 'view_dataset' not in get_perms(request.user, glossurl.gloss.dataset):
+        if not has_dataset_perm(request.user, glossurl.gloss.dataset):
             # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
             msg = _("You do not have permissions to add tags to glosses of this lexicon.")
             messages.error(request, msg)
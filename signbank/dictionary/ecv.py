@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+ELAN External Controlled Vocabulary (ECV) of the glosses of a dataset.
+
+The XML is written one gloss at a time while the glosses are read from a server-side cursor,
+so that it can be streamed and memory use does not depend on the size of the dataset.
+"""
+from __future__ import unicode_literals
+
+from xml.sax.saxutils import escape, quoteattr
+
+from django.utils import dateformat, timezone
+
+#: The languages of the vocabulary, as (LANG_ID, LANG_DEF, LANG_LABEL, Gloss field of the value).
+ECV_LANGUAGES = (
+    ("eng", "http://cdb.iso.org/lg/CDB-00138502-001", "English (eng)", "idgloss"),
+    ("mri", "http://cdb.iso.org/lg/CDB-00138567-001", "Maori (mri)", "idgloss_mi"),
+)
+# number of glosses fetched per round trip by the server-side cursor
+CHUNK_SIZE = 2000
+
+
+def ecv_lines(dataset, queryset):
+    """Yield the lines of the ECV document of `dataset`, with an entry for each gloss in `queryset`."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<CV_RESOURCE AUTHOR="" DATE=%s VERSION="0.2"\n' % quoteattr(dateformat.format(timezone.localtime(), "c"))
+    yield '    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ' \
+          'xsi:noNamespaceSchemaLocation="http://www.mpi.nl/tools/elan/EAFv2.8.xsd">\n'
+    for lang_id, lang_def, lang_label, _field in ECV_LANGUAGES:
+        yield '    <LANGUAGE LANG_DEF=%s LANG_ID=%s LANG_LABEL=%s/>\n' % (
+            quoteattr(lang_def), quoteattr(lang_id), quoteattr(lang_label))
+    yield '    <CONTROLLED_VOCABULARY CV_ID="signbank-dataset-%d">\n' % dataset.pk
+    for lang_id, _def, _label, _field in ECV_LANGUAGES:
+        yield '        <DESCRIPTION LANG_REF=%s/>\n' % quoteattr(lang_id)
+
+    fields = [field for _id, _def, _label, field in ECV_LANGUAGES]
+    # Only the columns that are written are selected, see StandardCSVExport.filter_queryset().
+    glosses = queryset.prefetch_related(None).values_list("pk", *fields)
+    for pk, *values in glosses.iterator(chunk_size=CHUNK_SIZE):
+        entry = ['        <CV_ENTRY_ML CVE_ID="glossid%d">\n' % pk]
+        for (lang_id, _def, _label, _field), value in zip(ECV_LANGUAGES, values):
+            entry.append('            <CVE_VALUE DESCRIPTION="" LANG_REF=%s>%s</CVE_VALUE>\n' % (
+                quoteattr(lang_id), escape(value or "")))
+        entry.append('        </CV_ENTRY_ML>\n')
+        yield "".join(entry)
+
+    yield '    </CONTROLLED_VOCABULARY>\n'
+    yield '</CV_RESOURCE>\n'
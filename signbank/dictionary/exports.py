@@ -0,0 +1,753 @@
+# -*- coding: utf-8 -*-
+"""
+CSV exports of the advanced gloss search. These are used both to answer the export
+formats of the search page directly, and by a task that the runworker command runs to write
+ExportJob files in the background.
+"""
+from __future__ import unicode_literals
+
+import csv
+import datetime
+import tempfile
+from collections import defaultdict
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.aggregates import ArrayAgg, StringAgg
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Case, Count, OuterRef, Prefetch, Q, Sum, Value, When
+from django.db.models.fields import CharField
+from django.db.models.functions import Concat
+from django.http import QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from django_comments.models import Comment
+
+from signbank.tagging.utils import exclude_queryset_with_any_tags, filter_queryset_with_all_tags
+
+from ..video.models import GlossVideo, GlossVideoToken
+from .models import (
+    ExportJob,
+    Gloss,
+    GlossTranslations,
+    ManualValidationAggregation,
+    RelationToForeignSign,
+    ShareValidationAggregation,
+    ValidationRecord,
+)
+from .permissions import datasets_for_user
+from .search import annotate_search_rank, apply_subquery_filters, search_glosses
+
+
+class Echo:
+    """
+    An object that implements just the write method of the file-like interface,
+    so that csv.writer returns each formatted line instead of buffering it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def gloss_search_queryset(user, get):
+    """
+    Return the glosses matching the advanced search parameters in `get` (a QueryDict),
+    restricted to the datasets `user` can view.
+    """
+    qs = Gloss.objects.all()
+
+    # Filter in only objects in the datasets the user has permissions to.
+    allowed_datasets = datasets_for_user(user)
+    qs = qs.filter(dataset__in=allowed_datasets)
+
+    # Search for multiple datasets (if provided)
+    vals = get.getlist('dataset', [])
+    if vals != []:
+        qs = qs.filter(dataset__in=vals)
+
+    if 'search' in get and get['search'] != '':
+        val = get['search']
+        # Searches idgloss, idgloss_mi, notes and translation keywords at the same time, through the
+        # glosses' search documents. Looking if any of the fields match.
+        qs = search_glosses(qs, val)
+
+    if 'gloss' in get and get['gloss'] != '':
+        val = get['gloss']
+        # Search for glosses starting with a string, case sensitive
+        query = Q(idgloss__istartswith=val)
+        qs = qs.filter(query)
+
+    if 'idgloss_mi' in get and get['idgloss_mi'] != '':
+        val = get['idgloss_mi']
+        qs = qs.filter(idgloss_mi__istartswith=val)
+    if 'keyword' in get and get['keyword'] != '':
+        if 'trans_lang' in get and get['trans_lang'] != '':
+            val = get['keyword']
+            lang = get['trans_lang']
+            qs = qs.filter(
+                translation__keyword__text__icontains=val, translation__language__in=lang)
+
+    if 'published' in get and get['published'] != '':
+        val = get['published'] == 'on'
+        qs = qs.filter(published=val)
+
+    # If get has both keys hasvideo and hasnovideo, don't use them to query.
+    if not ('hasvideo' in get and 'hasnovideo' in get):
+        if 'hasvideo' in get and get['hasvideo'] != '':
+            val = get['hasvideo'] != 'on'
+            qs = qs.filter(glossvideo__isnull=val)
+
+        if 'hasnovideo' in get and get['hasnovideo'] != '':
+            val = get['hasnovideo'] == 'on'
+            qs = qs.filter(glossvideo__isnull=val)
+
+    # If gloss has multiple GlossVideos
+    if 'multiplevideos' in get and get['multiplevideos'] != '' and get['multiplevideos'] == 'on':
+        # Include glosses that have more than one GlossVideo
+        qs = qs.annotate(videocount=Count('glossvideo')
+                         ).filter(videocount__gt=1)
+
+    # Language and basic property filters
+    vals = get.getlist('dialect', [])
+    if vals != []:
+        qs = qs.filter(dialect__in=vals)
+
+    vals = get.getlist('language', [])
+    if vals != []:
+        # Get languages from dataset
+        qs = qs.filter(dataset__language__in=vals)
+
+    if 'notes' in get and get['notes'] != '':
+        qs = qs.filter(notes__icontains=get['notes'])
+
+    if 'semantic_field' in get and get['semantic_field'] != '':
+        vals = get.getlist('semantic_field')
+        qs = qs.filter(semantic_field__id__in=vals)
+
+    if 'tags' in get and get['tags'] != '':
+        # search is an implicit AND so intersection
+        qs = filter_queryset_with_all_tags(qs, tag_ids=get.getlist('tags'))
+
+    qs = qs.distinct()
+
+    if 'nottags' in get and get['nottags'] != '':
+        # Exclude glosses that have any of the selected tags (OR semantics).
+        qs = exclude_queryset_with_any_tags(qs, tag_ids=get.getlist('nottags'))
+
+    if 'relation_to_foreign_signs' in get and get['relation_to_foreign_signs'] != '':
+        val = get['relation_to_foreign_signs']
+        gloss_ids = RelationToForeignSign.objects.filter(
+            other_lang=val).values_list('gloss_id', flat=True)
+        qs = qs.filter(id__in=gloss_ids)
+
+    if 'location' in get and get['location'] != '':
+        val = get['location']
+        qs = qs.filter(location=val)
+
+    if 'one_or_two_handed' in get and get['one_or_two_handed'] != '':
+        val = get['one_or_two_handed'] == 'on'
+        qs = qs.filter(one_or_two_hand=val)
+
+    if 'example_search' in get and get['example_search'] != '':
+        """
+            This search is intended to search for gloss IDs in fields videoexample1 to videoexample4. In these
+            fields, gloss IDs are within square brackets (eg: cat[123], 123 is the gloss ID).
+            When we search for a gloss ID (eg: 123), the search should return all the glosses that contain gloss ID
+            123 in one of their videoexample fields.
+            Search parameter is just the gloss id, so we are adding []s before doing the search.
+        """
+
+        val = get['example_search']
+        val = '[' + val + ']'
+
+        query = (Q(videoexample1__icontains=val) | Q(videoexample2__icontains=val) | Q(videoexample3__icontains=val) |
+                 Q(videoexample4__icontains=val))
+        qs = qs.filter(query)
+
+    if 'age_variation' in get and get['age_variation'] != '':
+        val = get['age_variation']
+        qs = qs.filter(age_variation=val)
+
+    if 'handedness' in get and get['handedness'] != '':
+        val = get['handedness']
+        qs = qs.filter(handedness=val)
+
+    if 'strong_handshape' in get and get['strong_handshape'] != '':
+        val = get['strong_handshape']
+        qs = qs.filter(strong_handshape=val)
+
+    if 'word_classes' in get and get['word_classes'] != '':
+        vals = get.getlist('word_classes')
+        qs = qs.filter(wordclasses__id__in=vals)
+
+    if 'number_incorporated' in get and get['number_incorporated'] != '':
+        val = get['number_incorporated'] == 'on'
+        qs = qs.filter(number_incorporated=val)
+
+    if 'locatable' in get and get['locatable'] != '':
+        val = get['locatable'] == 'on'
+        qs = qs.filter(locatable=val)
+
+    if 'directional' in get and get['directional'] != '':
+        val = get['directional'] == 'on'
+        qs = qs.filter(directional=val)
+
+    if 'fingerspelling' in get and get['fingerspelling'] != '':
+        val = get['fingerspelling'] == 'on'
+        qs = qs.filter(fingerspelling=val)
+
+    if 'inflection_temporal' in get and get['inflection_temporal'] != '':
+        val = get['inflection_temporal'] == 'on'
+        qs = qs.filter(inflection_temporal=val)
+
+    if 'inflection_manner_degree' in get and get['inflection_manner_degree'] != '':
+        val = get['inflection_manner_degree'] == 'on'
+        qs = qs.filter(inflection_manner_degree=val)
+
+    if 'inflection_plural' in get and get['inflection_plural'] != '':
+        val = get['inflection_plural'] == 'on'
+        qs = qs.filter(inflection_plural=val)
+
+    # Relation and morphology filters, as EXISTS subqueries.
+    qs = apply_subquery_filters(qs, get)
+
+    # Filter by usage
+    if 'usage' in get and get['usage'] != '':
+        vals = get.getlist('usage')
+        qs = qs.filter(usage__id__in=vals)
+
+    # Set order according to GET field 'order'. 'rank' orders the best matches of the search first.
+    if get.get('order') == 'rank':
+        if 'search' in get and get['search'] != '':
+            qs = annotate_search_rank(qs, get['search']).order_by('-search_rank', 'idgloss')
+        else:
+            qs = qs.order_by('idgloss')
+    elif 'order' in get:
+        qs = qs.order_by(get['order'])
+    else:
+        qs = qs.order_by('idgloss')
+
+    return qs
+
+
+class GlossCSVExport:
+    """
+    Base class for the CSV exports of a gloss search.
+    Subclasses define the filename, the column headers and how the rows of each chunk of records are
+    produced, or how all of the rows are produced.
+    """
+    filename = None
+    headers = []
+
+    # string delimeter for aggregated multi-value fields
+    CSV_AGG_DELIM = "; "
+    # number of rows fetched per round trip by the server-side cursor
+    CHUNK_SIZE = 2000
+
+    def __init__(self, queryset, base_url=""):
+        self.queryset = self.filter_queryset(queryset)
+        #: Absolute URL of the site, used for the links written into the export.
+        self.base_url = base_url
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def count(self):
+        """Number of rows (excluding the headers) the export will contain."""
+        return self.queryset.count()
+
+    def rows(self):
+        # iterator() uses a server-side cursor, so memory use stays flat regardless of the dataset size.
+        records = []
+        for record in self.queryset.iterator(chunk_size=self.CHUNK_SIZE):
+            records.append(record)
+            if len(records) == self.CHUNK_SIZE:
+                yield from self.rows_for_records(records)
+                records = []
+        if records:
+            yield from self.rows_for_records(records)
+
+    def rows_for_records(self, records):
+        """Yield the rows of a chunk of up to CHUNK_SIZE records of the queryset."""
+        raise NotImplementedError
+
+    def lines(self):
+        """Yield the formatted CSV lines of the export, starting with the column headers."""
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.headers)
+        for row in self.rows():
+            yield writer.writerow(row)
+
+
+class StandardCSVExport(GlossCSVExport):
+    filename = "dictionary-export.csv"
+
+    #
+    # NOTE to future devs.
+    # The reason the code below is prefixed 'subquery' is that, for speed, we use Django
+    # annotated subqueries here to push as much of the work onto Postgres as we can.
+    #
+    # The old code was prefixed 'pythonic', because it worked by analysing the returned results
+    # in python code, using nested loops.
+    # This was slow, even after optimisation, and on a fast system a full query took over 20 seconds
+    # to complete. At writing our Heroku timeout limit is 30 seconds, and the client did in fact get
+    # timeouts sometimes, which made us develop this Postgres low-level version.
+    #
+    # The old 'pythonic' code may be found at this commit:
+    # https://github.com/ODNZSL/NZSL-signbank/commit/3ec77f1694350801ce29a21e8e6cfd61cc21523e
+    #
+    # Some fields were too hard to retrieve via subquery, eg. 'keywords', a deprecated field, which was
+    # an amalgamation of all translations. If devs strike a situation in future where they need to
+    # retrieve an especially complex field, this will probably have to be implemented 'pythonically'.
+    # It is presumed that the speedup provided by the Postgres subquery approach will sufficiently
+    # offset any slowdown that results.
+    #
+    # The correlated subqueries have since been replaced by grouped queries over chunks of glosses,
+    # which are combined into rows in Python. Run the benchmark_gloss_export command to compare
+    # the two on a synthetic dataset.
+    #
+
+    # Field in Signbank -> Field in NZSL Dictionary
+    # These are in the order that Micky Vale specified NZSL want them in.
+    # Please keep any redundant entries (eg. 'id' -> 'id'), as a reminder of that field ordering.
+    # ForeignKey fields on the left need to use double-underscore filter syntax -
+    #  eg. strong_handshape__english_name for accessing FieldChoices.
+    # The left fields that end in _aggregate are filled in from related tables, see aggregates_for_glosses().
+    subquery_signbank_field_to_dictionary_field = {
+        'id':                               'id',                           # Signbank ID
+        'dataset__name':                    'dataset',                      # Dataset
+        'variant_no':                       'variant_number',
+        'gloss_main_aggregate':             'gloss_main',                   # Gloss
+        'gloss_secondary_aggregate':        'gloss_secondary',
+        'gloss_minor_aggregate':            'gloss_minor',
+        'gloss_maori_aggregate':            'gloss_maori',                  # Gloss Māori
+        'strong_handshape__english_name':   'handshape',
+        'location__english_name':           'location_name',
+        'one_or_two_hand':                  'one_or_two_handed',
+        'wordclasses_aggregate':            'word_classes',
+        'inflection_manner_degree':         'inflection_manner_and_degree',
+        'inflection_temporal':              'inflection_temporal',
+        'inflection_plural':                'inflection_plural',
+        'directional':                      'is_directional',
+        'locatable':                        'is_locatable',
+        'number_incorporated':              'contains_numbers',
+        'fingerspelling':                   'is_fingerspelling',
+        'videoexample1':                   'videoexample1',
+        'videoexample1_translation':       'videoexample1_translation',
+        'videoexample2':                   'videoexample2',
+        'videoexample2_translation':       'videoexample2_translation',
+        'videoexample3':                   'videoexample3',
+        'videoexample3_translation':       'videoexample3_translation',
+        'videoexample4':                   'videoexample4',
+        'videoexample4_translation':       'videoexample4_translation',
+        'hint':                             'hint',
+        'notes':                            'usage_notes',                  # Notes
+        'age_variation__english_name':      'age_groups',
+        'relationtoforeignsign_aggregate':  'related_to',
+        'usage_aggregate':                  'usage',
+        'semantic_field_aggregate':         'semantic_field',
+
+        # The fields below are not necessary but Micky Vale is happy for them to remain
+        'dataset__signlanguage__name':      'signlanguage',
+        # keywords - in the old system this was an aggregation of all translations.
+        # It proved too difficult to reproduce using annotated subqueries.
+        #'keywords'                         'keywords'
+        'created_at':                       'created_at',
+        'created_by__username':             'created_by',
+        'updated_at':                       'updated_at',
+        'updated_by__username':             'updated_by',
+        }
+
+    headers = subquery_signbank_field_to_dictionary_field.values()
+
+    #: The fields that are read straight from the gloss row and its foreign keys.
+    gloss_fields = [field for field in subquery_signbank_field_to_dictionary_field
+                    if not field.endswith('_aggregate')]
+    #: ManyToMany fields of Gloss to FieldChoice, and the aggregate column of their labels.
+    fieldchoice_aggregates = {
+        'wordclasses': 'wordclasses_aggregate',
+        'usage': 'usage_aggregate',
+        'semantic_field': 'semantic_field_aggregate',
+    }
+
+    def filter_queryset(self, queryset):
+        # The translations, related foreign signs and FieldChoice labels of the _aggregate columns used to be
+        # annotated onto this queryset as five correlated subqueries, plus joins to three ManyToMany tables
+        # that multiplied the rows Postgres had to group. They are now fetched separately with one grouped
+        # query per relation for each chunk of glosses, see aggregates_for_glosses().
+        # prefetch_related() is cleared because .values() and .values_list() ignore it, and iterator()
+        # would otherwise try to apply it to every chunk of dicts.
+        return queryset.prefetch_related(None).values(*self.gloss_fields)
+
+    def rows_for_records(self, records):
+        aggregates = self.aggregates_for_glosses([record['id'] for record in records])
+        for record in records:
+            record.update(aggregates.get(record['id'], {}))
+            arr = []
+            # force ordering
+            for field_name in self.subquery_signbank_field_to_dictionary_field.keys():
+                items_field = record.get(field_name)
+                if items_field is None:
+                    items_field = ''
+                arr.append(str(items_field))
+            yield arr
+
+    def aggregates_for_glosses(self, gloss_ids):
+        """
+        Returns a dict of gloss id -> {aggregate column: value} for the given glosses, built from
+        one query per relation.
+        """
+        aggregates = defaultdict(dict)
+
+        # (gloss, language) is unique, so there is at most one row per gloss for each language.
+        translations = GlossTranslations.objects\
+            .filter(gloss_id__in=gloss_ids, language__language_code_2char__in=['EN', 'MI'])\
+            .order_by()\
+            .values_list('gloss_id', 'language__language_code_2char', 'translations', 'translations_secondary',
+                         'translations_minor')
+        for gloss_id, language_code, main, secondary, minor in translations:
+            if language_code == 'EN':
+                aggregates[gloss_id].update(
+                    gloss_main_aggregate=main,
+                    gloss_secondary_aggregate=secondary,
+                    gloss_minor_aggregate=minor,
+                )
+            else:
+                aggregates[gloss_id]['gloss_maori_aggregate'] = main
+
+        # Only the first related foreign sign (in the model's default ordering) is exported.
+        related_languages = RelationToForeignSign.objects\
+            .filter(gloss_id__in=gloss_ids)\
+            .order_by('gloss_id', 'loan', 'other_lang', 'other_lang_gloss')\
+            .distinct('gloss_id')\
+            .values_list('gloss_id', 'other_lang')
+        for gloss_id, other_lang in related_languages:
+            aggregates[gloss_id]['relationtoforeignsign_aggregate'] = other_lang
+
+        for field_name, aggregate_name in self.fieldchoice_aggregates.items():
+            through_model = Gloss._meta.get_field(field_name).remote_field.through
+            # array_agg(DISTINCT ...) sorts the labels the same way string_agg(DISTINCT ...) used to.
+            labels = through_model.objects\
+                .filter(gloss_id__in=gloss_ids, fieldchoice__english_name__isnull=False)\
+                .values('gloss_id')\
+                .annotate(labels=ArrayAgg('fieldchoice__english_name', distinct=True))\
+                .order_by()\
+                .values_list('gloss_id', 'labels')
+            for gloss_id, gloss_labels in labels:
+                aggregates[gloss_id][aggregate_name] = self.CSV_AGG_DELIM.join(gloss_labels)
+
+        return aggregates
+
+
+class ReadyForValidationCSVExport(GlossCSVExport):
+    filename = "ready-for-validation-export.csv"
+    headers = [
+        "idgloss",
+        "gloss_main",
+        "video_url"
+    ]
+
+    def filter_queryset(self, queryset):
+        # The queryset may or may not already be filtered for the ready for validation tag.
+        # We have to make sure it is filtered by the tag, so we are filtering again
+        ready_for_validation_qs = queryset.filter(
+            tags__name=settings.TAG_READY_FOR_VALIDATION
+        ).distinct()
+
+        # three types of GlossVideos are imported for validation: illustrations, usage examples
+        # and videos.
+        # Only the videos have title Main and validation video-type
+        gloss_video_qs = GlossVideo.objects.select_related("video_type").filter(
+            video_type__isnull=False,
+            video_type__field="video_type",
+            video_type__english_name="validation",
+            videofile__isnull=False,
+        )
+
+        return (
+            ready_for_validation_qs
+            .prefetch_related(
+                "glosstranslations_set",
+                Prefetch(
+                    "glossvideo_set", queryset=gloss_video_qs, to_attr="validation_videos"
+                )
+            )
+            .annotate(
+                gloss_main_aggregate=StringAgg(
+                    GlossTranslations.objects.filter(
+                        gloss=OuterRef("pk"),
+                        language__language_code_2char="EN"
+                    ).values("translations")[:1],
+                    self.CSV_AGG_DELIM,
+                    distinct=True,
+                    output_field=CharField()
+                ),
+            )
+        )
+
+    def rows(self):
+        gloss_records = []
+        videos = []
+        for gloss_record in self.queryset:
+            # In theory there should only be one video matching the above query, or none.
+            video = next((v for v in gloss_record.validation_videos if v.is_video), None)
+            gloss_records.append((gloss_record, video))
+            if video:
+                videos.append(video)
+        # The tokens are looked up and created before any row is written, since a streamed row may
+        # be read by the client before the export finishes.
+        tokens = GlossVideoToken.tokens_for_videos(videos)
+
+        for gloss_record, video in gloss_records:
+            row = [gloss_record.idgloss, gloss_record.gloss_main_aggregate]
+            if video:
+                url = reverse(
+                    "video:get_signed_glossvideo_url",
+                    kwargs={"token": tokens[video.pk].token, "videoid": video.pk}
+                )
+                row.append(urljoin(self.base_url, url))
+            else:
+                row.append("")
+                row.append("")
+            yield row
+
+
+class ValidationResultsCSVExport(GlossCSVExport):
+    filename = "validation-results-export.csv"
+    headers = [
+        "idgloss",
+        "have seen sign - yes",
+        "have seen sign - no",
+        "have seen sign - not sure",
+        "total",
+        "comments"
+    ]
+
+    def filter_queryset(self, queryset):
+        # The queryset may or may not already be filtered for the validation:check-results tag.
+        # We have to make sure it is filtered by the tag, so we are filtering again.
+        # The validation records, aggregations and comments used to be prefetched whole for every gloss and
+        # counted in Python, so the cost grew with the number of survey responses. They are now counted and
+        # concatenated by Postgres with one grouped query per table for each chunk of glosses,
+        # see results_for_glosses().
+        check_results_qs = filter_queryset_with_all_tags(queryset, tag_names=[settings.TAG_VALIDATION_CHECK_RESULTS])
+        return check_results_qs.prefetch_related(None).values("id", "idgloss")
+
+    def rows_for_records(self, records):
+        results = self.results_for_glosses([record["id"] for record in records])
+        for record in records:
+            gloss_results = results.get(record["id"], {})
+            sign_seen_yes = gloss_results.get("yes", 0)
+            sign_seen_no = gloss_results.get("no", 0)
+            sign_seen_not_sure = gloss_results.get("not_sure", 0)
+            # The comments of the survey responses come first, then the comments on the share
+            # validation, then the manual validation ones.
+            comment = "".join(
+                gloss_results.get(key) or "" for key in ("record_comments", "share_comments", "manual_comments")
+            )
+            yield [
+                record["idgloss"],
+                sign_seen_yes,
+                sign_seen_no,
+                sign_seen_not_sure,
+                sum([sign_seen_yes, sign_seen_no, sign_seen_not_sure]),
+                comment
+            ]
+
+    def results_for_glosses(self, gloss_ids):
+        """
+        Returns a dict of gloss id -> {result: value} for the given glosses, where the results are the
+        'yes', 'no' and 'not_sure' counts and the 'record_comments', 'share_comments' and 'manual_comments'
+        strings, built from one grouped query per table.
+        """
+        results = defaultdict(lambda: defaultdict(int))
+        SignSeen = ValidationRecord.SignSeenChoices
+
+        validation_records = ValidationRecord.objects\
+            .filter(gloss_id__in=gloss_ids)\
+            .values("gloss_id")\
+            .annotate(
+                yes=Count("pk", filter=Q(sign_seen=SignSeen.YES)),
+                no=Count("pk", filter=Q(sign_seen=SignSeen.NO)),
+                not_sure=Count("pk", filter=Q(sign_seen=SignSeen.NOT_SURE)),
+                comments=StringAgg(
+                    Concat("respondent_first_name", Value(" "), "respondent_last_name", Value(": "), "comment",
+                           Value(" | "), output_field=CharField()),
+                    "",
+                    filter=~Q(comment=""),
+                    order_by=(
+                        Case(
+                            When(sign_seen=SignSeen.YES, then=Value(0)),
+                            When(sign_seen=SignSeen.NO, then=Value(1)),
+                            default=Value(2),
+                        ),
+                        "pk",
+                    ),
+                ),
+            )\
+            .order_by()
+        for row in validation_records:
+            gloss_results = results[row["gloss_id"]]
+            for key in ("yes", "no", "not_sure"):
+                gloss_results[key] += row[key]
+            gloss_results["record_comments"] = row["comments"]
+
+        share_aggregations = ShareValidationAggregation.objects\
+            .filter(gloss_id__in=gloss_ids)\
+            .values("gloss_id")\
+            .annotate(agrees=Sum("agrees"), disagrees=Sum("disagrees"))\
+            .order_by()
+        for row in share_aggregations:
+            results[row["gloss_id"]]["yes"] += row["agrees"] or 0
+            results[row["gloss_id"]]["no"] += row["disagrees"] or 0
+
+        manual_aggregations = ManualValidationAggregation.objects\
+            .filter(gloss_id__in=gloss_ids)\
+            .values("gloss_id")\
+            .annotate(
+                yes=Sum("sign_seen_yes"),
+                no=Sum("sign_seen_no"),
+                not_sure=Sum("sign_seen_not_sure"),
+                comments=StringAgg(
+                    Concat("group", Value(": "), "comments", Value(" | "), output_field=CharField()),
+                    "",
+                    filter=~Q(comments=""),
+                    order_by="pk",
+                ),
+            )\
+            .order_by()
+        for row in manual_aggregations:
+            gloss_results = results[row["gloss_id"]]
+            for key in ("yes", "no", "not_sure"):
+                gloss_results[key] += row[key] or 0
+            gloss_results["manual_comments"] = row["comments"]
+
+        # Comments made on the share validation are kept as private comments on the gloss.
+        share_comments = Comment.objects\
+            .filter(
+                content_type=ContentType.objects.get_for_model(Gloss),
+                object_pk__in=[str(pk) for pk in gloss_ids],
+                is_public=False
+            )\
+            .values("object_pk")\
+            .annotate(comments=StringAgg(
+                Concat("user_name", Value(": "), "comment", Value(" | "), output_field=CharField()),
+                "",
+                order_by=("submit_date", "pk"),
+            ))\
+            .order_by()
+        for row in share_comments:
+            results[int(row["object_pk"])]["share_comments"] = row["comments"]
+
+        return results
+
+
+#: The export formats offered on the advanced search page, keyed by the value of the 'format' parameter.
+CSV_EXPORTS = {
+    "CSV-standard": StandardCSVExport,
+    "CSV-ready-for-validation": ReadyForValidationCSVExport,
+    "CSV-validation-results": ValidationResultsCSVExport,
+}
+
+
+#: How often, in rows, the progress of a running ExportJob is saved.
+EXPORT_JOB_PROGRESS_INTERVAL = 500
+
+
+def claim_next_export_job(job_id=None):
+    """
+    Mark the oldest queued ExportJob, or the ExportJob `job_id` if it is still queued, as running and
+    return it, or return None if there is nothing to do. Rows locked by other workers are skipped, so
+    several workers can run at once.
+    """
+    jobs = ExportJob.objects.select_for_update(skip_locked=True).filter(status=ExportJob.Status.QUEUED)
+    if job_id is not None:
+        jobs = jobs.filter(pk=job_id)
+    with transaction.atomic():
+        job = jobs.order_by("created_at").first()
+        if job is None:
+            return None
+        job.status = ExportJob.Status.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+    return job
+
+
+def run_export_job(job):
+    """Write the CSV file of a claimed ExportJob to its storage, saving the progress as rows are written."""
+    try:
+        export_class = CSV_EXPORTS[job.export_format]
+        queryset = gloss_search_queryset(job.created_by, QueryDict(job.query_string))
+        export = export_class(queryset, base_url=job.base_url)
+
+        job.total_rows = export.count()
+        job.save(update_fields=["total_rows"])
+
+        writer = csv.writer(Echo())
+        rows_written = 0
+        # The file is spooled to disk rather than memory, so large files don't use up the worker's RAM.
+        with tempfile.TemporaryFile() as export_file:
+            export_file.write(writer.writerow(export.headers).encode("utf-8"))
+            for row in export.rows():
+                export_file.write(writer.writerow(row).encode("utf-8"))
+                rows_written += 1
+                if rows_written % EXPORT_JOB_PROGRESS_INTERVAL == 0:
+                    ExportJob.objects.filter(pk=job.pk).update(rows_written=rows_written)
+            export_file.seek(0)
+            job.file.save("%s-%s" % (job.pk, export.filename), File(export_file), save=False)
+    except Exception as e:
+        job.status = ExportJob.Status.FAILED
+        job.error = str(e)
+    else:
+        job.status = ExportJob.Status.DONE
+        job.rows_written = rows_written
+
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + datetime.timedelta(hours=settings.EXPORT_JOB_EXPIRY_HOURS)
+    job.save()
+    return job
+
+
+def run_queued_export_job(job_id):
+    """
+    Run the ExportJob `job_id`, unless a worker has already claimed it. Queued as a task when the job is
+    created, see taskqueue.py.
+    """
+    job = claim_next_export_job(job_id)
+    if job is not None:
+        run_export_job(job)
+
+
+def fail_timed_out_export_jobs():
+    """
+    Mark the ExportJobs that have been running for TASK_TIMEOUT seconds as failed, as their worker has died,
+    so that they are reported as failed and expire like the other finished jobs. Returns the number of jobs.
+    """
+    now = timezone.now()
+    return ExportJob.objects.filter(
+        status=ExportJob.Status.RUNNING,
+        started_at__lt=now - datetime.timedelta(seconds=settings.TASK_TIMEOUT),
+    ).update(
+        status=ExportJob.Status.FAILED,
+        error="Timed out",
+        finished_at=now,
+        expires_at=now + datetime.timedelta(hours=settings.EXPORT_JOB_EXPIRY_HOURS),
+    )
+
+
+def expire_export_jobs():
+    """Delete the files of finished ExportJobs that are past their expiry time. Returns the number of jobs expired."""
+    expired_jobs = ExportJob.objects.filter(
+        status__in=[ExportJob.Status.DONE, ExportJob.Status.FAILED],
+        expires_at__lte=timezone.now()
+    )
+    count = 0
+    for job in expired_jobs.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.status = ExportJob.Status.EXPIRED
+        job.save(update_fields=["file", "status"])
+        count += 1
+    return count
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Facet counts of the advanced gloss search: for each choice of the GlossSearchForm's filters, the number
+of glosses that the search with that choice would find.
+
+The tags of a search are ANDed, so a tag's choice adds it to the search, and is counted in the current
+results. The other fields match one value, or any of their values, so adding a choice to them would
+widen the search instead. Their choices replace the field's selection, and are counted in the search
+without the field's own filter, see facet_querysets().
+"""
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.core.exceptions import EmptyResultSet
+from django.db.models import CharField, Count, Value
+from django.db.models.functions import Cast
+
+from .exports import gloss_search_queryset
+from .models import Gloss
+
+#: The GlossSearchForm fields that are counted, and the lookup of the value each filters on.
+GLOSS_FACETS = (
+    ('dataset', 'dataset_id'),
+    ('semantic_field', 'semantic_field__id'),
+    ('word_classes', 'wordclasses__id'),
+    ('usage', 'usage__id'),
+    ('tags', 'tags__id'),
+    ('handedness', 'handedness_id'),
+    ('strong_handshape', 'strong_handshape_id'),
+    ('location', 'location_id'),
+    ('age_variation', 'age_variation_id'),
+    ('relation_to_foreign_signs', 'relationtoforeignsign__other_lang'),
+)
+#: The GLOSS_FACETS whose choices are added to the search, rather than replacing the field's selection.
+ADDED_FACETS = {'tags'}
+
+
+def _glosses(queryset):
+    return Gloss.objects.filter(pk__in=queryset.prefetch_related(None).order_by().values('pk'))
+
+
+def facet_querysets(user, get):
+    """
+    Return the searches to count the GLOSS_FACETS that are selected in `get` and whose choices replace the
+    selection in, as a dict of {facet name: the search without that facet's filter}.
+    """
+    querysets = {}
+    for name, _ in GLOSS_FACETS:
+        if name in ADDED_FACETS or not get.get(name):
+            continue
+        others = get.copy()
+        others.pop(name)
+        querysets[name] = gloss_search_queryset(user, others)
+    return querysets
+
+
+def gloss_facet_counts(queryset, querysets=None):
+    """
+    Count the glosses of `queryset` per value of each of the GLOSS_FACETS, in a single query. The facets
+    in `querysets`, see facet_querysets(), are counted in their own queryset instead.
+    Returns a dict of {facet name: {value: count}}, the values being strings as they appear in a query string.
+    """
+    querysets = querysets or {}
+    glosses = _glosses(queryset)
+    facet_queries = [
+        (_glosses(querysets[name]) if name in querysets else glosses)
+        .filter(**{lookup + '__isnull': False})
+        .order_by()
+        .values(facet=Value(name, output_field=CharField()), value=Cast(lookup, output_field=CharField()))
+        .annotate(count=Count('pk', distinct=True))
+        for name, lookup in GLOSS_FACETS
+    ]
+
+    counts = defaultdict(dict)
+    try:
+        for row in facet_queries[0].union(*facet_queries[1:], all=True):
+            counts[row['facet']][row['value']] = row['count']
+    except EmptyResultSet:
+        # Every part of the union is known to be empty, e.g. when the user can't view any dataset.
+        pass
+    return counts
+
+
+def facet_choices(form, counts, get):
+    """
+    Return the facets to show with the search `form`, as a list of dicts with the field's name and label,
+    and its choices that have matches. Each choice has its value, label and count, whether it is already
+    selected, and if not the query string of the search with the choice, added to the field's selection for
+    the ADDED_FACETS and in place of it for the others.
+    """
+    facets = []
+    for name, _ in GLOSS_FACETS:
+        field_counts = counts.get(name)
+        if not field_counts:
+            continue
+        selected = get.getlist(name)
+        choices = []
+        for value, label in form.fields[name].choices:
+            value = '' if value is None else str(value)
+            if value not in field_counts:
+                continue
+            query = None
+            if value not in selected:
+                query = get.copy()
+                for key in ('page', 'cursor'):
+                    query.pop(key, None)
+                if name in ADDED_FACETS:
+                    query.appendlist(name, value)
+                else:
+                    query.setlist(name, [value])
+                query = query.urlencode()
+            choices.append({
+                'value': value,
+                'label': label,
+                'count': field_counts[value],
+                'selected': value in selected,
+                'query': query,
+            })
+        if choices:
+            facets.append({'name': name, 'label': form.fields[name].label or name, 'choices': choices})
+    return facets
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Cached context of the public gloss page.
+
+Building the page's context takes a query per translation language, the gloss relations in both
+directions and the gloss's videos, for content that rarely changes. The context is cached under
+a version number per gloss, which signals bump whenever the gloss, its translations, relations
+or videos change (see signals.py), so that the next request builds it again. Cached entries also
+expire after PUBLIC_GLOSS_CACHE_TTL seconds, which bounds how stale the page can be with a cache
+that is not shared between processes.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.utils.translation import get_language
+from django.utils.translation import gettext as _
+
+from ..cache import new_version
+from ..video.models import GlossVideo
+from .models import Gloss, GlossRelation
+
+
+def _version_key(gloss_id):
+    return 'public_gloss_version:%s' % gloss_id
+
+
+def _version(gloss_id):
+    return cache.get_or_set(_version_key(gloss_id), new_version, None)
+
+
+def invalidate_public_gloss_context(gloss_ids):
+    """Make the cached public page context of the given glosses stale."""
+    for gloss_id in set(gloss_ids):
+        if gloss_id is None:
+            continue
+        try:
+            cache.incr(_version_key(gloss_id))
+        except ValueError:
+            cache.set(_version_key(gloss_id), new_version(), None)
+
+
+def build_public_gloss_context(gloss_id):
+    """
+    Return the context of the public page of the published gloss `gloss_id`, or None if there is no
+    such gloss. Everything the template shows is loaded up front, so that it can be rendered from
+    the cache without queries.
+    """
+    gloss = Gloss.objects.filter(pk=gloss_id, published=True)\
+        .select_related('dataset__signlanguage')\
+        .prefetch_related(Prefetch('glossvideo_set',
+                                   queryset=GlossVideo.objects.filter(is_public=True).select_related('video_type')))\
+        .first()
+    if gloss is None:
+        return None
+
+    context = {'gloss': gloss}
+    context['translation_languages_and_translations'] = gloss.get_translations_for_translation_languages()
+    # GlossRelations for this gloss
+    relations = GlossRelation.objects.select_related('source', 'target').prefetch_related('tags')
+    context['glossrelations'] = list(relations.filter(source=gloss))
+    context['glossrelations_reverse'] = list(relations.filter(target=gloss))
+
+    videos = gloss.glossvideo_set.all()
+    # Create a meta description for the gloss.
+    context["metadesc"] = "{glosstxt}: {idgloss} [{lexicon}] / ".format(
+        glosstxt=_("Gloss"), idgloss=gloss, lexicon=gloss.dataset.public_name)
+    for x in context['translation_languages_and_translations']:
+        if x[1]:  # Show language name only if it has translations.
+            context["metadesc"] += "{lang}: {trans} / ".format(lang=str(x[0]), trans=str(x[1]))
+    context["metadesc"] += "{langtxt}: {lang} / {videotxt}: {videocount} / {notestxt}: {notes}".format(
+        langtxt=_("Sign language"), lang=gloss.dataset.signlanguage, videotxt=_("Videos"),
+        videocount=len(videos), notestxt=_("Notes"), notes=gloss.notes)
+    context["first_video"] = videos[0] if videos else None
+    context["first_video_modified_date"] = \
+        videos[0].get_videofile_modified_date() if videos else None
+    return context
+
+
+def public_gloss_context(gloss_id):
+    """Return the context of the public page of the gloss, from the cache if it is there."""
+    key = 'public_gloss_context:%s:%s:%s' % (gloss_id, _version(gloss_id), get_language())
+    context = cache.get(key)
+    if context is None:
+        context = build_public_gloss_context(gloss_id)
+        if context is not None:
+            cache.set(key, context, settings.PUBLIC_GLOSS_CACHE_TTL)
+    return context
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import statistics
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.postgres.aggregates import StringAgg
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef
+from django.db.models.fields import CharField
+from django.test.utils import CaptureQueriesContext
+
+from signbank.dictionary.exports import StandardCSVExport
+from signbank.dictionary.models import (
+    Dataset,
+    FieldChoice,
+    Gloss,
+    GlossTranslations,
+    Language,
+    RelationToForeignSign,
+    SignLanguage,
+)
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def legacy_standard_export_rows(queryset):
+    """The rows of the standard CSV export as they were built with five correlated StringAgg subqueries."""
+    delimiter = StandardCSVExport.CSV_AGG_DELIM
+    field_names = StandardCSVExport.subquery_signbank_field_to_dictionary_field.keys()
+    csv_queryset = queryset\
+        .select_related('dataset', 'created_by', 'updated_by', 'strong_handshape', 'location', 'age_variation')\
+        .annotate(
+            gloss_main_aggregate=StringAgg(
+                GlossTranslations.objects.filter(
+                    gloss=OuterRef('pk'), language__language_code_2char='EN').values('translations')[:1],
+                delimiter, distinct=True, output_field=CharField()),
+            gloss_secondary_aggregate=StringAgg(
+                GlossTranslations.objects.filter(
+                    gloss=OuterRef('pk'), language__language_code_2char='EN').values('translations_secondary')[:1],
+                delimiter, distinct=True, output_field=CharField()),
+            gloss_minor_aggregate=StringAgg(
+                GlossTranslations.objects.filter(
+                    gloss=OuterRef('pk'), language__language_code_2char='EN').values('translations_minor')[:1],
+                delimiter, distinct=True, output_field=CharField()),
+            gloss_maori_aggregate=StringAgg(
+                GlossTranslations.objects.filter(
+                    gloss=OuterRef('pk'), language__language_code_2char='MI').values('translations')[:1],
+                delimiter, distinct=True, output_field=CharField()),
+            relationtoforeignsign_aggregate=StringAgg(
+                RelationToForeignSign.objects.filter(gloss=OuterRef('pk')).values('other_lang')[:1],
+                delimiter, distinct=True, output_field=CharField()),
+            usage_aggregate=StringAgg('usage__english_name', delimiter, distinct=True),
+            semantic_field_aggregate=StringAgg('semantic_field__english_name', delimiter, distinct=True),
+            wordclasses_aggregate=StringAgg('wordclasses__english_name', delimiter, distinct=True)
+        )\
+        .values(*field_names)
+
+    for record in csv_queryset:
+        yield ['' if record.get(field_name) is None else str(record.get(field_name)) for field_name in field_names]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the standard CSV export against the previous correlated subquery version, on a synthetic "
+        "dataset that is created inside a transaction and rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--glosses',
+            type=int,
+            default=10000,
+            help='Number of synthetic glosses to export.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of times to run each export.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            dataset = self.create_dataset(options['glosses'])
+            queryset = Gloss.objects.filter(dataset=dataset).order_by('idgloss')
+
+            results = {}
+            for name, build_rows in (
+                ('correlated subqueries', lambda: list(legacy_standard_export_rows(queryset))),
+                ('grouped queries', lambda: list(StandardCSVExport(queryset).rows())),
+            ):
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        rows = build_rows()
+                        timings.append(time.perf_counter() - start)
+                    query_time = sum(float(query['time']) for query in queries.captured_queries)
+                    eprint(f"{name}: {len(rows)} rows in {timings[-1]:.2f}s, "
+                           f"{len(queries)} queries taking {query_time:.2f}s")
+                results[name] = rows
+                eprint(f"{name}: median {statistics.median(timings):.2f}s")
+
+            if results['correlated subqueries'] == results['grouped queries']:
+                eprint("Both exports produced identical rows.")
+            else:
+                eprint("The exports differ!")
+
+            transaction.set_rollback(True)
+
+    def create_dataset(self, number_of_glosses):
+        user = User.objects.create(username="benchmark-gloss-export")
+        signlanguage = SignLanguage.objects.first() or \
+            SignLanguage.objects.create(name="Benchmark", language_code_3char="bmk")
+        dataset = Dataset.objects.create(name="benchmark-gloss-export", signlanguage=signlanguage)
+        english = Language.objects.filter(language_code_2char='EN').first() or \
+            Language.objects.create(name="English", language_code_2char="EN", language_code_3char="eng")
+        maori = Language.objects.filter(language_code_2char='MI').first() or \
+            Language.objects.create(name="Māori", language_code_2char="MI", language_code_3char="mri")
+
+        machine_value = (FieldChoice.objects.aggregate(Max('machine_value'))['machine_value__max'] or 0) + 1
+        choices = {}
+        for field_name in ('wordclasses', 'usage', 'semantic_field'):
+            choices[field_name] = FieldChoice.objects.bulk_create([
+                FieldChoice(field=field_name, english_name=f"{field_name} {i}", machine_value=machine_value + i)
+                for i in range(30)
+            ])
+            machine_value += 30
+
+        glosses = Gloss.objects.bulk_create([
+            Gloss(idgloss=f"benchmark:{i}", dataset=dataset, created_by=user, updated_by=user,
+                  notes=f"Synthetic gloss {i}")
+            for i in range(number_of_glosses)
+        ])
+        GlossTranslations.objects.bulk_create(
+            [GlossTranslations(gloss=gloss, language=english, translations=f"gloss {i}, word {i}",
+                               translations_secondary=f"secondary {i}", translations_minor=f"minor {i}")
+             for i, gloss in enumerate(glosses)] +
+            [GlossTranslations(gloss=gloss, language=maori, translations=f"kupu {i}")
+             for i, gloss in enumerate(glosses)]
+        )
+        RelationToForeignSign.objects.bulk_create([
+            RelationToForeignSign(gloss=gloss, other_lang=other_lang, other_lang_gloss=f"foreign {i}")
+            for i, gloss in enumerate(glosses) if i % 3 == 0
+            for other_lang in ("Auslan", "BSL")
+        ])
+        for field_name, field_choices in choices.items():
+            through_model = Gloss._meta.get_field(field_name).remote_field.through
+            through_model.objects.bulk_create([
+                through_model(gloss_id=gloss.pk, fieldchoice_id=field_choices[(i + offset) % 30].pk)
+                for i, gloss in enumerate(glosses)
+                for offset in range(i % 3 + 1)
+            ])
+
+        return dataset
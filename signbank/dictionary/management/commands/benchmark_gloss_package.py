@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import statistics
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+
+from signbank.dictionary.models import Dataset, FieldChoice, Gloss, GlossTranslations, Language, SignLanguage
+from signbank.dictionary.tools import get_gloss_data
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the gloss data of the package view built with Gloss.get_fields_dict() for each gloss against "
+        "GlossDataSerializer, on a synthetic dataset that is created inside a transaction and rolled back "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--glosses',
+            type=int,
+            default=2000,
+            help='Number of synthetic glosses to serialize.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of times to run each serializer.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            dataset = self.create_dataset(options['glosses'])
+            # The fields get_gloss_data() asks for.
+            fieldnames = [f"Translations {language.name}" for language in dataset.translation_languages.all()] + [
+                "Handedness", "Strong Hand", "Weak Hand", "Location", "Semantic Field", "Word Classes",
+                "Named Entity", "Link", "Video"]
+            queryset = Gloss.objects.filter(dataset=dataset)
+
+            results = {}
+            for name, serialize in (
+                ('get_fields_dict', lambda: {
+                    str(gloss.pk): gloss.get_fields_dict(fieldnames) for gloss in queryset
+                }),
+                ('GlossDataSerializer', lambda: get_gloss_data(dataset=dataset)),
+            ):
+                timings = []
+                for _ in range(options['repeat']):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        data = serialize()
+                        timings.append(time.perf_counter() - start)
+                    eprint(f"{name}: {len(data)} glosses in {timings[-1]:.2f}s, {len(queries)} queries")
+                results[name] = data
+                eprint(f"{name}: median {statistics.median(timings):.2f}s")
+
+            if results['get_fields_dict'] == results['GlossDataSerializer']:
+                eprint("Both serializers produced identical data.")
+            else:
+                eprint("The serializers differ!")
+
+            transaction.set_rollback(True)
+
+    def create_dataset(self, number_of_glosses):
+        user = User.objects.create(username="benchmark-gloss-package")
+        signlanguage = SignLanguage.objects.first() or \
+            SignLanguage.objects.create(name="Benchmark", language_code_3char="bmk")
+        dataset = Dataset.objects.create(name="benchmark-gloss-package", signlanguage=signlanguage)
+        english = Language.objects.filter(language_code_2char='EN').first() or \
+            Language.objects.create(name="English", language_code_2char="EN", language_code_3char="eng")
+        maori = Language.objects.filter(language_code_2char='MI').first() or \
+            Language.objects.create(name="Māori", language_code_2char="MI", language_code_3char="mri")
+        dataset.translation_languages.add(english, maori)
+
+        machine_value = (FieldChoice.objects.aggregate(Max('machine_value'))['machine_value__max'] or 0) + 1
+        choices = {}
+        for field_name in ('handedness', 'strong_handshape', 'location', 'named_entity'):
+            choices[field_name] = FieldChoice.objects.bulk_create([
+                FieldChoice(field=field_name, english_name=f"{field_name} {i}", machine_value=machine_value + i)
+                for i in range(10)
+            ])
+            machine_value += 10
+
+        glosses = Gloss.objects.bulk_create([
+            Gloss(idgloss=f"benchmark:{i}", dataset=dataset, created_by=user, updated_by=user,
+                  **{field_name: field_choices[i % 10] for field_name, field_choices in choices.items()})
+            for i in range(number_of_glosses)
+        ])
+        GlossTranslations.objects.bulk_create(
+            [GlossTranslations(gloss=gloss, language=english, translations=f"gloss {i}")
+             for i, gloss in enumerate(glosses)] +
+            [GlossTranslations(gloss=gloss, language=maori, translations=f"kupu {i}")
+             for i, gloss in enumerate(glosses)]
+        )
+        return dataset
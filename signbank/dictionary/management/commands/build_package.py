@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from signbank.dictionary.models import Dataset
+from signbank.dictionary.packages import build_package
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the full package of a dataset for the package endpoint, so that the first request for it "
+        "after glosses have been published doesn't have to wait for it to be built."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            default=settings.DEFAULT_DATASET_ACRONYM,
+            help='Name of the dataset, defaults to DEFAULT_DATASET_ACRONYM.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            dataset = Dataset.objects.get(name=options['dataset'])
+        except Dataset.DoesNotExist:
+            raise CommandError(f"Dataset {options['dataset']} does not exist")
+        path = build_package(dataset)
+        eprint(f"Built {path}")
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import sys
+
+from django.core.management.base import BaseCommand
+
+from signbank.dictionary.models import Gloss
+from signbank.dictionary.search import update_gloss_search_documents
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the search documents used by the advanced gloss search. They are normally kept up to date "
+        "by signals; use this after changing glosses or translations outside of the ORM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of glosses to rebuild per batch.',
+        )
+
+    def handle(self, *args, **options):
+        gloss_ids = list(Gloss.objects.order_by('pk').values_list('pk', flat=True))
+        eprint(f"Glosses to process: {len(gloss_ids)}")
+
+        batch_size = options['batch_size']
+        for start in range(0, len(gloss_ids), batch_size):
+            update_gloss_search_documents(gloss_ids[start:start + batch_size])
+
+        eprint("Done")
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from signbank.dictionary.exports import expire_export_jobs, fail_timed_out_export_jobs
+from signbank.dictionary.models import Task
+from signbank.dictionary.taskqueue import claim_next_task, delete_finished_tasks, run_task
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background tasks queued in the database, eg. CSV exports, the rebuilds of the ECV and CSV "
+        "files of datasets, NZSL Share imports and the renaming of video files. Retries failed tasks, and "
+        "deletes old finished ones. Also fails the export jobs whose worker has died, and deletes the files "
+        "of expired export jobs. Runs until interrupted, unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the tasks that are due, then exit instead of waiting for new ones.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=int,
+            default=5,
+            help='Seconds to wait between checks for new tasks.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = delete_finished_tasks()
+            if deleted:
+                eprint(f"Deleted finished tasks: {deleted}")
+            timed_out = fail_timed_out_export_jobs()
+            if timed_out:
+                eprint(f"Timed out export jobs: {timed_out}")
+            expired = expire_export_jobs()
+            if expired:
+                eprint(f"Expired export jobs: {expired}")
+
+            while (task := claim_next_task()) is not None:
+                eprint(f"Running task {task.pk} {task.name}, attempt {task.attempts} of {task.max_attempts}")
+                task = run_task(task)
+                if task.status == Task.Status.DONE:
+                    eprint(f"Task {task.pk} done")
+                elif task.status == Task.Status.QUEUED:
+                    eprint(f"Task {task.pk} failed, retrying after {task.run_after}: {task.error}")
+                else:
+                    eprint(f"Task {task.pk} failed: {task.error}")
+
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
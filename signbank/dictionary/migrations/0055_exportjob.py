@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:27
+
+import django.db.models.deletion
+import signbank.dictionary.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0054_order_tags_by_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_format', models.CharField(max_length=50, verbose_name='Export format')),
+                ('query_string', models.TextField(blank=True, default='', verbose_name='Query string')),
+                ('base_url', models.CharField(blank=True, default='', max_length=255, verbose_name='Base URL')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('expired', 'Expired')], default='queued', max_length=20, verbose_name='Status')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Total rows')),
+                ('rows_written', models.PositiveIntegerField(default=0, verbose_name='Rows written')),
+                ('file', models.FileField(blank=True, storage=signbank.dictionary.models.export_file_storage, upload_to='exports/', verbose_name='File')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Expires at')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Created by')),
+            ],
+            options={
+                'verbose_name': 'Export job',
+                'verbose_name_plural': 'Export jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
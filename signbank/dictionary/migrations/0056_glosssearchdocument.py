@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# Build the search documents of all existing glosses in one statement. Afterwards they are
+# kept up to date by signals, or can be rebuilt with the rebuild_gloss_search_documents command.
+BACKFILL_SQL = """
+INSERT INTO dictionary_glosssearchdocument (gloss_id, names, keywords, notes, document)
+SELECT gloss.id,
+       concat_ws(E'\\n', gloss.idgloss, NULLIF(gloss.idgloss_mi, '')),
+       COALESCE(gloss_keywords.keywords, ''),
+       COALESCE(gloss.notes, ''),
+       lower(concat_ws(E'\\n', concat_ws(E'\\n', gloss.idgloss, NULLIF(gloss.idgloss_mi, '')),
+                       COALESCE(gloss_keywords.keywords, ''), COALESCE(gloss.notes, '')))
+FROM dictionary_gloss gloss
+LEFT JOIN (
+    SELECT translation.gloss_id,
+           string_agg(keyword.text, E'\\n' ORDER BY translation.language_id, translation."order") AS keywords
+    FROM dictionary_translation translation
+    JOIN dictionary_keyword keyword ON keyword.id = translation.keyword_id
+    GROUP BY translation.gloss_id
+) gloss_keywords ON gloss_keywords.gloss_id = gloss.id;
+
+UPDATE dictionary_glosssearchdocument
+SET search_vector = setweight(to_tsvector('simple', names), 'A') ||
+                    setweight(to_tsvector('simple', keywords), 'B') ||
+                    setweight(to_tsvector('simple', notes), 'C');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0055_exportjob'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='GlossSearchDocument',
+            fields=[
+                ('gloss', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='dictionary.gloss')),
+                ('names', models.TextField(blank=True, default='')),
+                ('keywords', models.TextField(blank=True, default='')),
+                ('notes', models.TextField(blank=True, default='')),
+                ('document', models.TextField(blank=True, default='')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='glosssearchdocument_vector'), django.contrib.postgres.indexes.GinIndex(fields=['document'], name='glosssearchdocument_trgm', opclasses=['gin_trgm_ops'])],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:08
+
+import django.db.models.deletion
+import signbank.dictionary.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0056_glosssearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetArtifact',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('public-ecv', 'Public ECV'), ('csv', 'CSV')], max_length=20, verbose_name='Kind')),
+                ('file', models.FileField(blank=True, storage=signbank.dictionary.models.export_file_storage, upload_to='artifacts/', verbose_name='File')),
+                ('etag', models.CharField(blank=True, default='', max_length=64, verbose_name='ETag')),
+                ('generated_at', models.DateTimeField(blank=True, null=True, verbose_name='Generated at')),
+                ('stale', models.BooleanField(default=True, verbose_name='Stale')),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artifacts', to='dictionary.dataset', verbose_name='Dataset')),
+            ],
+            options={
+                'verbose_name': 'Dataset artifact',
+                'verbose_name_plural': 'Dataset artifacts',
+                'indexes': [models.Index(condition=models.Q(('stale', True)), fields=['stale'], name='datasetartifact_stale')],
+                'constraints': [models.UniqueConstraint(fields=('dataset', 'kind'), name='unique_datasetartifact_dataset_kind')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0057_datasetartifact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('gloss', 'Gloss'), ('video', 'Video'), ('image', 'Image')], max_length=20, verbose_name='Kind')),
+                ('key', models.CharField(max_length=255, verbose_name='Key')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='Deleted at')),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='package_tombstones', to='dictionary.dataset', verbose_name='Dataset')),
+            ],
+            options={
+                'verbose_name': 'Package tombstone',
+                'verbose_name_plural': 'Package tombstones',
+                'indexes': [models.Index(fields=['dataset', 'deleted_at'], name='dictionary__dataset_3277d3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0058_packagetombstone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('gloss', 'Gloss'), ('nzsl-share', 'NZSL Share'), ('qualtrics', 'Qualtrics'), ('manual-validation', 'Manual validation')], max_length=20, verbose_name='Kind')),
+                ('data', models.JSONField(default=dict, verbose_name='Data')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created at')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_batches', to=settings.AUTH_USER_MODEL, verbose_name='Created by')),
+                ('dataset', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='import_batches', to='dictionary.dataset', verbose_name='Dataset')),
+            ],
+            options={
+                'verbose_name': 'Import batch',
+                'verbose_name_plural': 'Import batches',
+            },
+        ),
+    ]
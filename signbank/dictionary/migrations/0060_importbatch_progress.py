@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0059_importbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importbatch',
+            name='error',
+            field=models.TextField(blank=True, default='', verbose_name='Error'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Finished at'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='rows_done',
+            field=models.PositiveIntegerField(default=0, verbose_name='Rows done'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='rows_total',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Rows total'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Started at'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='status',
+            field=models.CharField(choices=[('staged', 'Staged'), ('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='staged', max_length=20, verbose_name='Status'),
+        ),
+        migrations.AddField(
+            model_name='importbatch',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Updated at'),
+        ),
+    ]
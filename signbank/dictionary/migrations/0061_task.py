@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0060_importbatch_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='Keyword arguments')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('max_attempts', models.PositiveIntegerField(default=1, verbose_name='Max attempts')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Run after')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+            ],
+            options={
+                'verbose_name': 'Task',
+                'verbose_name_plural': 'Tasks',
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['run_after'], name='task_queued_run_after')],
+            },
+        ),
+    ]
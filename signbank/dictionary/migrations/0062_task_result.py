@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0061_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='result',
+            field=models.JSONField(blank=True, null=True, verbose_name='Result'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def queue_stale_artifact_builds(apps, schema_editor):
+    # Stale artifacts used to be rebuilt by the process_export_jobs command. They are now rebuilt by a
+    # task that is queued when they are marked stale, so the ones that are already stale need one.
+    DatasetArtifact = apps.get_model("dictionary", "DatasetArtifact")
+    Task = apps.get_model("dictionary", "Task")
+    if DatasetArtifact.objects.filter(stale=True).exists():
+        Task.objects.create(name="signbank.dictionary.artifacts.build_stale_dataset_artifacts",
+                            max_attempts=settings.TASK_MAX_ATTEMPTS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0062_task_result'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_stale_artifact_builds, reverse_code=migrations.RunPython.noop),
+    ]
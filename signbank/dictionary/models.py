@@ -7,12 +7,18 @@ from collections import OrderedDict
 from itertools import groupby
 
 import reversion
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.sites.models import Site
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
+from django.core.files.storage import FileSystemStorage
 from django.db import OperationalError, models
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
 from taggit.managers import TaggableManager
 
@@ -690,10 +696,10 @@ class Gloss(models.Model):
             )
 
         if "Video" in fieldnames:
-            video_path = self.get_video_url()
+            video_path = self.get_video_path()
             if video_path:
                 fields["Video"] = (
-                    f"{site.domain}/{reverse('dictionary:protected_media', kwargs={'filename': video_path})}"
+                    f"{site.domain}{reverse('dictionary:protected_media', kwargs={'filename': video_path})}"
                 )
 
         return fields
@@ -706,7 +712,7 @@ class Gloss(models.Model):
             return ''
         except MultipleObjectsReturned:
             # Just return the first
-            glossvideos = self.glossvideo_set.filter(version=0)
+            glossvideos = self.glossvideo_set.filter(version=0).order_by('pk')
             return str(glossvideos[0].videofile)
 
     def get_absolute_url(self):
@@ -968,3 +974,255 @@ class ValidationRecord(models.Model):
 
 
 
+
+
+class GlossSearchDocument(models.Model):
+    """
+    The text of a Gloss that the advanced search looks in, kept in one indexed row per gloss so that
+    searching doesn't have to join translations and keywords. Kept up to date by signals, see signals.py.
+    """
+    gloss = models.OneToOneField(Gloss, primary_key=True, related_name="search_document", on_delete=models.CASCADE)
+    #: The idgloss and idgloss_mi of the Gloss.
+    names = models.TextField(blank=True, default="")
+    #: The Keywords of all of the Gloss's Translations.
+    keywords = models.TextField(blank=True, default="")
+    notes = models.TextField(blank=True, default="")
+    #: names, keywords and notes in lower case. Searched with LIKE, using a trigram index.
+    document = models.TextField(blank=True, default="")
+    #: Weighted full text search vector of names, keywords and notes, used to rank search results.
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="glosssearchdocument_vector"),
+            GinIndex(fields=["document"], name="glosssearchdocument_trgm", opclasses=["gin_trgm_ops"]),
+        ]
+
+    def __str__(self):
+        return str(self.gloss_id)
+
+
+class ExportFileStorage(FileSystemStorage):
+    """Local storage for export files. It lives outside MEDIA_ROOT, so files are only served by the download view."""
+
+    def __init__(self, location=settings.WRITABLE_FOLDER, base_url=None):
+        super(ExportFileStorage, self).__init__(location, base_url)
+
+
+def export_file_storage():
+    return import_string(settings.EXPORT_FILE_STORAGE)()
+
+
+class ExportJob(models.Model):
+    """A CSV export of an advanced gloss search, written in the background by a task, see exports.py."""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+        EXPIRED = "expired", "Expired"
+
+    #: The CSV format of the advanced search page to export, eg. CSV-standard.
+    export_format = models.CharField(_("Export format"), max_length=50)
+    #: The search parameters of the export, as a URL query string.
+    query_string = models.TextField(_("Query string"), blank=True, default="")
+    #: Absolute URL of the site when the export was requested, used for links written into the file.
+    base_url = models.CharField(_("Base URL"), max_length=255, blank=True, default="")
+    status = models.CharField(_("Status"), max_length=20, choices=Status.choices, default=Status.QUEUED)
+    #: Number of rows the export will contain, known once the job has started.
+    total_rows = models.PositiveIntegerField(_("Total rows"), null=True, blank=True)
+    rows_written = models.PositiveIntegerField(_("Rows written"), default=0)
+    file = models.FileField(_("File"), upload_to="exports/", storage=export_file_storage, blank=True)
+    #: The error message if the export failed.
+    error = models.TextField(_("Error"), blank=True, default="")
+    created_by = models.ForeignKey(User, verbose_name=_("Created by"), related_name="export_jobs",
+                                   on_delete=models.CASCADE)
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+    started_at = models.DateTimeField(_("Started at"), null=True, blank=True)
+    finished_at = models.DateTimeField(_("Finished at"), null=True, blank=True)
+    #: When the file of a finished export is deleted.
+    expires_at = models.DateTimeField(_("Expires at"), null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = _("Export job")
+        verbose_name_plural = _("Export jobs")
+
+    def __str__(self):
+        return "%s (%s)" % (self.export_format, self.get_status_display())
+
+    @property
+    def progress(self):
+        """Percentage of the rows written so far, or None if the number of rows is not known yet."""
+        if self.status == self.Status.DONE:
+            return 100
+        if not self.total_rows:
+            return None
+        return min(100, int(self.rows_written * 100 / self.total_rows))
+
+
+class DatasetArtifact(models.Model):
+    """
+    A file generated from the glosses of a Dataset, eg. its public ECV, that is served instead of
+    building the file on every request. It is marked stale when the glosses change and rebuilt in
+    the background by a task, see artifacts.py.
+    """
+
+    class Kind(models.TextChoices):
+        PUBLIC_ECV = "public-ecv", "Public ECV"
+        CSV = "csv", "CSV"
+
+    dataset = models.ForeignKey(Dataset, verbose_name=_("Dataset"), related_name="artifacts",
+                                on_delete=models.CASCADE)
+    kind = models.CharField(_("Kind"), max_length=20, choices=Kind.choices)
+    file = models.FileField(_("File"), upload_to="artifacts/", storage=export_file_storage, blank=True)
+    #: SHA-256 of the file's contents, sent as its ETag.
+    etag = models.CharField(_("ETag"), max_length=64, blank=True, default="")
+    generated_at = models.DateTimeField(_("Generated at"), null=True, blank=True)
+    #: Whether the glosses have changed since the file was generated.
+    stale = models.BooleanField(_("Stale"), default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dataset", "kind"], name="unique_datasetartifact_dataset_kind"),
+        ]
+        indexes = [
+            models.Index(fields=["stale"], name="datasetartifact_stale", condition=models.Q(stale=True)),
+        ]
+        verbose_name = _("Dataset artifact")
+        verbose_name_plural = _("Dataset artifacts")
+
+    def __str__(self):
+        return "%s (%s)" % (self.dataset, self.get_kind_display())
+
+
+class PackageTombstone(models.Model):
+    """
+    Record of a gloss or media file that was deleted from a dataset, so that incremental packages
+    (see views.package) can tell their consumers to remove it.
+    """
+
+    class Kind(models.TextChoices):
+        GLOSS = "gloss", "Gloss"
+        VIDEO = "video", "Video"
+        IMAGE = "image", "Image"
+
+    dataset = models.ForeignKey(Dataset, verbose_name=_("Dataset"), related_name="package_tombstones",
+                                on_delete=models.CASCADE)
+    kind = models.CharField(_("Kind"), max_length=20, choices=Kind.choices)
+    #: The id of the gloss, or the name of the media file as used in the package's video_urls and image_urls.
+    key = models.CharField(_("Key"), max_length=255)
+    deleted_at = models.DateTimeField(_("Deleted at"), auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["dataset", "deleted_at"]),
+        ]
+        verbose_name = _("Package tombstone")
+        verbose_name_plural = _("Package tombstones")
+
+    def __str__(self):
+        return "%s %s" % (self.get_kind_display(), self.key)
+
+
+class ImportBatch(models.Model):
+    """
+    The rows parsed from an uploaded CSV file, kept between the preview of an import and its confirmation.
+    The session of the user only holds the id of the batch, see csv_import.py.
+
+    Confirmed NZSL Share imports are kept instead, and committed in the background by a task that the
+    runworker command runs, see share_import.py.
+    """
+
+    class Kind(models.TextChoices):
+        GLOSS = "gloss", "Gloss"
+        NZSL_SHARE = "nzsl-share", "NZSL Share"
+        QUALTRICS = "qualtrics", "Qualtrics"
+        MANUAL_VALIDATION = "manual-validation", "Manual validation"
+
+    class Status(models.TextChoices):
+        STAGED = "staged", "Staged"
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    kind = models.CharField(_("Kind"), max_length=20, choices=Kind.choices)
+    status = models.CharField(_("Status"), max_length=20, choices=Status.choices, default=Status.STAGED)
+    created_by = models.ForeignKey(User, verbose_name=_("Created by"), related_name="import_batches",
+                                   on_delete=models.CASCADE)
+    dataset = models.ForeignKey(Dataset, verbose_name=_("Dataset"), related_name="import_batches",
+                                null=True, blank=True, on_delete=models.CASCADE)
+    #: The parsed rows and whatever else the confirmation of the import needs, by name.
+    data = models.JSONField(_("Data"), default=dict)
+    #: Number of rows to import, known once the import is confirmed.
+    rows_total = models.PositiveIntegerField(_("Rows total"), null=True, blank=True)
+    #: Number of rows committed so far. The import resumes after them if it is interrupted.
+    rows_done = models.PositiveIntegerField(_("Rows done"), default=0)
+    #: The error message if the import failed.
+    error = models.TextField(_("Error"), blank=True, default="")
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True, db_index=True)
+    #: When the batch last changed, eg. when a chunk of rows was committed.
+    updated_at = models.DateTimeField(_("Updated at"), auto_now=True)
+    started_at = models.DateTimeField(_("Started at"), null=True, blank=True)
+    finished_at = models.DateTimeField(_("Finished at"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Import batch")
+        verbose_name_plural = _("Import batches")
+
+    def __str__(self):
+        return "%s (%s)" % (self.get_kind_display(), self.created_at)
+
+    @property
+    def progress(self):
+        """Percentage of the rows committed so far, or None if the number of rows is not known yet."""
+        if self.status == self.Status.DONE:
+            return 100
+        if not self.rows_total:
+            return None
+        return min(100, int(self.rows_done * 100 / self.rows_total))
+
+
+class Task(models.Model):
+    """
+    A function to call in the background with keyword arguments, queued in the database and run by
+    the runworker command, see taskqueue.py.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    #: Dotted path of the function to call, eg. signbank.dictionary.tasks.retrieve_videos_for_glosses.
+    name = models.CharField(_("Name"), max_length=255)
+    #: The keyword arguments of the call. They must be JSON serializable.
+    kwargs = models.JSONField(_("Keyword arguments"), default=dict, blank=True)
+    status = models.CharField(_("Status"), max_length=20, choices=Status.choices, default=Status.QUEUED)
+    #: Number of times the task has been started.
+    attempts = models.PositiveIntegerField(_("Attempts"), default=0)
+    #: Number of times the task is started before it is given up on.
+    max_attempts = models.PositiveIntegerField(_("Max attempts"), default=1)
+    #: The task isn't started before this time, which is pushed back after each failed attempt.
+    run_after = models.DateTimeField(_("Run after"), default=timezone.now)
+    #: The error of the last failed attempt.
+    error = models.TextField(_("Error"), blank=True, default="")
+    #: What the function returned, or the `result` of the error it raised, eg. the outcome of each video.
+    result = models.JSONField(_("Result"), null=True, blank=True)
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+    started_at = models.DateTimeField(_("Started at"), null=True, blank=True)
+    finished_at = models.DateTimeField(_("Finished at"), null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["run_after"], name="task_queued_run_after",
+                         condition=models.Q(status="queued")),
+        ]
+        verbose_name = _("Task")
+        verbose_name_plural = _("Tasks")
+
+    def __str__(self):
+        return "%s (%s)" % (self.name, self.get_status_display())
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+The packages of the package view: a zip with JSON files of the glosses of a dataset and the URLs of
+their videos and images, or of what changed in it since a timestamp.
+
+The zip is written while it is sent to the client, instead of being built in memory and on disk first.
+A copy of it is kept in SIGNBANK_PACKAGES_FOLDER, named after the dataset, the since timestamp and the
+version of the dataset's data, so that identical requests are answered with the file until the data
+changes. The since timestamp is rounded down to PACKAGE_SINCE_TIMESTAMP_BUCKET seconds so that clients
+asking at around the same time share a package, and only the PACKAGE_CACHE_MAX_FILES most recently
+used packages are kept.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+import tempfile
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from ..video.models import GlossVideo, MediaManifestEntry
+from .models import Gloss, PackageTombstone
+from .tools import get_deleted_data, get_gloss_data, package_media_key, timestamp_to_datetime
+
+#: Bytes of zip data collected before they are sent to the client.
+CHUNK_SIZE = 64 * 1024
+
+
+def since_timestamp_bucket(since_timestamp):
+    """Round `since_timestamp` down to a multiple of PACKAGE_SINCE_TIMESTAMP_BUCKET seconds."""
+    return since_timestamp - since_timestamp % settings.PACKAGE_SINCE_TIMESTAMP_BUCKET
+
+
+def package_data(dataset, since_timestamp=0):
+    """Return the contents of the package of `dataset`, as a dict of JSON file name -> data."""
+    missing = MediaManifestEntry.objects.filter(exists=False).values('key')
+    glossvideos = GlossVideo.objects.filter(gloss__dataset=dataset)\
+        .exclude(videofile='')\
+        .exclude(videofile__in=missing)
+    if since_timestamp:
+        glossvideos = glossvideos.filter(videofile_modified_at__gt=timestamp_to_datetime(since_timestamp))
+
+    video_urls = {}
+    image_urls = {}
+    for gv in glossvideos.only('videofile'):
+        if gv.is_video():
+            urls = video_urls
+        elif gv.is_image():
+            urls = image_urls
+        else:
+            continue
+        urls[package_media_key(gv.videofile.name)] = reverse(
+            'dictionary:protected_media', kwargs={"filename": gv.videofile.name}
+        )
+
+    data = {'video_urls': video_urls,
+            'image_urls': image_urls,
+            'glosses': get_gloss_data(since_timestamp, dataset)}
+    if since_timestamp:
+        data.update(get_deleted_data(since_timestamp, dataset))
+    return data
+
+
+def package_version(dataset):
+    """
+    Return a string that changes whenever the package of `dataset` does: when a gloss or a video
+    file is changed, added or deleted.
+    """
+    glosses = Gloss.objects.filter(dataset=dataset).aggregate(Max('updated_at'), Count('pk'))
+    videos = GlossVideo.objects.filter(gloss__dataset=dataset).exclude(videofile='')\
+        .aggregate(Max('videofile_modified_at'), Count('pk'))
+    tombstones = PackageTombstone.objects.filter(dataset=dataset).aggregate(Max('pk'))
+    state = repr((sorted(glosses.items()), sorted(videos.items()), tombstones['pk__max']))
+    return hashlib.sha256(state.encode('utf-8')).hexdigest()[:16]
+
+
+def cached_package_path(dataset, since_timestamp):
+    return os.path.join(settings.SIGNBANK_PACKAGES_FOLDER,
+                        "%s-%s-%s.zip" % (dataset.pk, since_timestamp, package_version(dataset)))
+
+
+class ZipStream(object):
+    """Collects what ZipFile writes to it, until it is taken out with pop()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def zip_chunks(data_per_file):
+    """
+    Yield the bytes of a zip with a JSON file for each item of `data_per_file`. ZipFile can't seek
+    back in the stream, so it writes the sizes of the files after their contents.
+    """
+    stream = ZipStream()
+    encoder = json.JSONEncoder()
+    with ZipFile(stream, 'w', compression=ZIP_DEFLATED) as archive:
+        for filename, data in data_per_file.items():
+            with archive.open(filename + '.json', 'w') as member:
+                buffer = []
+                for text in encoder.iterencode(data):
+                    buffer.append(text)
+                    if len(buffer) >= 1000:
+                        member.write("".join(buffer).encode('utf-8'))
+                        buffer = []
+                        if stream.size >= CHUNK_SIZE:
+                            yield stream.pop()
+                member.write("".join(buffer).encode('utf-8'))
+    yield stream.pop()
+
+
+def evict_cached_packages():
+    """Delete all but the PACKAGE_CACHE_MAX_FILES most recently used packages."""
+    folder = settings.SIGNBANK_PACKAGES_FOLDER
+    paths = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.zip')]
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except FileNotFoundError:
+            pass
+    for path in sorted(mtimes, key=mtimes.get, reverse=True)[settings.PACKAGE_CACHE_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def caching_chunks(path, chunks):
+    """
+    Yield `chunks`, writing them to `path` as well. The file only appears at `path` once all of them
+    have been written, so that an interrupted download doesn't leave a broken package behind.
+    """
+    part = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.part', delete=False)
+    try:
+        with part:
+            for chunk in chunks:
+                part.write(chunk)
+                yield chunk
+        os.replace(part.name, path)
+    finally:
+        if os.path.exists(part.name):
+            os.remove(part.name)
+    evict_cached_packages()
+
+
+def open_cached_package(path):
+    """Return the package at `path` opened for reading and mark it used, or None if there is none."""
+    try:
+        package_file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    os.utime(path)
+    return package_file
+
+
+def build_package(dataset, since_timestamp=0):
+    """Write the package of `dataset` to the cache if it isn't there yet, and return its path."""
+    path = cached_package_path(dataset, since_timestamp)
+    if not os.path.exists(path):
+        for _chunk in caching_chunks(path, zip_chunks(package_data(dataset, since_timestamp))):
+            pass
+    return path
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Pagination of the gloss lists.
+
+Offset pagination needs a COUNT(*) over the search and an OFFSET that scans every row before
+the requested page. Keyset pagination instead continues from the last (order field, id) of the
+previous page, which the index on the order field can seek to directly, so deep pages cost the
+same as the first one. The position is passed around as an opaque, signed `cursor` token.
+The number of matches is still shown, but counted once per search and cached.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SALT = 'signbank.dictionary.pagination'
+
+
+class CursorSerializer(signing.JSONSerializer):
+    """Serializes cursors with DjangoJSONEncoder, so that dates and decimals can be ordered by."""
+
+    def dumps(self, obj):
+        return DjangoJSONEncoder(separators=(',', ':')).encode(obj).encode('latin-1')
+
+
+def cached_count(queryset):
+    """Return the number of objects in `queryset`, cached for PAGINATION_COUNT_CACHE_TTL seconds."""
+    try:
+        sql = str(queryset.order_by().query)
+    except EmptyResultSet:
+        return 0
+    key = 'paginator_count:%s' % hashlib.sha256(sql.encode('utf-8')).hexdigest()
+    return cache.get_or_set(key, queryset.count, settings.PAGINATION_COUNT_CACHE_TTL)
+
+
+class CachedCountPaginator(Paginator):
+    """Offset paginator that caches the number of objects."""
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
+
+
+def keyset_ordering(queryset):
+    """
+    Return the (field name, descending) that `queryset` is ordered by if it can be keyset paginated,
+    that is when it is ordered by a single non nullable field of its model. Otherwise returns None.
+    """
+    if len(queryset.query.order_by) != 1:
+        return None
+    ordering = queryset.query.order_by[0]
+    if not isinstance(ordering, str):
+        return None
+    descending = ordering.startswith('-')
+    field_name = ordering.lstrip('-')
+    if field_name == 'pk':
+        field_name = queryset.model._meta.pk.name
+    try:
+        field = queryset.model._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return None
+    if not field.concrete or field.is_relation or field.null:
+        return None
+    return field.name, descending
+
+
+class KeysetPage(object):
+    """A page of a KeysetPaginator, usable in templates in place of a django.core.paginator.Page."""
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator(object):
+    """Paginates `queryset`, which keyset_ordering() must accept, `per_page` objects at a time."""
+
+    def __init__(self, queryset, per_page):
+        self.field_name, self.descending = keyset_ordering(queryset)
+        self.pk_name = queryset.model._meta.pk.name
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @cached_property
+    def count(self):
+        return cached_count(self.queryset)
+
+    def encode_cursor(self, obj, direction):
+        return signing.dumps([direction, self.field_name, getattr(obj, self.field_name), obj.pk],
+                             salt=CURSOR_SALT, serializer=CursorSerializer, compress=True)
+
+    def decode_cursor(self, cursor):
+        """
+        Return the (direction, order value, pk) of `cursor`, or None if it is missing, invalid or
+        was made for a different ordering.
+        """
+        if not cursor:
+            return None
+        try:
+            direction, field_name, value, pk = signing.loads(cursor, salt=CURSOR_SALT, serializer=CursorSerializer)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        if direction not in ('next', 'previous') or field_name != self.field_name:
+            return None
+        return direction, value, pk
+
+    def _ordered(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return self.queryset.order_by(prefix + self.field_name, prefix + self.pk_name), descending
+
+    def _after(self, queryset, descending, value, pk):
+        lookup = 'lt' if descending else 'gt'
+        return queryset.filter(
+            Q(**{'%s__%s' % (self.field_name, lookup): value}) |
+            Q(**{self.field_name: value, '%s__%s' % (self.pk_name, lookup): pk})
+        )
+
+    def page(self, cursor=None):
+        """Return the page that `cursor` points to, or the first page."""
+        position = self.decode_cursor(cursor)
+        backwards = position is not None and position[0] == 'previous'
+        queryset, descending = self._ordered(reverse=backwards)
+        if position is not None:
+            queryset = self._after(queryset, descending, position[1], position[2])
+
+        # Fetch one extra object to find out whether there is a page beyond this one.
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+
+        if backwards:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        next_cursor = self.encode_cursor(object_list[-1], 'next') if has_next and object_list else None
+        previous_cursor = self.encode_cursor(object_list[0], 'previous') if has_previous and object_list else None
+        return KeysetPage(object_list, self, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Paginate a ListView with a KeysetPaginator whenever its queryset's ordering allows it, and cap the
+    page size that can be requested with 'paginate_by'. Requests for a numbered 'page' still use offset
+    pagination, with a cached count.
+    """
+    paginator_class = CachedCountPaginator
+    cursor_kwarg = 'cursor'
+    #: Largest number of objects that can be requested per page.
+    max_paginate_by = 3000
+
+    def get_paginate_by(self, queryset):
+        """
+        Paginate by specified value in querystring, or use default class property value.
+        """
+        try:
+            paginate_by = int(self.request.GET.get('paginate_by', self.paginate_by))
+        except ValueError:
+            return self.paginate_by
+        return min(max(paginate_by, 1), self.max_paginate_by)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.page_kwarg in self.kwargs or self.page_kwarg in self.request.GET or \
+                keyset_ordering(queryset) is None:
+            return super(KeysetPaginationMixin, self).paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
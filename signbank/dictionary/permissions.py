@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Cached lookups of users' object permissions (django-guardian) on datasets.
+
+A user's dataset permissions are resolved with two queries, and then kept on the user object for
+the rest of the request (like Django's ModelBackend does with `_perm_cache`) and in the cache for
+DATASET_PERMISSIONS_CACHE_TTL seconds. Changes to object permissions or group memberships bump a
+version number that is part of the cache keys, see signals.py.
+
+Use datasets_for_user() instead of get_objects_for_user(user, 'dictionary.view_dataset'), and
+has_dataset_perm() instead of checking `'view_dataset' in get_perms(user, dataset)`.
+"""
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from guardian.shortcuts import get_objects_for_user, get_perms
+
+from ..cache import new_version
+from .models import Dataset
+
+VERSION_KEY = 'dataset_permissions_version'
+
+
+def _version():
+    return cache.get_or_set(VERSION_KEY, new_version, None)
+
+
+def invalidate_dataset_permissions():
+    """Make every user's cached dataset permissions stale."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, new_version(), None)
+
+
+def _load_dataset_permissions(user):
+    content_type = ContentType.objects.get_for_model(Dataset)
+    permissions = defaultdict(set)
+    for object_permissions in (
+        UserObjectPermission.objects.filter(user=user, content_type=content_type),
+        GroupObjectPermission.objects.filter(group__user=user, content_type=content_type),
+    ):
+        for object_pk, codename in object_permissions.values_list('object_pk', 'permission__codename'):
+            permissions[int(object_pk)].add(codename)
+    return {dataset_id: frozenset(codenames) for dataset_id, codenames in permissions.items()}
+
+
+def dataset_permissions(user):
+    """
+    Return the object permissions `user` has been given on datasets, directly or through their groups,
+    as a dict of {dataset id: frozenset of permission codenames}.
+    """
+    version = _version()
+    cached = getattr(user, '_dataset_perm_cache', None)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    key = 'dataset_permissions:%s:%s' % (version, user.pk)
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = _load_dataset_permissions(user)
+        cache.set(key, permissions, settings.DATASET_PERMISSIONS_CACHE_TTL)
+    user._dataset_perm_cache = (version, permissions)
+    return permissions
+
+
+def datasets_for_user(user, codename='view_dataset'):
+    """
+    Return the datasets on which `user` has the permission `codename`, like
+    get_objects_for_user(user, 'dictionary.<codename>') does.
+    """
+    if not user.is_authenticated:
+        return get_objects_for_user(user, 'dictionary.%s' % codename, Dataset)
+    if user.is_superuser or user.has_perm('dictionary.%s' % codename):
+        return Dataset.objects.all()
+    return Dataset.objects.filter(pk__in=[
+        dataset_id for dataset_id, codenames in dataset_permissions(user).items() if codename in codenames
+    ])
+
+
+def has_dataset_perm(user, dataset, codename='view_dataset'):
+    """Whether `user` has the object permission `codename` on `dataset`, like `codename in get_perms(user, dataset)`."""
+    if not user.is_authenticated:
+        return codename in get_perms(user, dataset)
+    if not user.is_active:
+        return False
+    if user.is_superuser:
+        return True
+    return codename in dataset_permissions(user).get(dataset.pk, ())
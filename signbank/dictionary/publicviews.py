@@ -7,16 +7,19 @@ from django.db.models import Q, Prefetch
 from django.db.models.functions import Substr, Upper
 from django.templatetags.static import static
 from django.utils.translation import gettext as _
-from django.views.decorators.cache import cache_page
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
-from .models import Gloss, Dataset, SignLanguage, GlossRelation, Translation, GlossTranslations
+from .models import Gloss, Dataset, DatasetArtifact, SignLanguage
 from ..video.models import GlossVideo
 from .forms import GlossPublicSearchForm
 from .adminviews import serialize_glosses
+from .artifacts import dataset_artifact_response, public_ecv_glosses
+from .glosscache import public_gloss_context
+from .pagination import KeysetPaginationMixin
 
 
-class GlossListPublicView(ListView):
+class GlossListPublicView(KeysetPaginationMixin, ListView):
     model = Gloss
     template_name = 'dictionary/public_gloss_list.html'
     paginate_by = 20
@@ -87,33 +90,20 @@ class GlossDetailPublicView(DetailView):
     template_name = 'dictionary/public_gloss_detail.html'
     context_object_name = 'gloss'
 
+    def get_object(self, queryset=None):
+        # The gloss and the rest of the page's context come from the cache, see glosscache.py.
+        self.gloss_context = public_gloss_context(self.kwargs[self.pk_url_kwarg])
+        if self.gloss_context is None:
+            raise Http404(_("No %(verbose_name)s found matching the query") %
+                          {'verbose_name': Gloss._meta.verbose_name})
+        return self.gloss_context['gloss']
+
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
         context = super(GlossDetailPublicView, self).get_context_data(**kwargs)
-        gloss = context["gloss"]
-        context['translation_languages_and_translations'] = gloss.get_translations_for_translation_languages()
-        # GlossRelations for this gloss
-        context['glossrelations'] = GlossRelation.objects.filter(
-            source=gloss
-        ).prefetch_related('tags')
-        context['glossrelations_reverse'] = GlossRelation.objects.filter(
-            target=gloss
-        ).prefetch_related('tags')
-
-        # Create a meta description for the gloss.
-        context["metadesc"] = "{glosstxt}: {idgloss} [{lexicon}] / ".format(
-            glosstxt=_("Gloss"), idgloss=gloss, lexicon=gloss.dataset.public_name)
-        for x in context['translation_languages_and_translations']:
-            if x[1]:  # Show language name only if it has translations.
-                context["metadesc"] += "{lang}: {trans} / ".format(lang=str(x[0]), trans=str(x[1]))
-        context["metadesc"] += "{langtxt}: {lang} / {videotxt}: {videocount} / {notestxt}: {notes}".format(
-            langtxt=_("Sign language"), lang=gloss.dataset.signlanguage, videotxt=_("Videos"),
-            videocount=gloss.glossvideo_set.all().count(), notestxt=_("Notes"), notes=gloss.notes)
-        try:
-            context["first_video"] = gloss.glossvideo_set.first()
-        except (AttributeError, ValueError):
-            context["first_video"] = None
+        context.update(self.gloss_context)
         # Create og:image url for the gloss if the first glossvideo has a posterfile.
+        # The URL is not cached, since it may be a presigned URL that expires.
         try:
             context["ogimage"] = context["first_video"].posterfile.url
         except (AttributeError, ValueError):
@@ -121,23 +111,13 @@ class GlossDetailPublicView(DetailView):
 
         return context
 
-    def get_queryset(self):
-        qs = super().get_queryset()
-        qs = qs.filter(published=True)
-        # Make sure we only show GlossVideos that have 'is_public=True'
-        return qs.prefetch_related(Prefetch('glossvideo_set', queryset=GlossVideo.objects.filter(is_public=True)))
-
 
-@cache_page(60 * 15)
-def public_gloss_list_xml(self, dataset_id):
+def public_gloss_list_xml(request, dataset_id):
     """Return ELAN schema valid XML of public glosses and their translations."""
     # http://www.mpi.nl/tools/elan/EAFv2.8.xsd
     dataset = get_object_or_404(Dataset, id=dataset_id, is_public=True)
-
-    return serialize_glosses(dataset, Gloss.objects.filter(
-        dataset=dataset, published=True, exclude_from_ecv=False).prefetch_related(
-        Prefetch('translation_set', queryset=Translation.objects.filter(gloss__dataset=dataset)
-                 .select_related('keyword', 'language')),
-        Prefetch('glosstranslations_set', queryset=GlossTranslations.objects
-                 .filter(gloss__dataset=dataset).select_related('language')))
-                             )
+    # The ECV is built ahead of time, see artifacts.py. Until it has been, it is written on the fly.
+    response = dataset_artifact_response(request, dataset, DatasetArtifact.Kind.PUBLIC_ECV)
+    if response is None:
+        response = serialize_glosses(dataset, public_ecv_glosses(dataset))
+    return response
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Free text search and relation filters of glosses for the advanced search page.
+
+Instead of OR-ing icontains lookups over the gloss and a join to its translations' keywords,
+the searchable text of each gloss is kept in a GlossSearchDocument row. Its lower-cased
+`document` has a trigram index, so substring searches don't need to scan every gloss, and
+on Postgres its `search_vector` is used to rank the results.
+"""
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Exists, F, FloatField, OuterRef, Value
+
+from .models import Gloss, GlossSearchDocument, MorphologyDefinition, Relation, Translation
+
+#: Text search configuration for the search vector. 'simple' doesn't stem, which suits a mix of English and Māori.
+SEARCH_CONFIG = 'simple'
+
+
+def normalize_search_text(text):
+    return text.lower()
+
+
+def update_gloss_search_documents(gloss_ids):
+    """Create or rebuild the GlossSearchDocuments of the given glosses."""
+    gloss_ids = list(gloss_ids)
+    if not gloss_ids:
+        return
+
+    keywords = defaultdict(list)
+    translations = Translation.objects.filter(gloss_id__in=gloss_ids)\
+        .order_by('gloss_id', 'language_id', 'order')\
+        .values_list('gloss_id', 'keyword__text')
+    for gloss_id, keyword in translations:
+        keywords[gloss_id].append(keyword)
+
+    documents = []
+    for gloss_id, idgloss, idgloss_mi, notes in \
+            Gloss.objects.filter(pk__in=gloss_ids).values_list('pk', 'idgloss', 'idgloss_mi', 'notes'):
+        names = "\n".join(name for name in (idgloss, idgloss_mi) if name)
+        gloss_keywords = "\n".join(keywords[gloss_id])
+        notes = notes or ""
+        documents.append(GlossSearchDocument(
+            gloss_id=gloss_id,
+            names=names,
+            keywords=gloss_keywords,
+            notes=notes,
+            document=normalize_search_text("\n".join((names, gloss_keywords, notes))),
+        ))
+
+    GlossSearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['gloss'],
+        update_fields=['names', 'keywords', 'notes', 'document'],
+    )
+
+    if connection.vendor == 'postgresql':
+        GlossSearchDocument.objects.filter(gloss_id__in=gloss_ids).update(
+            search_vector=SearchVector('names', weight='A', config=SEARCH_CONFIG) +
+            SearchVector('keywords', weight='B', config=SEARCH_CONFIG) +
+            SearchVector('notes', weight='C', config=SEARCH_CONFIG)
+        )
+
+
+def search_glosses(queryset, text):
+    """
+    Filter glosses to those whose idgloss, idgloss_mi, notes or translation keywords contain `text`,
+    ignoring case.
+    """
+    return queryset.filter(search_document__document__contains=normalize_search_text(text))
+
+
+def annotate_search_rank(queryset, text):
+    """
+    Annotate glosses with `search_rank`, how well they match `text`. Names weigh more than keywords,
+    which weigh more than notes. Without Postgres full text search all glosses rank equally.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    query = SearchQuery(text, config=SEARCH_CONFIG)
+    return queryset.annotate(search_rank=SearchRank(F('search_document__search_vector'), query))
+
+
+def relation_filter(value):
+    """Glosses that are the source of a relation to a gloss whose idgloss contains `value`."""
+    return Exists(Relation.objects.filter(source=OuterRef('pk'), target__idgloss__icontains=value))
+
+
+def has_relation_filter(value):
+    """Glosses that are the source of a relation with the role `value`, or of any relation if `value` is 'all'."""
+    relations = Relation.objects.filter(source=OuterRef('pk'))
+    if value != 'all':
+        relations = relations.filter(role__exact=value)
+    return Exists(relations)
+
+
+def morpheme_filter(value):
+    """Glosses that have a morpheme whose idgloss contains `value`."""
+    return Exists(MorphologyDefinition.objects.filter(parent_gloss=OuterRef('pk'), morpheme__idgloss__icontains=value))
+
+
+def has_morpheme_of_type_filter(value):
+    """Glosses that have a morpheme with the role `value`."""
+    return Exists(MorphologyDefinition.objects.filter(parent_gloss=OuterRef('pk'), role__exact=value))
+
+
+#: Advanced search parameters whose filters are correlated EXISTS subqueries, by parameter name.
+#: Each takes the parameter's value and returns the condition to filter the glosses with.
+GLOSS_SUBQUERY_FILTERS = {
+    'relation': relation_filter,
+    'hasRelation': has_relation_filter,
+    'morpheme': morpheme_filter,
+    'hasMorphemeOfType': has_morpheme_of_type_filter,
+}
+
+
+def apply_subquery_filters(queryset, get):
+    """Filter glosses by each of the GLOSS_SUBQUERY_FILTERS that has a value in `get` (a QueryDict)."""
+    for name, gloss_filter in GLOSS_SUBQUERY_FILTERS.items():
+        if name in get and get[name] != '':
+            queryset = queryset.filter(gloss_filter(get[name]))
+    return queryset
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Search results for the prev/next navigation of the gloss detail page.
+
+The advanced search only stores a reference to its query in the session. The IDs of the
+matching glosses are looked up the first time the gloss detail page asks for them, and kept
+as a compact array in the cache under a hash of the normalised query. Each user keeps at most
+SEARCH_RESULTS_PER_USER of these, the least recently used being evicted first.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import QueryDict
+
+from .exports import gloss_search_queryset
+from .models import Gloss
+
+#: Parameters of the advanced search that don't change which glosses are found or their order.
+IGNORED_PARAMETERS = ('format', 'page', 'cursor', 'paginate_by')
+#: Parameters of the advanced search that change the order of the glosses, but don't filter them.
+ORDERING_PARAMETERS = ('order',)
+
+
+def normalize_search_query(get):
+    """Return the search parameters of `get` (a QueryDict) as a canonical query string."""
+    query = QueryDict(mutable=True)
+    for key in sorted(get):
+        if key in IGNORED_PARAMETERS:
+            continue
+        values = sorted(value for value in get.getlist(key) if value != '')
+        if values:
+            query.setlist(key, values)
+    return query.urlencode()
+
+
+def is_filtered_search(query):
+    """Whether the normalised `query` filters the glosses, rather than only listing all of them."""
+    return any(key not in ORDERING_PARAMETERS for key in QueryDict(query))
+
+
+def search_results_key(user, query):
+    return 'search_results:%s:%s' % (user.pk, hashlib.sha256(query.encode('utf-8')).hexdigest())
+
+
+def _user_index_key(user):
+    return 'search_results:%s' % user.pk
+
+
+def remember_search(request):
+    """
+    Store a reference to the search in `request` in the session, replacing the previous one.
+    Searches without any filters aren't remembered.
+    """
+    query = normalize_search_query(request.GET)
+    if not is_filtered_search(query):
+        request.session['search_results'] = None
+        return
+    request.session['search_results'] = {'key': search_results_key(request.user, query), 'query': query}
+
+
+def _store_ids(user, key, ids):
+    timeout = settings.SEARCH_RESULTS_TTL
+    index = [k for k in cache.get(_user_index_key(user), []) if k != key]
+    index.append(key)
+    evicted, index = index[:-settings.SEARCH_RESULTS_PER_USER], index[-settings.SEARCH_RESULTS_PER_USER:]
+    if evicted:
+        cache.delete_many(evicted)
+    cache.set_many({key: ids, _user_index_key(user): index}, timeout)
+
+
+def search_result_ids(request):
+    """
+    Return the IDs of the glosses found by the search remembered in the session, in search order,
+    as an array. The search is run when its results aren't in the cache yet.
+    """
+    search = request.session.get('search_results')
+    if not search:
+        return array('I')
+
+    key = search['key']
+    ids = cache.get(key)
+    if ids is None:
+        queryset = gloss_search_queryset(request.user, QueryDict(search['query']))
+        ids = array('I', queryset.values_list('pk', flat=True))
+    _store_ids(request.user, key, ids)
+    return ids
+
+
+def search_results(request):
+    """Return the glosses found by the search remembered in the session as a list of {id, gloss} dicts."""
+    ids = search_result_ids(request)
+    if not ids:
+        return []
+    idglosses = dict(Gloss.objects.filter(pk__in=ids).values_list('pk', 'idgloss'))
+    return [dict(id=pk, gloss=idglosses[pk]) for pk in ids if pk in idglosses]
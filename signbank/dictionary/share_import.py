@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+"""
+The commit of confirmed NZSL Share imports, in the background.
+
+Confirming an import queues a task that commits the rows of its ImportBatch NZSL_SHARE_IMPORT_CHUNK_SIZE
+at a time, which the runworker command runs, see taskqueue.py. Each chunk is committed in one transaction
+with the number of rows done, so an import that fails, or whose worker dies, resumes after the last chunk
+that was committed. The retrieval of the videos of the glosses of a chunk is queued as another task in
+the same transaction.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django_comments.models import Comment
+from signbank.tagging.models import Tag, TaggedItem
+
+from ..video.models import GlossVideo
+from .artifacts import mark_dataset_artifacts_stale
+from .models import FieldChoice, Gloss, GlossTranslations, ImportBatch, Language, ShareValidationAggregation
+from .search import update_gloss_search_documents
+from .taskqueue import enqueue
+
+User = get_user_model()
+
+#: Number of NZSL Share ids looked up per query.
+LOOKUP_BATCH_SIZE = 1000
+
+
+def glosses_by_share_id(share_ids):
+    """
+    Return a dict of NZSL Share id -> list of the glosses with that nzsl_share_id, annotated with whether
+    they have videos as `has_videos`. nzsl_share_id is not a reliable index, due to manual intervention,
+    so there can be several glosses with the same one.
+    """
+    share_ids = list({share_id for share_id in share_ids if share_id})
+    glosses = defaultdict(list)
+    for start in range(0, len(share_ids), LOOKUP_BATCH_SIZE):
+        for gloss in Gloss.objects.filter(nzsl_share_id__in=share_ids[start:start + LOOKUP_BATCH_SIZE])\
+                .annotate(has_videos=Exists(GlossVideo.objects.filter(gloss=OuterRef("pk")))):
+            glosses[gloss.nzsl_share_id].append(gloss)
+    return glosses
+
+
+def update_retrieval_videos(videos, gloss_data):
+    """ prep videos, illustrations and usage example for video retrieval """
+
+    gloss_pk = gloss_data["gloss"].pk
+    gloss_word = gloss_data["word"]
+
+    if gloss_data.get("videos", None):
+        video_url = gloss_data["videos"]
+        extension = video_url[-3:]
+        file_name = (
+            f"{gloss_pk}-{gloss_word}.{gloss_pk}_video.{extension}"
+        )
+
+        glossvideo = {
+            "url": video_url,
+            "file_name": file_name,
+            "gloss_pk": gloss_pk,
+            "video_type": "main",
+            "version": 0
+        }
+        videos.append(glossvideo)
+
+    if gloss_data.get("illustrations", None):
+        for i, video_url in enumerate(gloss_data["illustrations"].split("|")):
+            extension = video_url[-3:]
+            file_name = (
+                f"{gloss_pk}-{gloss_word}.{gloss_pk}_illustration_{i + 1}.{extension}"
+            )
+
+            glossvideo = {
+                "url": video_url,
+                "file_name": file_name,
+                "gloss_pk": gloss_pk,
+                "video_type": "main",
+                "version": i
+            }
+            videos.append(glossvideo)
+
+    if gloss_data.get("usage_examples", None):
+        for i, video_url in enumerate(gloss_data["usage_examples"].split("|")):
+            extension = video_url[-3:]
+            file_name = (
+                f"{gloss_pk}-{gloss_word}.{gloss_pk}_usageexample_{i + 1}.{extension}"
+            )
+
+            glossvideo = {
+                "url": video_url,
+                "file_name": file_name,
+                "gloss_pk": gloss_pk,
+                "video_type": f"finalexample{i + 1}",
+                "version": i
+            }
+            videos.append(glossvideo)
+
+
+class NZSLShareImport(object):
+    """Creates the glosses of rows of an NZSL Share CSV file in a dataset, with the lookups the rows share."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.language_en = Language.objects.get(name="English")
+        self.language_mi = Language.objects.get(name="Māori")
+        self.gloss_content_type = ContentType.objects.get_for_model(Gloss)
+        self.site = Site.objects.get_current()
+        self.comment_submit_date = datetime.datetime.now(tz=timezone.get_current_timezone())
+        self.semantic_fields_dict = dict(FieldChoice.objects.filter(
+            field="semantic_field"
+        ).values_list("english_name", "pk"))
+        self.signer_dict = {signer.english_name: signer for signer in FieldChoice.objects.filter(field="signer")}
+        self.existing_machine_values = set(FieldChoice.objects.values_list("machine_value", flat=True))
+        self.not_public_tag = Tag.objects.get(name="not public")
+        self.nzsl_share_tag = Tag.objects.get(name="nzsl-share")
+        self.import_user = User.objects.get(
+            username="nzsl_share_importer",
+            first_name="Importer",
+            last_name="NZSL Share",
+        )
+
+    def import_rows(self, rows, first_row_num=0):
+        """
+        Create the glosses of `rows`, and their translations, comments, semantic fields, tags and
+        validation aggregations. Returns the details of the videos to retrieve for them.
+        `first_row_num` is the number of the first of the rows in the whole file.
+        """
+        translations = []
+        comments = []
+        videos = []
+        new_glosses = {}
+        bulk_create_gloss = []
+        bulk_update_glosses = []
+        bulk_semantic_fields = []
+        bulk_tagged_items = []
+        contributors = set()
+        bulk_share_validation_aggregations = []
+        video_import_only_glosses_data = []
+
+        existing_glosses = glosses_by_share_id(gloss_data["id"] for gloss_data in rows)
+
+        for row_num, gloss_data in enumerate(rows, start=first_row_num):
+            # will iterate over these glosses again after bulk creating
+            # and to ensure we get the correct gloss_data for words that appear multiple
+            # times we'll use the row_num as the identifier for the gloss data
+
+            # if the gloss already exists at this point, it can only mean that
+            # it has no videos and we want to import videos for it
+            existing = existing_glosses.get(gloss_data["id"])
+            if existing:
+                if len(existing) == 1:
+                    gloss_data_copy = gloss_data.copy()
+                    gloss_data_copy["gloss"] = existing[0]
+                    video_import_only_glosses_data.append(gloss_data_copy)
+                continue
+
+            new_glosses[str(row_num)] = gloss_data
+            bulk_create_gloss.append(Gloss(
+                dataset=self.dataset,
+                nzsl_share_id=gloss_data["id"],
+                # need to make idgloss unique in dataset,
+                # but gloss word can appear in multiple rows, so
+                # idgloss will be updated to word:pk in second step
+                idgloss=f"{gloss_data['word']}_row{row_num}",
+                idgloss_mi=gloss_data.get("maori", None),
+                created_by=self.import_user,
+                updated_by=self.import_user,
+                exclude_from_ecv=True,
+            ))
+            contributors.add(gloss_data["contributor_username"])
+
+        bulk_created = Gloss.objects.bulk_create(bulk_create_gloss)
+
+        # Create new signers for contributors that do not exist as signers yet
+        create_signers = []
+        for contributor in contributors:
+            if contributor not in self.signer_dict:
+                new_machine_value = random.randint(0, 99999999)
+                while new_machine_value in self.existing_machine_values:
+                    new_machine_value = random.randint(0, 99999999)
+                self.existing_machine_values.add(new_machine_value)
+                create_signers.append(FieldChoice(
+                    field="signer",
+                    english_name=contributor,
+                    machine_value=new_machine_value
+                ))
+        new_signers = FieldChoice.objects.bulk_create(create_signers)
+        for signer in new_signers:
+            self.signer_dict[signer.english_name] = signer
+
+        for gloss in bulk_created:
+            word_en, row_num = gloss.idgloss.split("_row")
+            gloss_data = dict(new_glosses[row_num], gloss=gloss)
+
+            # get semantic fields for gloss_data topics
+            if gloss_data.get("topic_names", None):
+                gloss_topics = gloss_data["topic_names"].split("|")
+                # ignore all signs and All signs
+                cleaned_gloss_topics = [
+                    x for x in gloss_topics if x not in ["all signs", "All signs"]
+                ]
+                add_miscellaneous = False
+
+                for topic in cleaned_gloss_topics:
+                    if topic in self.semantic_fields_dict:
+                        bulk_semantic_fields.append(
+                            Gloss.semantic_field.through(
+                                gloss_id=gloss.id,
+                                fieldchoice_id=self.semantic_fields_dict[topic]
+                            )
+                        )
+                    else:
+                        # add the miscellaneous semantic field if a topic does not exist
+                        add_miscellaneous = True
+
+                if add_miscellaneous:
+                    bulk_semantic_fields.append(
+                        Gloss.semantic_field.through(
+                            gloss_id=gloss.id,
+                            fieldchoice_id=self.semantic_fields_dict["Miscellaneous"]
+                        )
+                    )
+
+            # create GlossTranslations for english and maori words
+            translations.append(GlossTranslations(
+                gloss=gloss,
+                language=self.language_en,
+                translations=gloss_data["word"],
+                translations_secondary=gloss_data.get("secondary", None)
+            ))
+            if gloss_data.get("maori", None):
+                # There is potentially several comma separated maori words
+                maori_words = gloss_data["maori"].split(", ")
+
+                # Update idgloss_mi using first maori word, then create translation
+                gloss.idgloss_mi = f"{maori_words[0]}:{gloss.pk}"
+
+                translation = GlossTranslations(
+                    gloss=gloss,
+                    language=self.language_mi,
+                    translations=maori_words[0]
+                )
+                if len(maori_words) > 1:
+                    translation.translations_secondary = ", ".join(maori_words[1:])
+
+                translations.append(translation)
+
+            # Prepare new idgloss and signer fields for bulk update
+            gloss.idgloss = f"{word_en}:{gloss.pk}"
+            gloss.signer = self.signer_dict[gloss_data["contributor_username"]]
+            bulk_update_glosses.append(gloss)
+
+            # Create comment for gloss_data notes
+            comments.append(Comment(
+                content_type=self.gloss_content_type,
+                object_pk=gloss.pk,
+                user_name=gloss_data.get("contributor_username", ""),
+                comment=gloss_data.get("notes", ""),
+                site=self.site,
+                is_public=False,
+                submit_date=self.comment_submit_date
+            ))
+            if gloss_data.get("sign_comments", None):
+                # create Comments for all gloss_data sign_comments
+                for comment in gloss_data["sign_comments"].split("|"):
+                    try:
+                        comment_content = comment.split(":")
+                        user_name = comment_content[0]
+                        comment_content = comment_content[1]
+                    except IndexError:
+                        comment_content = comment
+                        user_name = "Unknown"
+                    comments.append(Comment(
+                        content_type=self.gloss_content_type,
+                        object_pk=gloss.pk,
+                        user_name=user_name,
+                        comment=comment_content,
+                        site=self.site,
+                        is_public=False,
+                        submit_date=self.comment_submit_date
+                    ))
+
+            # Add ShareValidationAggregation
+            bulk_share_validation_aggregations.append(ShareValidationAggregation(
+                gloss=gloss,
+                agrees=int(gloss_data["agrees"]),
+                disagrees=int(gloss_data["disagrees"])
+            ))
+
+            # prep videos, illustrations and usage example for video retrieval
+            update_retrieval_videos(videos, gloss_data)
+
+            bulk_tagged_items.append(TaggedItem(
+                content_type=self.gloss_content_type,
+                object_id=gloss.pk,
+                tag=self.nzsl_share_tag
+
+            ))
+            bulk_tagged_items.append(TaggedItem(
+                content_type=self.gloss_content_type,
+                object_id=gloss.pk,
+                tag=self.not_public_tag
+
+            ))
+
+        # Bulk create entities related to the gloss, and bulk update the glosses' idgloss
+        Comment.objects.bulk_create(comments)
+        GlossTranslations.objects.bulk_create(translations)
+        Gloss.objects.bulk_update(bulk_update_glosses, ["idgloss", "idgloss_mi", "signer"])
+        Gloss.semantic_field.through.objects.bulk_create(bulk_semantic_fields)
+        TaggedItem.objects.bulk_create(bulk_tagged_items)
+        ShareValidationAggregation.objects.bulk_create(bulk_share_validation_aggregations)
+        # bulk_create() and bulk_update() don't send the signals that maintain the search documents
+        update_gloss_search_documents(gloss.pk for gloss in bulk_update_glosses)
+        mark_dataset_artifacts_stale([self.dataset.pk])
+
+        # Add the video-update only glosses
+        for video_import_gloss_data in video_import_only_glosses_data:
+            # prep videos, illustrations and usage example for video retrieval
+            update_retrieval_videos(videos, video_import_gloss_data)
+
+        return videos
+
+
+def queue_nzsl_share_import(batch):
+    """Queue the confirmed NZSL Share ImportBatch to be committed in the background."""
+    with transaction.atomic():
+        batch.status = ImportBatch.Status.QUEUED
+        batch.rows_total = len(batch.data["glosses_new"])
+        batch.save(update_fields=["status", "rows_total", "updated_at"])
+        enqueue("signbank.dictionary.share_import.run_nzsl_share_import_batch", {"batch_id": batch.pk})
+    return batch
+
+
+def run_nzsl_share_import_batch(batch_id):
+    """
+    Task that commits the queued NZSL Share ImportBatch `batch_id`. A running import is resumed, as its
+    task is only run again when its worker has timed out. Returns the status of the import.
+    """
+    with transaction.atomic():
+        batch = ImportBatch.objects.select_for_update(of=("self",))\
+            .select_related("dataset")\
+            .filter(pk=batch_id, kind=ImportBatch.Kind.NZSL_SHARE,
+                    status__in=[ImportBatch.Status.QUEUED, ImportBatch.Status.RUNNING])\
+            .first()
+        if batch is None:
+            return None
+        batch.status = ImportBatch.Status.RUNNING
+        batch.started_at = batch.started_at or timezone.now()
+        batch.save(update_fields=["status", "started_at", "updated_at"])
+    batch = run_nzsl_share_import(batch)
+    return {"status": batch.status, "rows_done": batch.rows_done, "error": batch.error}
+
+
+def run_nzsl_share_import(batch):
+    """Commit the rows of a claimed NZSL Share ImportBatch a chunk at a time, from where it was left off."""
+    rows = batch.data["glosses_new"]
+    chunk_size = settings.NZSL_SHARE_IMPORT_CHUNK_SIZE
+    try:
+        share_import = NZSLShareImport(batch.dataset)
+        while batch.rows_done < len(rows):
+            start = batch.rows_done
+            with transaction.atomic():
+                rows_done = ImportBatch.objects.select_for_update()\
+                    .values_list("rows_done", flat=True)\
+                    .get(pk=batch.pk)
+                if rows_done != start:
+                    # The import was taken for abandoned and resumed by another task run.
+                    return batch
+                videos = share_import.import_rows(rows[start:start + chunk_size], start)
+                if videos:
+                    enqueue("signbank.dictionary.tasks.retrieve_videos_for_glosses", {"video_details": videos})
+                batch.rows_done = min(len(rows), start + chunk_size)
+                batch.save(update_fields=["rows_done", "updated_at"])
+    except Exception as e:
+        batch.status = ImportBatch.Status.FAILED
+        batch.error = str(e)
+    else:
+        batch.status = ImportBatch.Status.DONE
+        batch.error = ""
+
+    batch.finished_at = timezone.now()
+    batch.save(update_fields=["status", "error", "finished_at", "updated_at"])
+    return batch
+
+
+def resume_nzsl_share_import(batch):
+    """Queue a failed NZSL Share ImportBatch again, to be resumed after the rows it has committed."""
+    with transaction.atomic():
+        batch.status = ImportBatch.Status.QUEUED
+        batch.error = ""
+        batch.finished_at = None
+        batch.save(update_fields=["status", "error", "finished_at", "updated_at"])
+        enqueue("signbank.dictionary.share_import.run_nzsl_share_import_batch", {"batch_id": batch.pk})
+    return batch
+
+
+def imported_glosses(batch):
+    """Return the glosses of the rows of the NZSL Share ImportBatch that have been committed so far."""
+    share_ids = [gloss_data["id"] for gloss_data in batch.data["glosses_new"][:batch.rows_done]]
+    return Gloss.objects.filter(nzsl_share_id__in=share_ids).order_by("pk")
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Signal receivers that keep denormalised data of the dictionary up to date."""
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.db.models import Q, QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from taggit.models import TaggedItem
+
+from ..video.models import GlossVideo
+from .artifacts import mark_dataset_artifacts_stale
+from .glosscache import invalidate_public_gloss_context
+from .models import (Dataset, DatasetArtifact, Gloss, GlossRelation, GlossTranslations, Keyword, PackageTombstone,
+                     Translation)
+from .permissions import invalidate_dataset_permissions
+from .search import update_gloss_search_documents
+from .tools import package_media_key
+
+
+@receiver(post_save, sender=Gloss)
+def update_search_document_for_gloss(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    update_gloss_search_documents([instance.pk])
+
+
+@receiver(post_save, sender=Gloss)
+@receiver(post_delete, sender=Gloss)
+def mark_dataset_artifacts_stale_for_gloss(sender, instance, raw=False, **kwargs):
+    # The ECV and CSV artifacts only contain fields of the glosses themselves, so changes to
+    # translations don't affect them.
+    if raw:
+        return
+    mark_dataset_artifacts_stale([instance.dataset_id])
+
+
+@receiver(post_delete, sender=Gloss)
+def create_package_tombstone_for_gloss(sender, instance, **kwargs):
+    PackageTombstone.objects.create(dataset_id=instance.dataset_id, kind=PackageTombstone.Kind.GLOSS,
+                                    key=str(instance.pk))
+
+
+@receiver(post_delete, sender=GlossVideo)
+def create_package_tombstone_for_glossvideo(sender, instance, **kwargs):
+    # GlossVideo.delete() clears the name of a file that other rows still use, it stays in the package then.
+    if not instance.videofile or not instance.dataset_id:
+        return
+    if instance.is_video():
+        kind = PackageTombstone.Kind.VIDEO
+    elif instance.is_image():
+        kind = PackageTombstone.Kind.IMAGE
+    else:
+        return
+    PackageTombstone.objects.create(dataset_id=instance.dataset_id, kind=kind,
+                                    key=package_media_key(instance.videofile.name))
+
+
+@receiver(post_delete, sender=DatasetArtifact)
+def delete_dataset_artifact_file(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
+
+
+@receiver(post_save, sender=GlossTranslations)
+@receiver(post_save, sender=Translation)
+def update_search_document_for_translation(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    update_gloss_search_documents([instance.gloss_id])
+
+
+@receiver(post_delete, sender=Translation)
+def update_search_document_for_deleted_translation(sender, instance, origin=None, **kwargs):
+    # Translations are also deleted when their Gloss (or its Dataset) is deleted. The Gloss row is
+    # still there at this point, so only translations deleted in their own right are handled here,
+    # otherwise a document would be created for a gloss that is about to go.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is not Translation:
+        return
+    update_gloss_search_documents([instance.gloss_id])
+
+
+@receiver(post_save, sender=Keyword)
+def update_search_documents_for_keyword(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    update_gloss_search_documents(
+        Translation.objects.filter(keyword=instance).values_list('gloss_id', flat=True).distinct()
+    )
+
+
+@receiver(post_save, sender=Gloss)
+@receiver(post_delete, sender=Gloss)
+def invalidate_public_gloss_context_for_gloss(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # The pages of related glosses show this gloss too.
+    related = GlossRelation.objects.filter(Q(source=instance) | Q(target=instance))\
+        .values_list('source_id', 'target_id')
+    invalidate_public_gloss_context([instance.pk] + [gloss_id for pair in related for gloss_id in pair])
+
+
+@receiver(post_save, sender=GlossTranslations)
+@receiver(post_delete, sender=GlossTranslations)
+@receiver(post_save, sender=Translation)
+@receiver(post_delete, sender=Translation)
+@receiver(post_save, sender=GlossVideo)
+@receiver(post_delete, sender=GlossVideo)
+def invalidate_public_gloss_context_for_gloss_content(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_public_gloss_context([instance.gloss_id])
+
+
+@receiver(post_save, sender=GlossRelation)
+@receiver(post_delete, sender=GlossRelation)
+def invalidate_public_gloss_context_for_relation(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_public_gloss_context([instance.source_id, instance.target_id])
+
+
+@receiver(m2m_changed, sender=TaggedItem)
+def invalidate_public_gloss_context_for_relation_tags(sender, instance, action, **kwargs):
+    if isinstance(instance, GlossRelation) and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_public_gloss_context([instance.source_id, instance.target_id])
+
+
+@receiver(post_save, sender=UserObjectPermission)
+@receiver(post_delete, sender=UserObjectPermission)
+@receiver(post_save, sender=GroupObjectPermission)
+@receiver(post_delete, sender=GroupObjectPermission)
+@receiver(post_delete, sender=Dataset)
+def invalidate_dataset_permissions_for_object_permission(sender, **kwargs):
+    invalidate_dataset_permissions()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_dataset_permissions_for_groups(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_dataset_permissions()
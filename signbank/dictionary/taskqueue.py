@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+A task queue in the database, for work that shouldn't hold up a web request, without a broker.
+
+enqueue() saves a Task with the dotted path of a function and its keyword arguments, and the runworker
+command calls it. A task enqueued in a transaction is only run if the transaction commits, and is
+saved along with the changes it follows up on. Failed tasks are retried up to max_attempts times,
+TASK_RETRY_DELAY seconds after the first failure and twice as long after each of the next ones.
+
+Tasks are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several workers can run at once. A task
+that has been running for TASK_TIMEOUT seconds is assumed to have lost its worker, and is started again.
+Tasks should be safe to run more than once.
+
+What the function returns is saved as the task's result, so it must be JSON serializable, like the
+keyword arguments. A function can also attach a `result` to the exception it raises.
+"""
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+def enqueue(name, kwargs=None, max_attempts=None, run_after=None):
+    """
+    Queue a call of the function at the dotted path `name` with the keyword arguments `kwargs`, which
+    must be JSON serializable. Returns the Task.
+    """
+    return Task.objects.create(
+        name=name,
+        kwargs=kwargs or {},
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+        run_after=run_after or timezone.now(),
+    )
+
+
+def claim_next_task():
+    """
+    Mark the queued Task that is due first as running and return it, or return None if there is nothing
+    to do. Timed out tasks are started again, or failed if they have no attempts left.
+    """
+    now = timezone.now()
+    timed_out = now - datetime.timedelta(seconds=settings.TASK_TIMEOUT)
+    tasks = Task.objects.select_for_update(skip_locked=True)\
+        .filter(Q(status=Task.Status.QUEUED, run_after__lte=now) |
+                Q(status=Task.Status.RUNNING, started_at__lt=timed_out))\
+        .order_by("run_after", "pk")
+    while True:
+        with transaction.atomic():
+            task = tasks.first()
+            if task is None:
+                return None
+            if task.status == Task.Status.RUNNING and task.attempts >= task.max_attempts:
+                task.status = Task.Status.FAILED
+                task.error = "Timed out"
+                task.finished_at = now
+                task.save(update_fields=["status", "error", "finished_at"])
+                continue
+            task.status = Task.Status.RUNNING
+            task.attempts += 1
+            task.started_at = now
+            task.save(update_fields=["status", "attempts", "started_at"])
+        return task
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt of a task that has failed `attempts` times."""
+    return settings.TASK_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def run_task(task):
+    """Call the function of a claimed Task, and queue it again if it fails and has attempts left."""
+    try:
+        function = import_string(task.name)
+        task.result = function(**task.kwargs)
+    except Exception as e:
+        task.error = str(e) or e.__class__.__name__
+        task.result = getattr(e, "result", None)
+        if task.attempts < task.max_attempts:
+            task.status = Task.Status.QUEUED
+            task.run_after = timezone.now() + datetime.timedelta(seconds=retry_delay(task.attempts))
+        else:
+            task.status = Task.Status.FAILED
+            task.finished_at = timezone.now()
+    else:
+        task.status = Task.Status.DONE
+        task.error = ""
+        task.finished_at = timezone.now()
+
+    task.save(update_fields=["status", "error", "result", "run_after", "finished_at"])
+    return task
+
+
+def retry_tasks(tasks):
+    """Queue the given failed Tasks to run again right away, with all of their attempts. Returns how many."""
+    return tasks.filter(status=Task.Status.FAILED).update(
+        status=Task.Status.QUEUED,
+        attempts=0,
+        run_after=timezone.now(),
+        finished_at=None,
+    )
+
+
+def delete_finished_tasks():
+    """Delete the Tasks that finished more than TASK_KEEP_DAYS ago. Returns the number of tasks deleted."""
+    finished_before = timezone.now() - datetime.timedelta(days=settings.TASK_KEEP_DAYS)
+    deleted, _ = Task.objects.filter(
+        status__in=[Task.Status.DONE, Task.Status.FAILED],
+        finished_at__lt=finished_before,
+    ).delete()
+    return deleted
@@ -1,14 +1,23 @@
-import boto3
-from tempfile import TemporaryDirectory
+import http.client
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import TypedDict, List
-from urllib.request import urlretrieve, build_opener, install_opener
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
 
+import boto3
 from django.conf import settings
-from django.db import connection
+from django.core.files import File
 
 from .models import FieldChoice, Gloss
+from .taskqueue import enqueue
 from ..video.models import GlossVideo
 
+#: HTTP statuses of NZSL Share responses that are worth trying the download again for.
+TRANSIENT_HTTP_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+#: Seconds before the second attempt of a download, doubled for each of the next ones.
+DOWNLOAD_RETRY_DELAY = 1
+
 
 class VideoDetail(TypedDict):
     url: str
@@ -18,36 +27,36 @@ class VideoDetail(TypedDict):
     version: int
 
 
-def move_glossvideo_to_valid_filepath(glossvideo):
-    """
-    Mimics the rename_file method on GlossVideo without changing the assigned filename to
-    include the video_type (would cause issues with uniqueness), but still adds the pk-folder into
-    the name.
+class VideoRetrievalError(Exception):
+    """Some videos could not be retrieved because of transient errors. `result` holds the outcome of each video."""
+
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
 
-    rename_file gives the file a new name of the format {glosspk}-{idgloss}_{videotype}_{pk}{ext}.
 
-    get_valid_name method on the GlossVideoStorage (non AWS S3 FileStorage) class splits the name between gloss_pk and idgloss,
-    then joins it back together as {gloss_pk}/{glosspk}-{idgloss}_{videotype}_{pk}{ext}, and
-    then joins that with glossvideo. So the required end result is
-    glossvideo/{gloss_pk}/{glosspk}-{idgloss}_{videotype}_{pk}{ext}
+def is_transient(error):
+    """Whether a failed download of a video could succeed if it is tried again."""
+    if isinstance(error, HTTPError):
+        return error.code in TRANSIENT_HTTP_STATUSES
+    return isinstance(error, (URLError, ConnectionError, TimeoutError, http.client.HTTPException))
 
-    In the GlossVideoStorage (non AWS S3 FileStorage) case we need to give get_valid_name our filename, which at this point looks like
-    /app/media/temp_dir/{glosspk}-{idgloss}_{unique_name}_{pk}{ext}, so we split at / and give
-    get_valid_name only the last bit.
 
-    This step is necessary because we create the videos in bulk, and usually the filename and path
-    are updated in the save() step.
+def download_video(video, save):
+    """
+    Download the video from NZSL Share and pass the response to `save`, which streams it into storage
+    and returns the name of the saved file. Transient failures are tried again, up to
+    NZSL_SHARE_DOWNLOAD_ATTEMPTS times.
     """
-    old_file = glossvideo.videofile
-    full_new_path = glossvideo.videofile.storage.get_valid_name(
-        glossvideo.videofile.name.split("/")[-1]
-    )
-    if not glossvideo.videofile.storage.exists(full_new_path):
-        # Save the file into the new path.
-        saved_file_path = glossvideo.videofile.storage.save(full_new_path, old_file)
-        # Set the actual file path to videofile.
-        glossvideo.videofile = saved_file_path
-    return glossvideo
+    request = Request(f"{settings.NZSL_SHARE_HOSTNAME}{video['url']}", headers={"Accept": "*/*"})
+    for attempt in range(1, settings.NZSL_SHARE_DOWNLOAD_ATTEMPTS + 1):
+        try:
+            with urlopen(request, timeout=settings.NZSL_SHARE_DOWNLOAD_TIMEOUT) as response:
+                return save(video, response)
+        except Exception as e:
+            if attempt == settings.NZSL_SHARE_DOWNLOAD_ATTEMPTS or not is_transient(e):
+                raise
+            time.sleep(DOWNLOAD_RETRY_DELAY * 2 ** (attempt - 1))
 
 
 def retrieve_videos_for_glosses(video_details: List[VideoDetail]):
@@ -58,79 +67,92 @@ def retrieve_videos_for_glosses(video_details: List[VideoDetail]):
     - url: url for the video file to be retrieved without the hostname
     - file_name: particular filename that has been created for video
     - gloss_pk: the pk of the gloss for which the GlossVideo is going to be created
-    - title
+    - video_type
     - version
+
+    Up to NZSL_SHARE_DOWNLOAD_WORKERS videos are downloaded at once. Each response is streamed
+    straight into a multipart upload to S3, or into the GlossVideo storage, without a local copy.
+    Videos that already have a GlossVideo with their file_name as its title are skipped, so the
+    retrieval can be run again after a failure.
+
+    Returns the outcome of each video. If any videos failed with transient errors, raises a
+    VideoRetrievalError with the outcomes instead, so that the task is retried for them.
     """
-    main_video_type = FieldChoice.objects.filter(field="video_type", english_name="main").first()
-    finalexample_1_video_type = FieldChoice.objects.filter(
-        field="video_type",
-        english_name="finalexample1"
-    ).first()
-    finalexample_2_video_type = FieldChoice.objects.filter(
-        field="video_type",
-        english_name="finalexample2"
-    ).first()
     video_type_map = {
-        "main": main_video_type,
-        "finalexample1": finalexample_1_video_type,
-        "finalexample2": finalexample_2_video_type
+        video_type.english_name: video_type
+        for video_type in FieldChoice.objects.filter(
+            field="video_type", english_name__in=["main", "finalexample1", "finalexample2"])
     }
-
-    temp_dir = TemporaryDirectory(dir=settings.MEDIA_ROOT)
-
-    s3 = boto3.client("s3")
-    s3_storage_used = settings.GLOSS_VIDEO_FILE_STORAGE == "storages.backends.s3boto3.S3Boto3Storage"
-
-    # Set headers for urlretrieve()
-    opener = build_opener()
-    opener.addheaders = [('Accept', '*/*')]
-    install_opener(opener)
-
-    # Batch up the list in case it is long
-    video_batches = [
-        video_details[i: i + settings.NZSL_SHARE_BATCH_SIZE]
-        for i in range(0, len(video_details), settings.NZSL_SHARE_BATCH_SIZE)
-    ]
-    for video_batch in video_batches:
-        videos_to_create = []
-        for video in video_batch:
-            retrieval_url = f"{settings.NZSL_SHARE_HOSTNAME}{video['url']}"
-            if s3_storage_used:
-                try:
-                    file, _ = urlretrieve(
-                        retrieval_url,
-                        video["file_name"]
-                    )
-                except FileNotFoundError as e:
-                    print(e)
-                    continue
-                s3.upload_file(
-                    file, settings.AWS_STORAGE_BUCKET_NAME, video["file_name"]
-                )
-            else:
-                file_name = f"{temp_dir.name}/{video['file_name']}"
-                file, _ = urlretrieve(
-                    retrieval_url,
-                    file_name
-                )
-
-            gloss = Gloss.objects.get(pk=video["gloss_pk"])
-
-            gloss_video = GlossVideo(
+    glosses = Gloss.objects.in_bulk({video["gloss_pk"] for video in video_details})
+    retrieved = set(GlossVideo.objects.filter(
+        gloss__in=glosses.keys(),
+        title__in=[video["file_name"] for video in video_details],
+    ).values_list("gloss_id", "title"))
+
+    if settings.GLOSS_VIDEO_FILE_STORAGE == "storages.backends.s3boto3.S3Boto3Storage":
+        # boto3 clients can be shared between threads
+        s3 = boto3.client("s3")
+
+        def save(video, response):
+            s3.upload_fileobj(response, settings.AWS_STORAGE_BUCKET_NAME, video["file_name"])
+            return video["file_name"]
+    else:
+        storage = GlossVideo._meta.get_field("videofile").storage
+
+        def save(video, response):
+            return storage.save(storage.get_valid_name(video["file_name"]), File(response))
+
+    outcomes = []
+    to_retrieve = []
+    for video in video_details:
+        outcome = {"file_name": video["file_name"], "gloss_pk": video["gloss_pk"]}
+        outcomes.append(outcome)
+        if video["gloss_pk"] not in glosses:
+            outcome["outcome"] = "gloss deleted"
+        elif (video["gloss_pk"], video["file_name"]) in retrieved:
+            outcome["outcome"] = "already retrieved"
+        else:
+            to_retrieve.append((video, outcome))
+
+    videos_to_create = []
+    with ThreadPoolExecutor(max_workers=settings.NZSL_SHARE_DOWNLOAD_WORKERS) as executor:
+        futures = {executor.submit(download_video, video, save): (video, outcome) for video, outcome in to_retrieve}
+        # The GlossVideos are created as the downloads finish, on this thread, which has the database connection.
+        for future in as_completed(futures):
+            video, outcome = futures[future]
+            try:
+                file_name = future.result()
+            except Exception as e:
+                outcome["outcome"] = "failed"
+                outcome["error"] = str(e)
+                # Permanent failures, eg. videos missing from NZSL Share, aren't tried again.
+                outcome["retry"] = is_transient(e)
+                continue
+            outcome["outcome"] = "retrieved"
+            outcome["saved_as"] = file_name
+            gloss = glosses[video["gloss_pk"]]
+            videos_to_create.append(GlossVideo(
                 gloss=gloss,
-                dataset=gloss.dataset,
-                videofile=file,
-                title=file,
+                dataset_id=gloss.dataset_id,
+                videofile=file_name,
+                title=video["file_name"],
                 version=video["version"],
                 is_public=False,
                 video_type=video_type_map.get(video["video_type"], None)
-            )
-
-            if not s3_storage_used:
-                gloss_video = move_glossvideo_to_valid_filepath(gloss_video)
-            videos_to_create.append(gloss_video)
-
-        GlossVideo.objects.bulk_create(videos_to_create, ignore_conflicts=True)
-
-    temp_dir.cleanup()
-    connection.close()
+            ))
+            if len(videos_to_create) >= settings.NZSL_SHARE_BATCH_SIZE:
+                GlossVideo.objects.bulk_create(videos_to_create)
+                videos_to_create = []
+    GlossVideo.objects.bulk_create(videos_to_create)
+    # bulk_create() skips GlossVideo.save(), which queues the recording of new files in the media manifest.
+    retrieved_files = [outcome["saved_as"] for outcome in outcomes if outcome["outcome"] == "retrieved"]
+    if retrieved_files:
+        enqueue("signbank.video.tasks.record_media_manifest", {"names": retrieved_files})
+
+    failed = [outcome for outcome in outcomes if outcome.get("retry")]
+    if failed:
+        raise VideoRetrievalError(
+            "Failed to retrieve %d of %d videos: %s" % (
+                len(failed), len(outcomes), "; ".join("%(file_name)s: %(error)s" % outcome for outcome in failed)),
+            outcomes)
+    return outcomes
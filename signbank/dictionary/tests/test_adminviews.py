@@ -4,6 +4,7 @@ from __future__ import unicode_literals
 import csv
 import datetime
 import io
+import xml.etree.ElementTree as ElementTree
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -76,6 +77,35 @@ class GlossListViewTestCase(TestCase):
         self.assertEqual(response.headers['Content-Type'], 'text/csv; charset=utf-8')
         self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename="dictionary-export.csv"')
 
+    def test_get_csv_is_streamed(self):
+        """Tests that the standard CSV export is streamed, with one row per gloss after the headers"""
+        permission = Permission.objects.get(codename='export_csv')
+        self.user.user_permissions.add(permission)
+        self.user.save()
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        assign_perm('dictionary.view_dataset', self.user, dataset)
+        english_language = Language.objects.create(name="English", language_code_2char="EN",
+                                                   language_code_3char="eng")
+        testgloss = Gloss.objects.create(idgloss="testgloss", dataset=dataset, created_by=self.user,
+                                         updated_by=self.user)
+        GlossTranslations.objects.create(gloss=testgloss, language=english_language,
+                                         translations="test gloss, testing")
+        Gloss.objects.create(idgloss="othergloss", dataset=dataset, created_by=self.user, updated_by=self.user)
+
+        response = self.client.get(reverse('dictionary:admin_gloss_list'), {'format': 'CSV-standard'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        content = b"".join(response.streaming_content).decode('utf-8')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(len(rows), 3)
+        headers = rows[0]
+        self.assertEqual(headers[:4], ["id", "dataset", "variant_number", "gloss_main"])
+        rows_by_id = {row[0]: row for row in rows[1:]}
+        self.assertEqual(rows_by_id[str(testgloss.pk)][1], "testdataset")
+        self.assertEqual(rows_by_id[str(testgloss.pk)][3], "test gloss, testing")
+
     def test_get_ready_for_validation_csv(self):
         """
         Tests that a CSV file can be successfully downloaded containing glosses that are
@@ -303,7 +333,7 @@ class GlossListViewTestCase(TestCase):
             'attachment; filename="validation-results-export.csv"',
         )
 
-        content = response.content.decode('utf-8')
+        content = b"".join(response.streaming_content).decode('utf-8')
         cvs_reader = csv.reader(io.StringIO(content))
         body = list(cvs_reader)
         self.assertEqual(len(body), 3)
@@ -602,3 +632,41 @@ class GlossListTagFilterTestCase(TestCase):
         self.assertIn(self.gloss_b_only.pk, gloss_ids)
         self.assertNotIn(self.gloss_a_only.pk, gloss_ids)
         self.assertNotIn(self.gloss_both.pk, gloss_ids)
+
+
+class GlossListXmlTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage, is_public=True)
+        self.gloss = Gloss.objects.create(idgloss="test & <gloss>", idgloss_mi="whakamātautau", dataset=self.dataset,
+                                          published=True, created_by=self.user, updated_by=self.user)
+        self.unpublished = Gloss.objects.create(idgloss="unpublished", dataset=self.dataset, created_by=self.user,
+                                                updated_by=self.user)
+        Gloss.objects.create(idgloss="excluded", dataset=self.dataset, exclude_from_ecv=True, published=True,
+                             created_by=self.user, updated_by=self.user)
+
+    def get_entries(self, url_name):
+        response = self.client.get(reverse(url_name, kwargs={"dataset_id": self.dataset.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/xml")
+        root = ElementTree.fromstring(b"".join(response.streaming_content))
+        vocabulary = root.find("CONTROLLED_VOCABULARY")
+        self.assertEqual(vocabulary.get("CV_ID"), "signbank-dataset-%s" % self.dataset.pk)
+        return {
+            entry.get("CVE_ID"): [(value.get("LANG_REF"), value.text) for value in entry.findall("CVE_VALUE")]
+            for entry in vocabulary.findall("CV_ENTRY_ML")
+        }
+
+    def test_gloss_list_xml(self):
+        with self.assertNumQueries(2):
+            entries = self.get_entries("dictionary:gloss_list_xml")
+        self.assertEqual(entries, {
+            "glossid%s" % self.gloss.pk: [("eng", "test & <gloss>"), ("mri", "whakamātautau")],
+            "glossid%s" % self.unpublished.pk: [("eng", "unpublished"), ("mri", None)],
+        })
+
+    def test_public_gloss_list_xml(self):
+        entries = self.get_entries("dictionary:public_gloss_list_xml")
+        self.assertEqual(list(entries), ["glossid%s" % self.gloss.pk])
+
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from signbank.cache import TwoTierCache, new_version
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-shared'},
+}
+
+
+def worker_cache(name):
+    """A TwoTierCache as it would be in a separate process: with its own L1, and the same L2."""
+    return TwoTierCache(name, {'OPTIONS': {'L2': 'shared', 'L1_TIMEOUT': 30, 'L1_COUNTER_TIMEOUT': 0}})
+
+
+@override_settings(CACHES=CACHES)
+class TwoTierCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.worker1 = worker_cache('test-worker-1')
+        self.worker2 = worker_cache('test-worker-2')
+        for cache in (self.worker1, self.worker2):
+            cache._l1.clear()
+        caches['shared'].clear()
+
+    def test_get_and_set(self):
+        stats1 = self.worker1.stats()
+        stats2 = self.worker2.stats()
+        self.assertIsNone(self.worker1.get('key'))
+        self.worker1.set('key', 'value')
+        self.assertEqual(self.worker1.get('key'), 'value')
+        self.assertEqual(caches['shared'].get('key'), 'value')
+        # The other worker finds it in the L2, and from then on in its own L1.
+        self.assertEqual(self.worker2.get('key'), 'value')
+        self.assertEqual(self.worker2.get('key'), 'value')
+
+        self.assertEqual(self.worker1.stats(), {
+            'l1_hits': stats1['l1_hits'] + 1, 'l2_hits': stats1['l2_hits'], 'misses': stats1['misses'] + 1})
+        self.assertEqual(self.worker2.stats(), {
+            'l1_hits': stats2['l1_hits'] + 1, 'l2_hits': stats2['l2_hits'] + 1, 'misses': stats2['misses']})
+
+    def test_version_keys_reach_other_workers(self):
+        self.assertEqual(self.worker1.get_or_set('version', 1, None), 1)
+        self.assertEqual(self.worker2.get_or_set('version', 1, None), 1)
+
+        self.assertEqual(self.worker1.incr('version'), 2)
+
+        self.assertEqual(self.worker2.get('version'), 2)
+        self.assertEqual(self.worker1.get('version'), 2)
+
+    def test_version_bump_keeps_other_values_in_l1(self):
+        self.worker1.set('key', 'value')
+        self.assertEqual(self.worker2.get('key'), 'value')
+        self.worker1.get_or_set('version', 1, None)
+
+        self.worker1.incr('version')
+
+        stats = self.worker2.stats()
+        self.assertEqual(self.worker2.get('key'), 'value')
+        self.assertEqual(self.worker2.stats()['l1_hits'], stats['l1_hits'] + 1)
+
+    def test_delete(self):
+        self.worker1.set('key', 'value')
+
+        self.worker1.delete('key')
+
+        self.assertIsNone(self.worker1.get('key'))
+        self.assertFalse(caches['shared'].has_key('key'))
+
+    def test_new_version_is_not_reused(self):
+        self.worker1.set('version', new_version(), None)
+        bumped = self.worker1.incr('version')
+        # The key is culled and started again
+        self.worker1.delete('version')
+        self.assertGreater(self.worker1.get_or_set('version', new_version, None), bumped)
+
+    def test_add(self):
+        self.assertTrue(self.worker1.add('key', 'value'))
+        self.assertFalse(self.worker2.add('key', 'other value'))
+        self.assertEqual(self.worker2.get('key'), 'value')
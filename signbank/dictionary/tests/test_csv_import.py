@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 
 import copy
 import csv
+import datetime
 import random
 import uuid
 from unittest import mock
@@ -11,25 +12,120 @@ from django.conf import settings
 from django.contrib.auth.models import Permission, User
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django_comments import get_model as comments_get_model
 from guardian.shortcuts import assign_perm
 
+from signbank.dictionary.csv_import import import_batch_session_key
 from signbank.dictionary.models import (
     Dataset,
     FieldChoice,
     Gloss,
+    ImportBatch,
     Language,
     ManualValidationAggregation,
     SignLanguage,
+    Task,
     ValidationRecord,
 )
+from signbank.dictionary.share_import import NZSLShareImport, run_nzsl_share_import_batch
+from signbank.dictionary.taskqueue import claim_next_task, run_task
 from signbank.tagging.models import Tag
 
 from signbank.video.models import GlossVideo
 
 
+def stage_import_batch(client, user, kind, data, dataset=None):
+    """Store `data` as the rows of the preview of the import of `kind` by `user`, logged in with `client`."""
+    batch = ImportBatch.objects.create(kind=kind, created_by=user, dataset=dataset, data=data)
+    session = client.session
+    session[import_batch_session_key(kind)] = batch.pk
+    session.save()
+    return batch
+
+
+class GlossCSVImportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        self.user.user_permissions.add(Permission.objects.get(codename='import_csv'))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        # Migrations have id=1 already
+        self.signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage",
+                                                        language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=self.signlanguage)
+        assign_perm('view_dataset', self.user, self.dataset)
+        self.existing = Gloss.objects.create(dataset=self.dataset, idgloss="existing:1",
+                                             created_by=self.user, updated_by=self.user)
+
+    def _upload(self, rows):
+        content = "idgloss,idgloss_mi\n" + "".join("%s\n" % ",".join(row) for row in rows)
+        file = SimpleUploadedFile(content=content.encode("utf-8"), name="glosses.csv",
+                                  content_type="text/csv")
+        return self.client.post(reverse('dictionary:import_gloss_csv'),
+                                {"dataset": self.dataset.pk, "file": file}, format="multipart")
+
+    def test_import_view_sorts_new_and_existing_glosses(self):
+        """Existing glosses are listed apart, and an idgloss repeated in the file is only added once."""
+        response = self._upload([("new:1", "hou:1"), ("existing:1", ""), ("new:2",), ("new:1", "hou:2"), ("",)])
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([self.existing], response.context["glosses_exists"])
+        batch = ImportBatch.objects.get(pk=self.client.session[import_batch_session_key(ImportBatch.Kind.GLOSS)])
+        self.assertEqual(self.dataset, batch.dataset)
+        self.assertListEqual([["new:1", "hou:1"], ["new:2"]], batch.data["glosses_new"])
+
+    def test_import_view_looks_up_existing_glosses_in_bulk(self):
+        """The number of queries doesn't grow with the number of rows."""
+        rows = [("new:%s" % i, "hou:%s" % i) for i in range(50)]
+        # Each upload replaces the ImportBatch of the one before.
+        self._upload(rows[:2])
+        with CaptureQueriesContext(connection) as few:
+            self._upload(rows[:2])
+        with CaptureQueriesContext(connection) as many:
+            self._upload(rows)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_confirmation_view_confirm_gloss_creation(self):
+        """The glosses of the import are created, except those that exist by now."""
+        batch = stage_import_batch(self.client, self.user, ImportBatch.Kind.GLOSS, {
+            "glosses_new": [["new:1", "hou:1"], ["new:2"], ["existing:1", "hou:3"]]}, dataset=self.dataset)
+        response = self.client.post(reverse('dictionary:confirm_import_gloss_csv'), {"confirm": True})
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([("new:1", "hou:1"), ("new:2", None)], response.context["glosses_added"])
+        self.assertEqual("hou:1", Gloss.objects.get(dataset=self.dataset, idgloss="new:1").idgloss_mi)
+        self.assertTrue(Gloss.objects.filter(dataset=self.dataset, idgloss="new:2").exists())
+        self.assertEqual(3, Gloss.objects.filter(dataset=self.dataset).count())
+        self.assertNotIn(import_batch_session_key(ImportBatch.Kind.GLOSS), self.client.session.keys())
+        self.assertFalse(ImportBatch.objects.filter(pk=batch.pk).exists())
+
+    def test_confirmation_view_expired_import(self):
+        """Confirming an import that has expired, or a second time, asks for the file again."""
+        stage_import_batch(self.client, self.user, ImportBatch.Kind.GLOSS, {
+            "glosses_new": [["new:1", "hou:1"]]}, dataset=self.dataset)
+        self.client.post(reverse('dictionary:confirm_import_gloss_csv'), {"confirm": True})
+
+        response = self.client.post(reverse('dictionary:confirm_import_gloss_csv'), {"confirm": True})
+        self.assertRedirects(response, reverse('dictionary:import_gloss_csv'), fetch_redirect_response=False)
+        self.assertEqual(1, Gloss.objects.filter(dataset=self.dataset, idgloss="new:1").count())
+
+    def test_expired_import_batches_are_deleted(self):
+        """Import batches older than IMPORT_BATCH_MAX_AGE are deleted when the next import is previewed."""
+        other_user = User.objects.create_user(username="other", email=None, password="other")
+        expired = ImportBatch.objects.create(kind=ImportBatch.Kind.GLOSS, created_by=other_user,
+                                             dataset=self.dataset, data={"glosses_new": []})
+        ImportBatch.objects.filter(pk=expired.pk).update(
+            created_at=expired.created_at - datetime.timedelta(seconds=settings.IMPORT_BATCH_MAX_AGE + 1))
+        fresh = ImportBatch.objects.create(kind=ImportBatch.Kind.GLOSS, created_by=other_user,
+                                           dataset=self.dataset, data={"glosses_new": []})
+        self._upload([("new:1", "hou:1")])
+        self.assertFalse(ImportBatch.objects.filter(pk=expired.pk).exists())
+        self.assertTrue(ImportBatch.objects.filter(pk=fresh.pk).exists())
+
+
 class ShareCSVImportTestCase(TestCase):
     def setUp(self):
         # Create user and add permissions
@@ -128,9 +224,10 @@ class ShareCSVImportTestCase(TestCase):
             format="multipart"
         )
         self.assertEqual(response.status_code, 200)
-        session = self.client.session
-        self.assertEqual(self.dataset.pk, session["dataset_id"])
-        self.assertListEqual([self._csv_content], session["glosses_new"])
+        batch = ImportBatch.objects.get(
+            pk=self.client.session[import_batch_session_key(ImportBatch.Kind.NZSL_SHARE)])
+        self.assertEqual(self.dataset, batch.dataset)
+        self.assertListEqual([self._csv_content], batch.data["glosses_new"])
 
     def test_share_ids_existing_on_glosses_with_videos_are_skipped(self):
         """
@@ -167,9 +264,10 @@ class ShareCSVImportTestCase(TestCase):
             format="multipart"
         )
         self.assertEqual(response.status_code, 200)
-        session = self.client.session
-        self.assertEqual(self.dataset.pk, session["dataset_id"])
-        self.assertListEqual([csv_content[0]], session["glosses_new"])
+        batch = ImportBatch.objects.get(
+            pk=self.client.session[import_batch_session_key(ImportBatch.Kind.NZSL_SHARE)])
+        self.assertEqual(self.dataset, batch.dataset)
+        self.assertListEqual([csv_content[0]], batch.data["glosses_new"])
         self.assertListEqual([csv_content[1]], response.context["skipped_existing_glosses"])
 
     def test_share_ids_existing_on_glosses_with_no_videos_have_their_videos_reimported(self):
@@ -197,10 +295,11 @@ class ShareCSVImportTestCase(TestCase):
             format="multipart"
         )
         self.assertEqual(response.status_code, 200)
-        session = self.client.session
-        self.assertEqual(self.dataset.pk, session["dataset_id"])
+        batch = ImportBatch.objects.get(
+            pk=self.client.session[import_batch_session_key(ImportBatch.Kind.NZSL_SHARE)])
+        self.assertEqual(self.dataset, batch.dataset)
         with self.assertRaises(AssertionError):
-            self.assertListEqual([csv_content[0]], session["glosses_new"])
+            self.assertListEqual([csv_content[0]], batch.data["glosses_new"])
         with self.assertRaises(AssertionError):
             self.assertListEqual([csv_content[1]], response.context["skipped_existing_glosses"])
 
@@ -232,9 +331,10 @@ class ShareCSVImportTestCase(TestCase):
             format="multipart"
         )
         self.assertEqual(response.status_code, 200)
-        session = self.client.session
-        self.assertEqual(self.dataset.pk, session["dataset_id"])
-        self.assertListEqual([csv_content[0]], session["glosses_new"])
+        batch = ImportBatch.objects.get(
+            pk=self.client.session[import_batch_session_key(ImportBatch.Kind.NZSL_SHARE)])
+        self.assertEqual(self.dataset, batch.dataset)
+        self.assertListEqual([csv_content[0]], batch.data["glosses_new"])
         self.assertListEqual([csv_content[1]], response.context["skipped_existing_glosses"])
 
     def test_confirmation_view_confirm_gloss_creation(self):
@@ -252,21 +352,22 @@ class ShareCSVImportTestCase(TestCase):
 
         csv_content = self._csv_content
         glosses = [csv_content]
-        s = self.client.session
-        s.update({
-            "dataset_id": self.dataset.pk,
-            "glosses_new": glosses
-        })
-        s.save()
-        with mock.patch(
-                'signbank.dictionary.csv_import.retrieve_videos_for_glosses') as mock_tasks:
-            mock_tasks.return_value = None
-            response = self.client.post(
-                reverse("dictionary:confirm_import_nzsl_share_gloss_csv"),
-                {"confirm": True}
-            )
-            mock_tasks.assert_called_once()
-        self.assertEqual(response.status_code, 200)
+        batch = stage_import_batch(self.client, self.user, ImportBatch.Kind.NZSL_SHARE, {"glosses_new": glosses},
+                                   dataset=self.dataset)
+        response = self.client.post(
+            reverse("dictionary:confirm_import_nzsl_share_gloss_csv"),
+            {"confirm": True}
+        )
+        self.assertRedirects(response, reverse("dictionary:nzsl_share_import_progress",
+                                               kwargs={"batch_id": batch.pk}))
+        # The glosses are added in the background
+        self.assertFalse(Gloss.objects.filter(dataset=self.dataset).exists())
+        task = run_task(claim_next_task())
+        self.assertEqual("signbank.dictionary.share_import.run_nzsl_share_import_batch", task.name)
+        self.assertEqual({"batch_id": batch.pk}, task.kwargs)
+        self.assertEqual({"status": "done", "rows_done": 1, "error": ""}, task.result)
+        batch.refresh_from_db()
+        self.assertEqual(ImportBatch.Status.DONE, batch.status)
 
         maori_words = csv_content['maori'].split(', ')
 
@@ -329,19 +430,81 @@ class ShareCSVImportTestCase(TestCase):
             tags__name=share_tag.name
         ).distinct()
         self.assertQuerySetEqual(tagged_glosses, gloss_qs)
-        # There should be no gloss videos at this point because we have mocked the task to
-        # create them
+        # There should be no gloss videos at this point, their retrieval is queued as a task
         self.assertEqual(gloss.glossvideo_set.count(), 0)
+        video_details = Task.objects.get(name="signbank.dictionary.tasks.retrieve_videos_for_glosses")\
+            .kwargs["video_details"]
+        self.assertCountEqual(
+            [csv_content["videos"], csv_content["illustrations"], csv_content["usage_examples"]],
+            [video["url"] for video in video_details])
+        self.assertEqual({gloss.pk}, {video["gloss_pk"] for video in video_details})
+
+        response = self.client.get(reverse("dictionary:nzsl_share_import_progress",
+                                           kwargs={"batch_id": batch.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerySetEqual(response.context["glosses_added"], gloss_qs)
+
+    @override_settings(NZSL_SHARE_IMPORT_CHUNK_SIZE=2)
+    def test_failed_import_resumes_after_the_committed_chunks(self):
+        """The rows are committed in chunks, and a failed import is resumed after the last committed chunk."""
+        Tag.objects.create(name="not public")
+        glosses = [dict(self._csv_content, id=str(share_id), word=f"Test{share_id}") for share_id in range(5)]
+        batch = stage_import_batch(self.client, self.user, ImportBatch.Kind.NZSL_SHARE, {"glosses_new": glosses},
+                                   dataset=self.dataset)
+        self.client.post(reverse("dictionary:confirm_import_nzsl_share_gloss_csv"), {"confirm": True})
+
+        import_rows = NZSLShareImport.import_rows
+
+        def fail_on_third_chunk(share_import, rows, first_row_num=0):
+            if first_row_num == 4:
+                raise RuntimeError("Connection lost")
+            return import_rows(share_import, rows, first_row_num)
+
+        with mock.patch.object(NZSLShareImport, "import_rows", fail_on_third_chunk):
+            run_nzsl_share_import_batch(batch.pk)
+        batch.refresh_from_db()
+        self.assertEqual(ImportBatch.Status.FAILED, batch.status)
+        self.assertEqual("Connection lost", batch.error)
+        self.assertEqual(4, batch.rows_done)
+        self.assertEqual(4, Gloss.objects.filter(dataset=self.dataset).count())
+        # The video retrieval of the committed chunks is queued, 3 videos per row
+        retrieval_tasks = Task.objects.filter(name="signbank.dictionary.tasks.retrieve_videos_for_glosses")
+        self.assertEqual([6, 6], [len(task.kwargs["video_details"]) for task in retrieval_tasks.order_by("pk")])
+
+        status = self.client.get(reverse("dictionary:nzsl_share_import_status", kwargs={"batch_id": batch.pk}))
+        self.assertEqual({"status": "failed", "progress": 80, "rows_done": 4, "rows_total": 5},
+                         {key: status.json()[key] for key in ("status", "progress", "rows_done", "rows_total")})
+
+        response = self.client.post(reverse("dictionary:nzsl_share_import_progress", kwargs={"batch_id": batch.pk}),
+                                    {"resume": True})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(2, Task.objects.filter(name="signbank.dictionary.share_import.run_nzsl_share_import_batch")
+                         .count())
+        run_nzsl_share_import_batch(batch.pk)
+        batch.refresh_from_db()
+        self.assertEqual(ImportBatch.Status.DONE, batch.status)
+        self.assertEqual(5, batch.rows_done)
+        self.assertEqual(3, retrieval_tasks.count())
+        self.assertCountEqual([str(share_id) for share_id in range(5)],
+                              Gloss.objects.filter(dataset=self.dataset).values_list("nzsl_share_id", flat=True))
+
+    def test_interrupted_import_is_resumed_by_the_next_worker(self):
+        """The task of a running import that has timed out resumes it, and a finished import isn't run again."""
+        Tag.objects.create(name="not public")
+        batch = stage_import_batch(self.client, self.user, ImportBatch.Kind.NZSL_SHARE,
+                                   {"glosses_new": [self._csv_content]}, dataset=self.dataset)
+        self.client.post(reverse("dictionary:confirm_import_nzsl_share_gloss_csv"), {"confirm": True})
+        ImportBatch.objects.filter(pk=batch.pk).update(status=ImportBatch.Status.RUNNING)
+
+        self.assertEqual("done", run_nzsl_share_import_batch(batch.pk)["status"])
+        self.assertIsNone(run_nzsl_share_import_batch(batch.pk))
+        self.assertEqual(1, Gloss.objects.filter(dataset=self.dataset).count())
 
     def test_confirmation_view_cancel_gloss_creation(self):
         csv_content = self._csv_content
         glosses = [csv_content]
-        s = self.client.session
-        s.update({
-            "dataset_id": self.dataset.pk,
-            "glosses_new": glosses
-        })
-        s.save()
+        stage_import_batch(self.client, self.user, ImportBatch.Kind.NZSL_SHARE, {"glosses_new": glosses},
+                           dataset=self.dataset)
 
         response = self.client.post(
             reverse("dictionary:confirm_import_nzsl_share_gloss_csv"),
@@ -349,9 +512,8 @@ class ShareCSVImportTestCase(TestCase):
         )
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse("dictionary:import_nzsl_share_gloss_csv"))
-        new_session = self.client.session
-        self.assertNotIn("dataset_id", new_session.keys())
-        self.assertNotIn("glosses_new", new_session.keys())
+        self.assertNotIn(import_batch_session_key(ImportBatch.Kind.NZSL_SHARE), self.client.session.keys())
+        self.assertFalse(ImportBatch.objects.exists())
 
     def test_confirmation_view_no_post_method(self):
         """Test that using GET redirects to import view"""
@@ -574,10 +736,11 @@ class QualtricsCSVImportTestCase(TestCase):
             format="multipart"
         )
         self.assertEqual(response.status_code, 200)
-        session = self.client.session
-        self.assertListEqual(expected_validation_records, session["validation_records"])
-        self.assertListEqual(["1", "2", "3"], session["question_numbers"])
-        self.assertDictEqual({"1": 1, "2": 2, "3": 3}, session["question_glossvideo_map"])
+        batch = ImportBatch.objects.get(
+            pk=self.client.session[import_batch_session_key(ImportBatch.Kind.QUALTRICS)])
+        self.assertListEqual(expected_validation_records, batch.data["validation_records"])
+        self.assertListEqual(["1", "2", "3"], batch.data["question_numbers"])
+        self.assertDictEqual({"1": 1, "2": 2, "3": 3}, batch.data["question_glossvideo_map"])
 
     def test_confirmation_view_confirm_gloss_creation(self):
         """
@@ -585,14 +748,12 @@ class QualtricsCSVImportTestCase(TestCase):
         for a gloss.
         """
         csv_content = self._csv_content
-        s = self.client.session
-        s.update({
+        stage_import_batch(self.client, self.user, ImportBatch.Kind.QUALTRICS, {
             "validation_records": csv_content[2:5],
             "question_numbers": ["1", "2", "3"],
             "question_glossvideo_map": {"1": self.glossvideo_1.pk, "2": self.glossvideo_2.pk,
                                         "3": 222}
         })
-        s.save()
 
         check_results_tag = Tag.objects.get(name=settings.TAG_VALIDATION_CHECK_RESULTS)
         ready_for_validation_tag = Tag.objects.get(name=settings.TAG_READY_FOR_VALIDATION)
@@ -668,13 +829,12 @@ class QualtricsCSVImportTestCase(TestCase):
         self.assertEqual(ready_for_validation_tagged_glosses.count(), 0)
 
         # re-upload csv file to test duplicate responses are ignored
-        s.update({
+        stage_import_batch(self.client, self.user, ImportBatch.Kind.QUALTRICS, {
             "validation_records": [csv_content[5]],
             "question_numbers": ["1", "2", "3"],
             "question_glossvideo_map": {"1": self.glossvideo_1.pk, "2": self.glossvideo_2.pk,
                                         "3": 222}
         })
-        s.save()
 
         response = self.client.post(
             reverse("dictionary:confirm_import_qualtrics_csv"),
@@ -691,13 +851,11 @@ class QualtricsCSVImportTestCase(TestCase):
 
     def test_confirmation_view_cancel_gloss_creation(self):
         csv_content = self._csv_content
-        s = self.client.session
-        s.update({
+        stage_import_batch(self.client, self.user, ImportBatch.Kind.QUALTRICS, {
             "validation_records": csv_content[2:5],
             "question_numbers": ["1"],
-            "question_gloss_map": {"1": 1}
+            "question_glossvideo_map": {"1": 1}
         })
-        s.save()
 
         response = self.client.post(
             reverse("dictionary:confirm_import_qualtrics_csv"),
@@ -705,10 +863,8 @@ class QualtricsCSVImportTestCase(TestCase):
         )
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse("dictionary:import_qualtrics_csv"))
-        new_session = self.client.session
-        self.assertNotIn("validation_records", new_session.keys())
-        self.assertNotIn("question_numbers", new_session.keys())
-        self.assertNotIn("question_gloss_map", new_session.keys())
+        self.assertNotIn(import_batch_session_key(ImportBatch.Kind.QUALTRICS), self.client.session.keys())
+        self.assertFalse(ImportBatch.objects.exists())
 
     def test_confirmation_view_no_post_method(self):
         """Test that using GET redirects to import view"""
@@ -884,9 +1040,10 @@ class ManualValidationCSVImportTestCase(TestCase):
         )
 
         self.assertEqual(response.status_code, 200)
-        session = self.client.session
-        self.assertListEqual(sorted(session["glosses"]), ["1", "2", "222"])
-        self.assertDictEqual({"Test": csv_content}, session["group_row_map"])
+        batch = ImportBatch.objects.get(
+            pk=self.client.session[import_batch_session_key(ImportBatch.Kind.MANUAL_VALIDATION)])
+        self.assertListEqual(sorted(batch.data["glosses"]), ["1", "2", "222"])
+        self.assertDictEqual({"Test": csv_content}, batch.data["group_row_map"])
 
     def test_confirmation_view_confirm_manual_validation_aggregation_creation(self):
         """
@@ -897,12 +1054,10 @@ class ManualValidationCSVImportTestCase(TestCase):
         csv_content[0]["idgloss"] = f"testgloss:{self.gloss_1.pk}"
         csv_content[1]["idgloss"] = f"testgloss:{self.gloss_2.pk}"
 
-        s = self.client.session
-        s.update({
+        stage_import_batch(self.client, self.user, ImportBatch.Kind.MANUAL_VALIDATION, {
             "glosses": [str(self.gloss_1.pk), str(self.gloss_2.pk), "222"],
             "group_row_map": {"Test": csv_content}
         })
-        s.save()
 
         response = self.client.post(
             reverse("dictionary:confirm_import_manual_validation_csv"),
@@ -937,13 +1092,11 @@ class ManualValidationCSVImportTestCase(TestCase):
 
     def test_confirmation_view_cancel_manual_validation_aggregation_creation(self):
         csv_content = self._csv_content
-        s = self.client.session
-        s.update({
+        stage_import_batch(self.client, self.user, ImportBatch.Kind.MANUAL_VALIDATION, {
             "glosses": [str(self.gloss_1.pk), str(self.gloss_2.pk), "222"],
             "group_row_map": {
                 "Test": csv_content}
         })
-        s.save()
 
         response = self.client.post(
             reverse("dictionary:confirm_import_manual_validation_csv"),
@@ -951,9 +1104,9 @@ class ManualValidationCSVImportTestCase(TestCase):
         )
         self.assertEqual(response.status_code, 302)
         self.assertRedirects(response, reverse("dictionary:import_manual_validation_csv"))
-        new_session = self.client.session
-        self.assertNotIn("glosses", new_session.keys())
-        self.assertNotIn("group_row_map", new_session.keys())
+        self.assertNotIn(import_batch_session_key(ImportBatch.Kind.MANUAL_VALIDATION),
+                         self.client.session.keys())
+        self.assertFalse(ImportBatch.objects.exists())
 
     def test_confirmation_view_no_post_method(self):
         """Test that using GET redirects to import view"""
@@ -0,0 +1,596 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import FileResponse
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_comments.models import Comment
+from guardian.shortcuts import assign_perm
+
+from signbank.video.models import GlossVideo, MediaManifestEntry
+from signbank.dictionary.artifacts import build_dataset_artifact, claim_next_stale_artifact
+from signbank.dictionary.exports import (
+    StandardCSVExport,
+    ValidationResultsCSVExport,
+    claim_next_export_job,
+    expire_export_jobs,
+    fail_timed_out_export_jobs,
+    run_export_job,
+    run_queued_export_job,
+)
+from signbank.dictionary.tools import GlossDataSerializer, get_gloss_data, package_media_key
+from signbank.dictionary.models import (
+    Dataset,
+    DatasetArtifact,
+    ExportJob,
+    FieldChoice,
+    Gloss,
+    GlossTranslations,
+    Language,
+    ManualValidationAggregation,
+    RelationToForeignSign,
+    ShareValidationAggregation,
+    SignLanguage,
+    Task,
+    ValidationRecord,
+)
+
+
+class StandardCSVExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        self.english = Language.objects.create(name="English", language_code_2char="EN", language_code_3char="eng")
+        self.maori = Language.objects.create(name="Maori", language_code_2char="MI", language_code_3char="mri")
+
+    def test_related_columns(self):
+        """Tests that the translation, foreign sign and FieldChoice columns are filled in for each gloss"""
+        gloss = Gloss.objects.create(idgloss="testgloss:1", dataset=self.dataset, created_by=self.user,
+                                     updated_by=self.user)
+        other_gloss = Gloss.objects.create(idgloss="testgloss:2", dataset=self.dataset, created_by=self.user,
+                                           updated_by=self.user)
+        GlossTranslations.objects.create(gloss=gloss, language=self.english, translations="test",
+                                         translations_secondary="exam", translations_minor=None)
+        GlossTranslations.objects.create(gloss=gloss, language=self.maori, translations="whakamatautau")
+        RelationToForeignSign.objects.create(gloss=gloss, other_lang="BSL", other_lang_gloss="test")
+        RelationToForeignSign.objects.create(gloss=gloss, other_lang="Auslan", other_lang_gloss="test")
+        gloss.usage.add(
+            FieldChoice.objects.create(field="usage", english_name="obscene", machine_value=501),
+            FieldChoice.objects.create(field="usage", english_name="archaic", machine_value=502),
+        )
+        gloss.wordclasses.add(FieldChoice.objects.create(field="word_class", english_name="noun", machine_value=503))
+
+        export = StandardCSVExport(Gloss.objects.filter(dataset=self.dataset).order_by("idgloss"))
+        rows = [dict(zip(export.headers, row)) for row in export.rows()]
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["id"], str(gloss.pk))
+        self.assertEqual(rows[0]["gloss_main"], "test")
+        self.assertEqual(rows[0]["gloss_secondary"], "exam")
+        self.assertEqual(rows[0]["gloss_minor"], "")
+        self.assertEqual(rows[0]["gloss_maori"], "whakamatautau")
+        self.assertEqual(rows[0]["related_to"], "Auslan")
+        self.assertEqual(rows[0]["usage"], "archaic; obscene")
+        self.assertEqual(rows[0]["word_classes"], "noun")
+        self.assertEqual(rows[0]["semantic_field"], "")
+        self.assertEqual(rows[1]["id"], str(other_gloss.pk))
+        self.assertEqual(rows[1]["gloss_main"], "")
+        self.assertEqual(rows[1]["usage"], "")
+
+
+class ValidationResultsCSVExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        self.gloss = self.create_gloss("testgloss:1")
+
+    def create_gloss(self, idgloss):
+        gloss = Gloss.objects.create(idgloss=idgloss, dataset=self.dataset, created_by=self.user,
+                                     updated_by=self.user)
+        gloss.tags.add(settings.TAG_VALIDATION_CHECK_RESULTS)
+        return gloss
+
+    def create_record(self, gloss, sign_seen, first_name="", comment=""):
+        return ValidationRecord.objects.create(gloss=gloss, sign_seen=sign_seen,
+                                               response_id="response:%s" % ValidationRecord.objects.count(),
+                                               respondent_first_name=first_name, respondent_last_name="Doe",
+                                               comment=comment)
+
+    def rows(self):
+        return list(ValidationResultsCSVExport(Gloss.objects.order_by("idgloss")).rows())
+
+    def test_results(self):
+        """Tests that the counts and comments of every source are combined into one row per gloss"""
+        SignSeen = ValidationRecord.SignSeenChoices
+        self.create_record(self.gloss, SignSeen.NOT_SURE, "Ann", "Maybe")
+        self.create_record(self.gloss, SignSeen.NO, "Bob", "Never")
+        self.create_record(self.gloss, SignSeen.YES, "Cat", "Often")
+        self.create_record(self.gloss, SignSeen.YES)
+        ShareValidationAggregation.objects.create(gloss=self.gloss, agrees=3, disagrees=2)
+        ShareValidationAggregation.objects.create(gloss=self.gloss, agrees=1, disagrees=0)
+        ManualValidationAggregation.objects.create(gloss=self.gloss, group="Class", sign_seen_yes=4,
+                                                   sign_seen_no=1, sign_seen_not_sure=2, comments="Seen")
+        ManualValidationAggregation.objects.create(gloss=self.gloss, group="Other", sign_seen_yes=1,
+                                                   sign_seen_no=0, sign_seen_not_sure=0)
+        Comment.objects.create(content_type=ContentType.objects.get_for_model(Gloss), object_pk=str(self.gloss.pk),
+                               site=Site.objects.get_current(), user_name="Dee", comment="Shared",
+                               is_public=False)
+        untagged = Gloss.objects.create(idgloss="testgloss:0", dataset=self.dataset, created_by=self.user,
+                                        updated_by=self.user)
+        self.create_record(untagged, SignSeen.YES)
+        without_results = self.create_gloss("testgloss:2")
+
+        self.assertEqual(self.rows(), [
+            [self.gloss.idgloss, 2 + 4 + 5, 1 + 2 + 1, 1 + 2, 18,
+             "Cat Doe: Often | Bob Doe: Never | Ann Doe: Maybe | Dee: Shared | Class: Seen | "],
+            [without_results.idgloss, 0, 0, 0, 0, ""],
+        ])
+
+    def test_number_of_queries_does_not_depend_on_results(self):
+        self.create_record(self.gloss, ValidationRecord.SignSeenChoices.YES, "Ann", "Yes")
+        with self.assertNumQueries(5):
+            self.rows()
+
+        for i in range(10):
+            gloss = self.create_gloss("testgloss:%s" % (i + 2))
+            self.create_record(gloss, ValidationRecord.SignSeenChoices.NO, "Bob", "No")
+            ShareValidationAggregation.objects.create(gloss=gloss, agrees=1, disagrees=1)
+        with self.assertNumQueries(5):
+            self.assertEqual(len(self.rows()), 11)
+
+
+class ExportJobTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        self.user.user_permissions.add(Permission.objects.get(codename="search_gloss"))
+        self.user.user_permissions.add(Permission.objects.get(codename="export_csv"))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        assign_perm("dictionary.view_dataset", self.user, self.dataset)
+        self.gloss_1 = Gloss.objects.create(idgloss="testgloss:1", dataset=self.dataset, created_by=self.user,
+                                            updated_by=self.user)
+        self.gloss_2 = Gloss.objects.create(idgloss="othergloss:1", dataset=self.dataset, created_by=self.user,
+                                            updated_by=self.user)
+
+    def tearDown(self):
+        for job in ExportJob.objects.all():
+            if job.file:
+                job.file.delete(save=False)
+
+    def test_create_export_job(self):
+        """Tests that a queued ExportJob is created for the search, without the paging parameters"""
+        response = self.client.post(
+            reverse("dictionary:create_export_job") + "?format=CSV-standard&gloss=test&page=2&paginate_by=10")
+        self.assertEqual(response.status_code, 201)
+
+        job = ExportJob.objects.get()
+        self.assertEqual(job.status, ExportJob.Status.QUEUED)
+        self.assertEqual(job.export_format, "CSV-standard")
+        self.assertEqual(job.query_string, "gloss=test")
+        self.assertEqual(job.created_by, self.user)
+        self.assertEqual(response.json()["status_url"],
+                         reverse("dictionary:export_job_status", kwargs={"job_id": job.pk}))
+        self.assertIsNone(response.json()["download_url"])
+
+    def test_export_job_is_run_by_the_task_queue(self):
+        """Tests that creating an ExportJob queues a task that runs it, unless a worker has claimed it already"""
+        self.client.post(reverse("dictionary:create_export_job") + "?format=CSV-standard&gloss=test")
+        task = Task.objects.get()
+        self.assertEqual(task.name, "signbank.dictionary.exports.run_queued_export_job")
+
+        call_command("runworker", "--once")
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.Status.DONE)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.status, ExportJob.Status.DONE)
+        self.assertEqual(job.rows_written, 1)
+
+        # The job is only run once
+        run_queued_export_job(job.pk)
+        self.assertEqual(job.finished_at, ExportJob.objects.get().finished_at)
+
+    def test_create_export_job_unknown_format(self):
+        response = self.client.post(reverse("dictionary:create_export_job") + "?format=XML")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_create_export_job_requires_permission(self):
+        user = User.objects.create_user(username="noperm", email=None, password="noperm")
+        client = Client()
+        client.force_login(user)
+        response = client.post(reverse("dictionary:create_export_job") + "?format=CSV-standard")
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_run_export_job(self):
+        """Tests that a worker writes the export file for the job's search and can download it"""
+        job = ExportJob.objects.create(export_format="CSV-standard", query_string="gloss=test", created_by=self.user)
+
+        run_queued_export_job(job.pk)
+
+        job = ExportJob.objects.get()
+        self.assertEqual(job.status, ExportJob.Status.DONE)
+        self.assertEqual(job.total_rows, 1)
+        self.assertEqual(job.rows_written, 1)
+        self.assertEqual(job.progress, 100)
+        self.assertIsNotNone(job.expires_at)
+
+        response = self.client.get(reverse("dictionary:export_job_status", kwargs={"job_id": job.pk}))
+        self.assertEqual(response.json()["status"], "done")
+        download_url = response.json()["download_url"]
+        self.assertEqual(download_url, reverse("dictionary:export_job_download", kwargs={"job_id": job.pk}))
+
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Disposition"],
+                         'attachment; filename="dictionary-export.csv"')
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], str(self.gloss_1.pk))
+
+    def test_claim_next_export_job_only_claims_queued_jobs(self):
+        ExportJob.objects.create(export_format="CSV-standard", created_by=self.user,
+                                 status=ExportJob.Status.RUNNING)
+        self.assertIsNone(claim_next_export_job())
+
+        queued_job = ExportJob.objects.create(export_format="CSV-standard", created_by=self.user)
+        job = claim_next_export_job()
+        self.assertEqual(job, queued_job)
+        self.assertEqual(job.status, ExportJob.Status.RUNNING)
+        self.assertIsNotNone(job.started_at)
+
+    def test_timed_out_export_job_is_failed(self):
+        """Tests that a job left running by a worker that died is failed, and then expires like the others"""
+        started_at = timezone.now() - datetime.timedelta(seconds=settings.TASK_TIMEOUT + 1)
+        stale_job = ExportJob.objects.create(export_format="CSV-standard", created_by=self.user,
+                                             status=ExportJob.Status.RUNNING, started_at=started_at)
+        running_job = ExportJob.objects.create(export_format="CSV-standard", created_by=self.user,
+                                               status=ExportJob.Status.RUNNING, started_at=timezone.now())
+
+        self.assertEqual(fail_timed_out_export_jobs(), 1)
+        stale_job.refresh_from_db()
+        self.assertEqual(stale_job.status, ExportJob.Status.FAILED)
+        self.assertEqual(stale_job.error, "Timed out")
+        self.assertIsNotNone(stale_job.expires_at)
+        running_job.refresh_from_db()
+        self.assertEqual(running_job.status, ExportJob.Status.RUNNING)
+
+        response = self.client.get(reverse("dictionary:export_job_status", kwargs={"job_id": stale_job.pk}))
+        self.assertEqual(response.json()["status"], "failed")
+
+        ExportJob.objects.filter(pk=stale_job.pk).update(expires_at=timezone.now())
+        self.assertEqual(expire_export_jobs(), 1)
+
+    def test_run_export_job_failure_is_recorded(self):
+        job = ExportJob.objects.create(export_format="CSV-unknown", created_by=self.user)
+        job = run_export_job(job)
+        self.assertEqual(job.status, ExportJob.Status.FAILED)
+        self.assertNotEqual(job.error, "")
+
+    def test_status_of_other_users_job_is_not_found(self):
+        other_user = User.objects.create_user(username="other", email=None, password="other")
+        job = ExportJob.objects.create(export_format="CSV-standard", created_by=other_user)
+        response = self.client.get(reverse("dictionary:export_job_status", kwargs={"job_id": job.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_download_unfinished_job_is_not_found(self):
+        job = ExportJob.objects.create(export_format="CSV-standard", created_by=self.user)
+        response = self.client.get(reverse("dictionary:export_job_download", kwargs={"job_id": job.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_expire_export_jobs(self):
+        """Tests that the files of finished jobs are deleted once they have expired"""
+        job = run_export_job(ExportJob.objects.create(export_format="CSV-standard", created_by=self.user))
+        file_name = job.file.name
+        self.assertTrue(job.file.storage.exists(file_name))
+        self.assertEqual(expire_export_jobs(), 0)
+
+        job.expires_at = timezone.now() - datetime.timedelta(minutes=1)
+        job.save()
+        self.assertEqual(expire_export_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.Status.EXPIRED)
+        self.assertFalse(job.file)
+        self.assertFalse(job.file.storage.exists(file_name))
+
+
+class DatasetArtifactTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage, is_public=True)
+        self.gloss = Gloss.objects.create(idgloss="testgloss:1", dataset=self.dataset, published=True,
+                                          created_by=self.user, updated_by=self.user)
+        self.url = reverse("dictionary:public_gloss_list_xml", kwargs={"dataset_id": self.dataset.pk})
+
+    def tearDown(self):
+        for artifact in DatasetArtifact.objects.all():
+            if artifact.file:
+                artifact.file.delete(save=False)
+
+    def build_artifacts(self):
+        while (artifact := claim_next_stale_artifact()) is not None:
+            build_dataset_artifact(artifact)
+
+    def test_public_ecv_is_built_in_the_background(self):
+        # Until the artifact is built, the ECV is written on the fly.
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertIn(b"testgloss:1", b"".join(response.streaming_content))
+        artifact = DatasetArtifact.objects.get(dataset=self.dataset, kind=DatasetArtifact.Kind.PUBLIC_ECV)
+        self.assertTrue(artifact.stale)
+
+        self.build_artifacts()
+        artifact.refresh_from_db()
+        self.assertFalse(artifact.stale)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/xml")
+        self.assertEqual(response["ETag"], '"%s"' % artifact.etag)
+        self.assertIn(b"testgloss:1", b"".join(response.streaming_content))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_gloss_changes_mark_artifacts_stale(self):
+        self.client.get(self.url)
+        self.build_artifacts()
+
+        self.gloss.idgloss = "renamed:1"
+        self.gloss.save()
+        self.assertTrue(DatasetArtifact.objects.get(dataset=self.dataset).stale)
+        self.build_artifacts()
+
+        response = self.client.get(self.url)
+        content = b"".join(response.streaming_content)
+        self.assertIn(b"renamed:1", content)
+        self.assertNotIn(b"testgloss:1", content)
+
+    def test_admin_actions_mark_artifacts_stale(self):
+        admin_user = User.objects.create_superuser(username="admin", email=None, password="admin")
+        self.client.force_login(admin_user)
+        self.client.get(self.url)
+        self.build_artifacts()
+
+        response = self.client.post(reverse("admin:dictionary_gloss_changelist"),
+                                    {"action": "exclude_from_ecv", "_selected_action": [self.gloss.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(DatasetArtifact.objects.get(dataset=self.dataset).stale)
+        self.build_artifacts()
+
+        response = self.client.get(self.url)
+        self.assertNotIn(b"testgloss:1", b"".join(response.streaming_content))
+
+    def test_artifacts_are_built_by_the_task_queue(self):
+        """The first request for an artifact, and marking it stale, queue a task that builds it"""
+        self.client.get(self.url)
+        task = Task.objects.get(name="signbank.dictionary.artifacts.build_stale_dataset_artifacts")
+        call_command("runworker", "--once")
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.Status.DONE)
+        self.assertEqual(task.result, 1)
+        self.assertFalse(DatasetArtifact.objects.get(dataset=self.dataset).stale)
+
+        # Changes to a stale artifact's glosses don't queue another build
+        self.gloss.save()
+        self.gloss.save()
+        self.assertEqual(1, Task.objects.filter(status=Task.Status.QUEUED).count())
+        call_command("runworker", "--once")
+        self.assertFalse(DatasetArtifact.objects.get(dataset=self.dataset).stale)
+
+    def test_failed_build_is_retried(self):
+        self.client.get(self.url)
+        with mock.patch("signbank.dictionary.artifacts.build_dataset_artifact",
+                        side_effect=OSError("Storage unavailable")):
+            call_command("runworker", "--once")
+        self.assertTrue(DatasetArtifact.objects.get(dataset=self.dataset).stale)
+        task = Task.objects.get()
+        self.assertEqual(task.status, Task.Status.QUEUED)
+        self.assertIn("Storage unavailable", task.error)
+
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        call_command("runworker", "--once")
+        self.assertFalse(DatasetArtifact.objects.get(dataset=self.dataset).stale)
+
+    def test_gloss_list_csv(self):
+        self.user.user_permissions.add(Permission.objects.get(codename="search_gloss"))
+        self.client.force_login(self.user)
+        url = reverse("dictionary:gloss_list_csv", kwargs={"dataset_id": self.dataset.pk})
+        self.client.get(url)
+        self.build_artifacts()
+
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Disposition"], "attachment; filename=gloss_export.csv;")
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode("utf-8-sig"))))
+        self.assertEqual(len(rows), 2)
+        self.assertIn("testgloss:1", rows[1])
+
+
+class GlossDataSerializerTestCase(TestCase):
+    fieldnames = ["idgloss", "Gloss: English", "Gloss: Maori", "Handedness", "Strong Hand", "Location",
+                  "Wordclasses", "Created By", "Updated At", "Dataset", "Link", "Video"]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test", first_name="Tess")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        english = Language.objects.create(name="English", language_code_2char="EN", language_code_3char="eng")
+        maori = Language.objects.create(name="Maori", language_code_2char="MI", language_code_3char="mri")
+        self.dataset.translation_languages.add(english, maori)
+        handedness = FieldChoice.objects.create(field="handedness", english_name="1", machine_value=601)
+        location = FieldChoice.objects.create(field="location", english_name="-", machine_value=602)
+        noun = FieldChoice.objects.create(field="wordclass", english_name="noun", machine_value=603)
+        verb = FieldChoice.objects.create(field="wordclass", english_name="verb", machine_value=604)
+
+        for i in range(3):
+            gloss = Gloss.objects.create(idgloss="testgloss:%s" % i, dataset=self.dataset, handedness=handedness,
+                                         location=location, created_by=self.user, updated_by=self.user)
+            gloss.wordclasses.add(noun, verb)
+            GlossTranslations.objects.create(gloss=gloss, language=english, translations="test %s" % i)
+            GlossVideo.objects.create(gloss=gloss, dataset=self.dataset, version=0,
+                                      videofile=SimpleUploadedFile("test%s.mp4" % i, b"data"))
+        Gloss.objects.create(idgloss="bare:1", dataset=self.dataset, created_by=self.user, updated_by=self.user)
+
+    def test_same_as_get_fields_dict(self):
+        glosses = Gloss.objects.filter(dataset=self.dataset)
+        data = GlossDataSerializer(self.dataset, self.fieldnames).serialize(glosses)
+
+        self.assertEqual(len(data), 4)
+        for gloss in glosses:
+            self.assertEqual(data[str(gloss.pk)], gloss.get_fields_dict(self.fieldnames))
+        gloss = glosses.get(idgloss="testgloss:0")
+        self.assertEqual(data[str(gloss.pk)]["Gloss: English"], "test 0")
+        self.assertEqual(data[str(gloss.pk)]["Wordclasses"], "noun, verb")
+        self.assertIn(gloss.glossvideo_set.get().videofile.name, data[str(gloss.pk)]["Video"])
+        self.assertNotIn("Location", data[str(gloss.pk)])
+
+    def test_number_of_queries_does_not_depend_on_glosses(self):
+        Site.objects.get_current()
+        with self.assertNumQueries(4):
+            get_gloss_data(dataset=self.dataset)
+        Gloss.objects.create(idgloss="bare:2", dataset=self.dataset, created_by=self.user, updated_by=self.user)
+        with self.assertNumQueries(4):
+            self.assertEqual(len(get_gloss_data(dataset=self.dataset)), 5)
+
+
+
+class PackageTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name=settings.DEFAULT_DATASET_ACRONYM, signlanguage=signlanguage)
+        self.glosses = []
+        self.videos = []
+        for i in range(2):
+            gloss = Gloss.objects.create(idgloss="testgloss:%s" % i, dataset=self.dataset,
+                                         created_by=self.user, updated_by=self.user)
+            self.glosses.append(gloss)
+            self.videos.append(GlossVideo.objects.create(
+                gloss=gloss, dataset=self.dataset, version=0, videofile=SimpleUploadedFile("test%s.mp4" % i, b"data")))
+        self.image = GlossVideo.objects.create(gloss=self.glosses[0], dataset=self.dataset, version=1,
+                                               videofile=SimpleUploadedFile("test.png", b"data"))
+
+        self.packages_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.packages_folder)
+        settings_override = override_settings(SIGNBANK_PACKAGES_FOLDER=self.packages_folder)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Everything was last changed a day ago.
+        self.since = timezone.now() - datetime.timedelta(hours=1)
+        a_day_ago = timezone.now() - datetime.timedelta(days=1)
+        Gloss.objects.filter(dataset=self.dataset).update(updated_at=a_day_ago)
+        GlossVideo.objects.filter(dataset=self.dataset).update(videofile_modified_at=a_day_ago)
+
+    def get_package(self, **params):
+        response = self.client.get(reverse("dictionary:package"), params)
+        self.assertEqual(response.status_code, 200)
+        self.last_response = response
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            return {name[:-len(".json")]: json.loads(archive.read(name)) for name in archive.namelist()}
+
+    def test_full_package(self):
+        package = self.get_package()
+
+        self.assertEqual(set(package["glosses"]), {str(gloss.pk) for gloss in self.glosses})
+        self.assertEqual(set(package["video_urls"]), {package_media_key(video.videofile.name) for video in self.videos})
+        self.assertEqual(set(package["image_urls"]), {package_media_key(self.image.videofile.name)})
+        self.assertNotIn("deleted_glosses", package)
+
+    def test_package_leaves_out_missing_files(self):
+        MediaManifestEntry.objects.update_or_create(key=self.videos[1].videofile.name, defaults={"exists": False})
+
+        package = self.get_package()
+
+        self.assertEqual(set(package["video_urls"]), {package_media_key(self.videos[0].videofile.name)})
+
+    def test_delta_package(self):
+        self.glosses[1].save()
+        deleted_pk = self.glosses[0].pk
+        self.glosses[0].delete()
+
+        package = self.get_package(since_timestamp=int(self.since.timestamp()))
+
+        self.assertEqual(set(package["glosses"]), {str(self.glosses[1].pk)})
+        self.assertEqual(package["video_urls"], {})
+        self.assertEqual(package["image_urls"], {})
+        self.assertEqual(package["deleted_glosses"], [str(deleted_pk)])
+        self.assertEqual(package["deleted_videos"], [package_media_key(self.videos[0].videofile.name)])
+        self.assertEqual(package["deleted_images"], [package_media_key(self.image.videofile.name)])
+
+    def test_delta_package_includes_replaced_videos(self):
+        # The new file is renamed to the name of the old one, but it is still a change.
+        self.videos[1].videofile = SimpleUploadedFile("new.mp4", b"new data")
+        self.videos[1].save()
+
+        package = self.get_package(since_timestamp=int(self.since.timestamp()))
+
+        self.assertEqual(package["glosses"], {})
+        self.assertEqual(set(package["video_urls"]), {package_media_key(self.videos[1].videofile.name)})
+        self.assertEqual(package["deleted_videos"], [])
+
+    def test_package_is_cached(self):
+        package = self.get_package()
+        self.assertNotIsInstance(self.last_response, FileResponse)
+        self.assertEqual(len(os.listdir(self.packages_folder)), 1)
+
+        # The package is served from the cache, without serializing the glosses again.
+        with self.assertNumQueries(4):
+            self.assertEqual(self.get_package(), package)
+        self.assertIsInstance(self.last_response, FileResponse)
+
+    def test_cached_package_is_rebuilt_after_changes(self):
+        self.get_package()
+        gloss = Gloss.objects.create(idgloss="testgloss:new", dataset=self.dataset,
+                                     created_by=self.user, updated_by=self.user)
+
+        package = self.get_package()
+
+        self.assertNotIsInstance(self.last_response, FileResponse)
+        self.assertIn(str(gloss.pk), package["glosses"])
+
+    def test_incremental_packages_share_a_cached_package(self):
+        since = int(self.since.timestamp())
+        since -= since % settings.PACKAGE_SINCE_TIMESTAMP_BUCKET
+        self.get_package(since_timestamp=since + 1)
+        self.get_package(since_timestamp=since + 2)
+        self.assertIsInstance(self.last_response, FileResponse)
+
+    @override_settings(PACKAGE_CACHE_MAX_FILES=1)
+    def test_cached_packages_are_evicted(self):
+        self.get_package()
+        self.get_package(since_timestamp=int(self.since.timestamp()))
+        self.assertEqual(len(os.listdir(self.packages_folder)), 1)
+
+    def test_build_package_command(self):
+        call_command("build_package", stderr=io.StringIO())
+
+        package = self.get_package()
+
+        self.assertIsInstance(self.last_response, FileResponse)
+        self.assertEqual(len(package["glosses"]), 2)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from guardian.shortcuts import assign_perm
+
+from signbank.dictionary.models import Dataset, Gloss, SignLanguage
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class GlossListPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        self.user.user_permissions.add(Permission.objects.get(codename="search_gloss"))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage, is_public=True)
+        assign_perm("dictionary.view_dataset", self.user, dataset)
+        self.glosses = [
+            Gloss.objects.create(idgloss="gloss:%s" % i, dataset=dataset, published=True, created_by=self.user,
+                                 updated_by=self.user)
+            for i in range(5)
+        ]
+
+    def get(self, url_name="dictionary:admin_gloss_list", **params):
+        return self.client.get(reverse(url_name), params)
+
+    def walk(self, url_name="dictionary:admin_gloss_list", **params):
+        """Follow the next cursors from the first page, returning the pages' glosses and the last response"""
+        response = self.get(url_name, **params)
+        pages = [list(response.context["object_list"])]
+        while response.context["page_obj"].has_next():
+            response = self.get(url_name, cursor=response.context["page_obj"].next_cursor, **params)
+            pages.append(list(response.context["object_list"]))
+        return pages, response
+
+    def test_next_and_previous_cursors(self):
+        pages, response = self.walk(paginate_by=2)
+        self.assertEqual(pages, [self.glosses[0:2], self.glosses[2:4], self.glosses[4:5]])
+        self.assertEqual(response.context["paginator"].count, 5)
+
+        response = self.get(cursor=response.context["page_obj"].previous_cursor, paginate_by=2)
+        self.assertEqual(list(response.context["object_list"]), self.glosses[2:4])
+        response = self.get(cursor=response.context["page_obj"].previous_cursor, paginate_by=2)
+        self.assertEqual(list(response.context["object_list"]), self.glosses[0:2])
+        self.assertFalse(response.context["page_obj"].has_previous())
+
+    def test_descending_order(self):
+        pages, _ = self.walk(paginate_by=3, order="-idgloss")
+        self.assertEqual(pages, [self.glosses[:1:-1], self.glosses[1::-1]])
+
+    def test_public_gloss_list(self):
+        pages, _ = self.walk("dictionary:public_gloss_list", paginate_by=4)
+        self.assertEqual(pages, [self.glosses[0:4], self.glosses[4:5]])
+
+    def test_invalid_cursor_is_first_page(self):
+        response = self.get(cursor="invalid", paginate_by=2)
+        self.assertEqual(list(response.context["object_list"]), self.glosses[0:2])
+
+    def test_page_uses_offset_pagination(self):
+        response = self.get(page=2, paginate_by=2)
+        self.assertEqual(list(response.context["object_list"]), self.glosses[2:4])
+        self.assertEqual(response.context["page_obj"].number, 2)
+
+    def test_paginate_by_is_capped(self):
+        self.assertEqual(self.get(paginate_by=1000000).context["paginator"].per_page, 3000)
+        self.assertEqual(self.get(paginate_by="all").context["paginator"].per_page, 100)
+
+    def test_count_is_cached(self):
+        self.get(paginate_by=2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(cursor=self.get(paginate_by=2).context["page_obj"].next_cursor, paginate_by=2)
+        self.assertEqual(response.context["paginator"].count, 5)
+        self.assertFalse([query for query in queries.captured_queries if '"__count"' in query["sql"]])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from guardian.shortcuts import assign_perm, remove_perm
+
+from signbank.dictionary.models import Dataset, SignLanguage
+from signbank.dictionary.permissions import datasets_for_user, has_dataset_perm
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class DatasetPermissionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        self.other_dataset = Dataset.objects.create(name="otherdataset", signlanguage=signlanguage)
+        assign_perm("dictionary.view_dataset", self.user, self.dataset)
+
+    def fresh_user(self):
+        """Returns the user as a new request would see it, without the permissions kept on the user object"""
+        return User.objects.get(pk=self.user.pk)
+
+    def test_datasets_for_user(self):
+        self.assertEqual(list(datasets_for_user(self.user)), [self.dataset])
+        self.assertEqual(list(datasets_for_user(self.user, "change_dataset")), [])
+
+    def test_datasets_for_user_with_global_permission(self):
+        self.user.user_permissions.add(Permission.objects.get(codename="view_dataset"))
+        self.assertCountEqual(datasets_for_user(self.fresh_user()), [self.dataset, self.other_dataset])
+
+    def test_has_dataset_perm(self):
+        self.assertTrue(has_dataset_perm(self.user, self.dataset))
+        self.assertFalse(has_dataset_perm(self.user, self.other_dataset))
+
+        superuser = User.objects.create_superuser(username="super", email=None, password="super")
+        self.assertTrue(has_dataset_perm(superuser, self.other_dataset))
+
+    def test_permissions_are_cached(self):
+        self.assertTrue(has_dataset_perm(self.user, self.dataset))
+        with self.assertNumQueries(0):
+            self.assertFalse(has_dataset_perm(self.user, self.other_dataset))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(has_dataset_perm(user, self.dataset))
+
+    def test_cache_is_invalidated_by_object_permissions(self):
+        self.assertFalse(has_dataset_perm(self.user, self.other_dataset))
+        assign_perm("dictionary.view_dataset", self.user, self.other_dataset)
+        self.assertTrue(has_dataset_perm(self.user, self.other_dataset))
+        remove_perm("dictionary.view_dataset", self.user, self.other_dataset)
+        self.assertFalse(has_dataset_perm(self.fresh_user(), self.other_dataset))
+
+    def test_cache_is_invalidated_by_groups(self):
+        group = Group.objects.create(name="editors")
+        assign_perm("dictionary.view_dataset", group, self.other_dataset)
+        self.assertFalse(has_dataset_perm(self.user, self.other_dataset))
+
+        self.user.groups.add(group)
+        self.assertTrue(has_dataset_perm(self.user, self.other_dataset))
+        self.user.groups.remove(group)
+        self.assertFalse(has_dataset_perm(self.user, self.other_dataset))
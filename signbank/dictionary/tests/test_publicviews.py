@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from signbank.dictionary.models import Dataset, Gloss, GlossRelation, GlossTranslations, Language, SignLanguage
+from signbank.video.models import GlossVideo
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GlossDetailPublicViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage, is_public=True)
+        self.language = Language.objects.create(name="English", language_code_2char="EN", language_code_3char="eng")
+        self.dataset.translation_languages.add(self.language)
+        self.gloss = Gloss.objects.create(idgloss="testgloss", dataset=self.dataset, published=True,
+                                          created_by=self.user, updated_by=self.user)
+        self.other_gloss = Gloss.objects.create(idgloss="othergloss", dataset=self.dataset, published=True,
+                                                created_by=self.user, updated_by=self.user)
+        self.translations = GlossTranslations.objects.create(gloss=self.gloss, language=self.language,
+                                                             translations="hello")
+        GlossRelation.objects.create(source=self.gloss, target=self.other_gloss)
+        GlossVideo.objects.create(gloss=self.gloss, dataset=self.dataset, is_public=True,
+                                  videofile=SimpleUploadedFile("testgloss.mp4", b"data"))
+        self.url = reverse('dictionary:public_gloss_view', kwargs={'pk': self.gloss.pk})
+
+    def test_context_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "hello")
+        self.assertContains(response, "othergloss")
+
+        # Only the flatpages of the menu are queried.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, "hello")
+        self.assertContains(response, "othergloss")
+        self.assertContains(response, "testgloss.mp4")
+
+    def test_changes_replace_cached_context(self):
+        self.client.get(self.url)
+
+        self.translations.translations = "goodbye"
+        self.translations.save()
+        self.assertContains(self.client.get(self.url), "goodbye")
+
+        self.other_gloss.idgloss = "renamedgloss"
+        self.other_gloss.save()
+        self.assertContains(self.client.get(self.url), "renamedgloss")
+
+        self.gloss.published = False
+        self.gloss.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_unpublish_admin_action_replaces_cached_context(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        admin_user = User.objects.create_superuser(username="admin", email=None, password="admin")
+        admin_client = Client()
+        admin_client.force_login(admin_user)
+        response = admin_client.post(reverse("admin:dictionary_gloss_changelist"),
+                                     {"action": "unpublish", "_selected_action": [self.gloss.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
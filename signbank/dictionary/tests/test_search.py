@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from guardian.shortcuts import assign_perm
+
+from signbank.dictionary.exports import gloss_search_queryset
+from signbank.dictionary.facets import gloss_facet_counts
+from signbank.dictionary.models import (
+    Dataset,
+    FieldChoice,
+    Gloss,
+    GlossSearchDocument,
+    GlossTranslations,
+    Keyword,
+    Language,
+    MorphologyDefinition,
+    Relation,
+    SignLanguage,
+    Translation,
+)
+
+
+class GlossSearchDocumentTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        self.english = Language.objects.create(name="English", language_code_2char="EN", language_code_3char="eng")
+        self.gloss = Gloss.objects.create(idgloss="Cat:1", idgloss_mi="Ngeru", notes="A small Pet",
+                                          dataset=self.dataset, created_by=self.user, updated_by=self.user)
+
+    def test_document_created_with_gloss(self):
+        document = GlossSearchDocument.objects.get(gloss=self.gloss)
+        self.assertEqual(document.names, "Cat:1\nNgeru")
+        self.assertEqual(document.notes, "A small Pet")
+        self.assertEqual(document.document, "cat:1\nngeru\n\na small pet")
+        self.assertIsNotNone(document.search_vector)
+
+    def test_document_updated_with_gloss(self):
+        self.gloss.notes = "Meows"
+        self.gloss.save()
+        self.assertEqual(GlossSearchDocument.objects.get(gloss=self.gloss).notes, "Meows")
+
+    def test_document_updated_with_translations(self):
+        translations = GlossTranslations.objects.create(gloss=self.gloss, language=self.english,
+                                                        translations="kitten, feline")
+        self.assertEqual(GlossSearchDocument.objects.get(gloss=self.gloss).keywords, "kitten\nfeline")
+
+        translations.translations = "kitten"
+        translations.save()
+        self.assertEqual(GlossSearchDocument.objects.get(gloss=self.gloss).keywords, "kitten")
+
+    def test_document_updated_with_keyword(self):
+        keyword = Keyword.objects.create(text="kitten")
+        Translation.objects.create(gloss=self.gloss, language=self.english, keyword=keyword, order=0)
+        keyword.text = "kitty"
+        keyword.save()
+        self.assertEqual(GlossSearchDocument.objects.get(gloss=self.gloss).keywords, "kitty")
+
+    def test_document_deleted_with_gloss(self):
+        GlossTranslations.objects.create(gloss=self.gloss, language=self.english, translations="kitten")
+        self.gloss.delete()
+        self.assertFalse(GlossSearchDocument.objects.exists())
+
+
+class GlossListViewSearchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        self.user.user_permissions.add(Permission.objects.get(codename="search_gloss"))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        assign_perm("dictionary.view_dataset", self.user, dataset)
+        english = Language.objects.create(name="English", language_code_2char="EN", language_code_3char="eng")
+
+        self.gloss_note = Gloss.objects.create(idgloss="animal:1", notes="Sounds like a dog barking",
+                                               dataset=dataset, created_by=self.user, updated_by=self.user)
+        self.gloss_name = Gloss.objects.create(idgloss="dog:1", dataset=dataset, created_by=self.user,
+                                               updated_by=self.user)
+        self.gloss_keyword = Gloss.objects.create(idgloss="puppy:1", dataset=dataset, created_by=self.user,
+                                                  updated_by=self.user)
+        GlossTranslations.objects.create(gloss=self.gloss_keyword, language=english, translations="Dog, puppy")
+        self.gloss_other = Gloss.objects.create(idgloss="cat:1", idgloss_mi="Ngeru", dataset=dataset,
+                                                created_by=self.user, updated_by=self.user)
+
+    def test_search_matches_names_notes_and_keywords(self):
+        response = self.client.get(reverse("dictionary:admin_gloss_list"), {"search": "DOG"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["object_list"]),
+                         [self.gloss_note, self.gloss_name, self.gloss_keyword])
+
+    def test_search_matches_maori_name(self):
+        response = self.client.get(reverse("dictionary:admin_gloss_list"), {"search": "geru"})
+        self.assertEqual(list(response.context["object_list"]), [self.gloss_other])
+
+    def test_search_ordered_by_rank(self):
+        response = self.client.get(reverse("dictionary:admin_gloss_list"), {"search": "dog", "order": "rank"})
+        self.assertEqual(list(response.context["object_list"]),
+                         [self.gloss_name, self.gloss_keyword, self.gloss_note])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    SEARCH_RESULTS_PER_USER=2,
+)
+class SearchResultsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        self.user.user_permissions.add(Permission.objects.get(codename="search_gloss"))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        assign_perm("dictionary.view_dataset", self.user, dataset)
+        self.gloss_1 = Gloss.objects.create(idgloss="dog:1", dataset=dataset, created_by=self.user,
+                                            updated_by=self.user)
+        self.gloss_2 = Gloss.objects.create(idgloss="dog:2", dataset=dataset, created_by=self.user,
+                                            updated_by=self.user)
+        Gloss.objects.create(idgloss="cat:1", dataset=dataset, created_by=self.user, updated_by=self.user)
+
+    def search(self, **params):
+        return self.client.get(reverse("dictionary:admin_gloss_list"), params)
+
+    def test_search_is_referenced_in_session(self):
+        """Tests that only a reference to the search is stored in the session, without its results"""
+        self.search(gloss="dog", page="1", search="")
+        search = self.client.session["search_results"]
+        self.assertEqual(search["query"], "gloss=dog")
+        self.assertTrue(search["key"].startswith("search_results:%s:" % self.user.pk))
+        self.assertIsNone(cache.get(search["key"]))
+
+    def test_unfiltered_search_is_not_remembered(self):
+        self.search(order="idgloss")
+        self.assertIsNone(self.client.session["search_results"])
+        response = self.client.get(reverse("dictionary:ajax_search_results"))
+        self.assertEqual(response.content, b"OK")
+
+    def test_search_results(self):
+        """Tests that the search results are looked up and cached when they are requested"""
+        self.search(gloss="dog", order="-idgloss")
+        response = self.client.get(reverse("dictionary:ajax_search_results"))
+        self.assertEqual(response.json(), [{"id": self.gloss_2.pk, "gloss": "dog:2"},
+                                           {"id": self.gloss_1.pk, "gloss": "dog:1"}])
+        self.assertEqual(list(cache.get(self.client.session["search_results"]["key"])),
+                         [self.gloss_2.pk, self.gloss_1.pk])
+
+        with self.assertNumQueries(3):  # session, user and idglosses of the cached IDs
+            self.client.get(reverse("dictionary:ajax_search_results"))
+
+    def test_least_recently_used_results_are_evicted(self):
+        keys = []
+        for gloss in ("dog", "cat", "do"):
+            self.search(gloss=gloss)
+            self.client.get(reverse("dictionary:ajax_search_results"))
+            keys.append(self.client.session["search_results"]["key"])
+
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+
+
+class SubqueryFiltersTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        assign_perm("dictionary.view_dataset", self.user, dataset)
+        self.compound = FieldChoice.objects.create(field="MorphologyType", english_name="compound",
+                                                   machine_value=601)
+        self.blend = FieldChoice.objects.create(field="MorphologyType", english_name="blend", machine_value=602)
+
+        self.glosses = [
+            Gloss.objects.create(idgloss="gloss:%s" % i, dataset=dataset, created_by=self.user,
+                                 updated_by=self.user)
+            for i in range(6)
+        ]
+        self.target = Gloss.objects.create(idgloss="target:1", dataset=dataset, created_by=self.user,
+                                           updated_by=self.user)
+        for gloss in self.glosses[:4]:
+            Relation.objects.create(source=gloss, target=self.target, role=self.compound)
+            MorphologyDefinition.objects.create(parent_gloss=gloss, morpheme=self.target, role=self.compound)
+        Relation.objects.create(source=self.glosses[4], target=self.glosses[0], role=self.blend)
+        MorphologyDefinition.objects.create(parent_gloss=self.glosses[4], morpheme=self.glosses[0], role=self.blend)
+
+    def search(self, query):
+        """Returns the glosses found by `query`, asserting that the search takes a single query"""
+        qs = gloss_search_queryset(self.user, QueryDict(query))
+        with self.assertNumQueries(1):
+            return list(qs)
+
+    def test_relation(self):
+        self.assertEqual(self.search("relation=target"), self.glosses[:4])
+        self.assertEqual(self.search("relation=gloss:0"), [self.glosses[4]])
+
+    def test_has_relation(self):
+        self.assertEqual(self.search("hasRelation=602"), [self.glosses[4]])
+        self.assertEqual(self.search("hasRelation=all"), self.glosses[:5])
+
+    def test_morpheme(self):
+        self.assertEqual(self.search("morpheme=TARGET"), self.glosses[:4])
+
+    def test_has_morpheme_of_type(self):
+        self.assertEqual(self.search("hasMorphemeOfType=601"), self.glosses[:4])
+
+    def test_combined_filters(self):
+        self.assertEqual(self.search("hasRelation=all&hasMorphemeOfType=602&relation=gloss"), [self.glosses[4]])
+
+
+class FacetCountsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test", email=None, password="test")
+        self.user.user_permissions.add(Permission.objects.get(codename="search_gloss"))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+        signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage", language_code_3char="tst")
+        self.dataset = Dataset.objects.create(name="testdataset", signlanguage=signlanguage)
+        assign_perm("dictionary.view_dataset", self.user, self.dataset)
+        self.head = FieldChoice.objects.create(field="location", english_name="head", machine_value=701)
+        self.chest = FieldChoice.objects.create(field="location", english_name="chest", machine_value=702)
+        self.animals = FieldChoice.objects.create(field="semantic_field", english_name="animals",
+                                                  machine_value=703)
+        self.food = FieldChoice.objects.create(field="semantic_field", english_name="food", machine_value=704)
+
+        self.cat = Gloss.objects.create(idgloss="cat:1", location=self.head, dataset=self.dataset,
+                                        created_by=self.user, updated_by=self.user)
+        self.cat.semantic_field.add(self.animals)
+        self.cat.tags.add("check")
+        self.fish = Gloss.objects.create(idgloss="fish:1", location=self.chest, dataset=self.dataset,
+                                         created_by=self.user, updated_by=self.user)
+        self.fish.semantic_field.add(self.animals, self.food)
+        self.hat = Gloss.objects.create(idgloss="hat:1", location=self.head, dataset=self.dataset,
+                                        created_by=self.user, updated_by=self.user)
+
+    def test_gloss_facet_counts(self):
+        queryset = gloss_search_queryset(self.user, QueryDict())
+        with self.assertNumQueries(1):
+            counts = gloss_facet_counts(queryset)
+        self.assertEqual(counts["dataset"], {str(self.dataset.pk): 3})
+        self.assertEqual(counts["location"], {"701": 2, "702": 1})
+        self.assertEqual(counts["semantic_field"], {str(self.animals.pk): 2, str(self.food.pk): 1})
+        self.assertEqual(len(counts["tags"]), 1)
+        self.assertNotIn("handedness", counts)
+
+    def test_counts_are_of_current_results(self):
+        counts = gloss_facet_counts(gloss_search_queryset(self.user, QueryDict("location=701")))
+        self.assertEqual(counts["location"], {"701": 2})
+        self.assertEqual(counts["semantic_field"], {str(self.animals.pk): 1})
+
+    def test_facets_in_search_page(self):
+        response = self.client.get(reverse("dictionary:admin_gloss_list"), {"location": "701", "page": "1"})
+        facets = {facet["name"]: facet for facet in response.context["facets"]}
+        # The other locations are counted in the search without the location filter, and replace it.
+        self.assertEqual(facets["location"]["choices"], [{
+            "value": "702", "label": "chest", "count": 1, "selected": False, "query": "location=702"
+        }, {
+            "value": "701", "label": "head", "count": 2, "selected": True, "query": None
+        }])
+        choice = facets["semantic_field"]["choices"][0]
+        self.assertEqual((choice["label"], choice["count"], choice["selected"]), ("animals", 1, False))
+        self.assertEqual(choice["query"], "location=701&semantic_field=%s" % self.animals.pk)
+        self.assertContains(response, "animals (1)")
+
+    def test_multi_valued_facet_counts_are_what_the_choices_find(self):
+        url = reverse("dictionary:admin_gloss_list")
+        response = self.client.get(url, {"semantic_field": self.animals.pk})
+        facets = {facet["name"]: facet for facet in response.context["facets"]}
+        # food is counted in the search without the semantic field filter, not in the animals found.
+        choice = facets["semantic_field"]["choices"][1]
+        self.assertEqual((choice["label"], choice["count"], choice["selected"]), ("food", 1, False))
+        self.assertEqual(choice["query"], "semantic_field=%s" % self.food.pk)
+
+        response = self.client.get(url + "?" + choice["query"])
+        self.assertEqual(response.context["page_obj"].paginator.count, choice["count"])
+        self.assertEqual([self.fish], list(response.context["object_list"]))
@@ -8,7 +8,14 @@ from guardian.shortcuts import assign_perm
 from signbank.tagging.models import Tag
 
 from signbank.dictionary.models import Dataset, Gloss, GlossRelation, SignLanguage
-from signbank.tagging.utils import add_tag, normalize_tag_name, tags_for_object, tags_for_selection
+from signbank.tagging.utils import (
+    add_tag,
+    exclude_queryset_with_any_tags,
+    filter_queryset_with_all_tags,
+    normalize_tag_name,
+    tags_for_object,
+    tags_for_selection,
+)
 
 
 class NormalizeTagNameTestCase(TestCase):
@@ -48,6 +55,62 @@ class GlossTagOrderingTestCase(TestCase):
         self.assertEqual(names, sorted(names))
 
 
+class FilterQuerysetWithTagsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tag-filter', password='test')
+        self.signlanguage = SignLanguage.objects.create(
+            pk=2, name='testsignlanguage', language_code_3char='tst'
+        )
+        self.dataset = Dataset.objects.create(
+            name='testdataset', signlanguage=self.signlanguage
+        )
+        self.glosses = [
+            Gloss.objects.create(idgloss='tag-filter:%s' % i, dataset=self.dataset, created_by=self.user,
+                                 updated_by=self.user)
+            for i in range(3)
+        ]
+        self.glosses[0].tags.add('alpha', 'beta', 'gamma')
+        self.glosses[1].tags.add('alpha', 'beta')
+        self.glosses[2].tags.add('gamma')
+        # A relation with the same id as a gloss must not be matched through its tags.
+        relation = GlossRelation.objects.create(source=self.glosses[2], target=self.glosses[2])
+        relation.tags.add('alpha', 'beta')
+
+    def test_all_tags_by_name(self):
+        qs = filter_queryset_with_all_tags(Gloss.objects.order_by('idgloss'), ['alpha', 'beta'])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(qs), self.glosses[:2])
+
+        qs = filter_queryset_with_all_tags(Gloss.objects.order_by('idgloss'), ['alpha', 'beta', 'gamma'])
+        self.assertEqual(list(qs), self.glosses[:1])
+
+    def test_all_tags_by_id(self):
+        tag_ids = [str(Tag.objects.get(name=name).pk) for name in ('alpha', 'gamma')]
+        qs = filter_queryset_with_all_tags(Gloss.objects.all(), tag_ids=tag_ids)
+        self.assertEqual(list(qs), self.glosses[:1])
+
+    def test_unknown_or_no_tags_match_nothing(self):
+        self.assertFalse(filter_queryset_with_all_tags(Gloss.objects.all(), ['alpha', 'unknown']).exists())
+        self.assertFalse(filter_queryset_with_all_tags(Gloss.objects.all(), []).exists())
+
+    def test_exclude_any_tags(self):
+        qs = exclude_queryset_with_any_tags(Gloss.objects.order_by('idgloss'), ['beta', 'delta'])
+        self.assertEqual(list(qs), self.glosses[2:])
+        qs = exclude_queryset_with_any_tags(Gloss.objects.order_by('idgloss'), tag_ids=[])
+        self.assertEqual(list(qs), self.glosses)
+
+    def test_advanced_search_tags(self):
+        user = User.objects.create_user(username='tag-search', password='test')
+        user.user_permissions.add(Permission.objects.get(codename='search_gloss'))
+        assign_perm('dictionary.view_dataset', user, self.dataset)
+        client = Client()
+        client.force_login(user)
+        alpha, beta, gamma = (Tag.objects.get(name=name).pk for name in ('alpha', 'beta', 'gamma'))
+
+        response = client.get(reverse('dictionary:admin_gloss_list'), {'tags': [alpha, beta], 'nottags': [gamma]})
+        self.assertEqual(list(response.context['object_list']), self.glosses[1:2])
+
+
 class GlossTaggingTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='test', password='test')
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from signbank.dictionary.models import Task
+from signbank.dictionary.taskqueue import claim_next_task, delete_finished_tasks, enqueue, run_task
+
+calls = []
+
+
+def record_call(**kwargs):
+    calls.append(kwargs)
+
+
+def fail(**kwargs):
+    raise RuntimeError("Connection refused")
+
+
+def count(**kwargs):
+    return {"count": len(kwargs)}
+
+
+@override_settings(TASK_MAX_ATTEMPTS=3, TASK_RETRY_DELAY=10)
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_task_is_run_with_its_kwargs(self):
+        enqueue("signbank.dictionary.tests.test_taskqueue.record_call", {"gloss_id": 1})
+        call_command("runworker", "--once")
+
+        self.assertEqual([{"gloss_id": 1}], calls)
+        task = Task.objects.get()
+        self.assertEqual(Task.Status.DONE, task.status)
+        self.assertEqual(1, task.attempts)
+        self.assertIsNotNone(task.finished_at)
+
+    def test_return_value_is_saved_as_the_result(self):
+        enqueue("signbank.dictionary.tests.test_taskqueue.count", {"a": 1, "b": 2})
+        task = run_task(claim_next_task())
+        self.assertEqual({"count": 2}, Task.objects.get(pk=task.pk).result)
+
+    def test_task_is_not_run_before_run_after(self):
+        enqueue("signbank.dictionary.tests.test_taskqueue.record_call",
+                run_after=timezone.now() + datetime.timedelta(minutes=1))
+        self.assertIsNone(claim_next_task())
+
+    def test_claimed_task_is_not_claimed_again(self):
+        task = enqueue("signbank.dictionary.tests.test_taskqueue.record_call")
+        self.assertEqual(task, claim_next_task())
+        self.assertIsNone(claim_next_task())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        task = enqueue("signbank.dictionary.tests.test_taskqueue.fail")
+
+        task = run_task(claim_next_task())
+        self.assertEqual(Task.Status.QUEUED, task.status)
+        self.assertEqual("Connection refused", task.error)
+        self.assertAlmostEqual(10, (task.run_after - timezone.now()).total_seconds(), delta=5)
+        self.assertIsNone(claim_next_task())
+
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        task = run_task(claim_next_task())
+        self.assertEqual(Task.Status.QUEUED, task.status)
+        self.assertAlmostEqual(20, (task.run_after - timezone.now()).total_seconds(), delta=5)
+
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        task = run_task(claim_next_task())
+        self.assertEqual(Task.Status.FAILED, task.status)
+        self.assertEqual(3, task.attempts)
+        self.assertIsNotNone(task.finished_at)
+        self.assertIsNone(claim_next_task())
+
+    def test_timed_out_task_is_started_again(self):
+        task = enqueue("signbank.dictionary.tests.test_taskqueue.record_call", max_attempts=2)
+        claim_next_task()
+        timed_out = timezone.now() - datetime.timedelta(seconds=settings.TASK_TIMEOUT + 1)
+        Task.objects.filter(pk=task.pk).update(started_at=timed_out)
+
+        task = claim_next_task()
+        self.assertEqual(2, task.attempts)
+
+        # Without attempts left, it is given up on
+        Task.objects.filter(pk=task.pk).update(started_at=timed_out)
+        self.assertIsNone(claim_next_task())
+        task.refresh_from_db()
+        self.assertEqual(Task.Status.FAILED, task.status)
+        self.assertEqual("Timed out", task.error)
+
+    def test_old_finished_tasks_are_deleted(self):
+        old = timezone.now() - datetime.timedelta(days=settings.TASK_KEEP_DAYS + 1)
+        Task.objects.create(name="old", status=Task.Status.DONE, finished_at=old)
+        Task.objects.create(name="old", status=Task.Status.FAILED, finished_at=old)
+        recent = Task.objects.create(name="recent", status=Task.Status.DONE, finished_at=timezone.now())
+        queued = enqueue("signbank.dictionary.tests.test_taskqueue.record_call")
+
+        self.assertEqual(2, delete_finished_tasks())
+        self.assertCountEqual([recent, queued], Task.objects.all())
+
+    def test_admin_retries_failed_tasks(self):
+        user = User.objects.create_superuser(username="admin", email=None, password="admin")
+        client = Client()
+        client.force_login(user)
+        failed = Task.objects.create(name="signbank.dictionary.tests.test_taskqueue.record_call",
+                                     status=Task.Status.FAILED, attempts=3, max_attempts=3, error="Timed out",
+                                     finished_at=timezone.now())
+        done = Task.objects.create(name="signbank.dictionary.tests.test_taskqueue.record_call",
+                                   status=Task.Status.DONE, attempts=1, finished_at=timezone.now())
+
+        response = client.post(reverse("admin:dictionary_task_changelist"),
+                               {"action": "retry", "_selected_action": [failed.pk, done.pk]})
+        self.assertEqual(302, response.status_code)
+        failed.refresh_from_db()
+        self.assertEqual(Task.Status.QUEUED, failed.status)
+        self.assertEqual(0, failed.attempts)
+        done.refresh_from_db()
+        self.assertEqual(Task.Status.DONE, done.status)
+
+        self.assertEqual(failed, claim_next_task())
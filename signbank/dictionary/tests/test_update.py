@@ -9,7 +9,7 @@ from django.test import Client, TestCase
 from django.urls import reverse
 from guardian.shortcuts import assign_perm
 
-from signbank.dictionary.models import SignLanguage, Dataset, Gloss, Language
+from signbank.dictionary.models import SignLanguage, Dataset, Gloss, Language, Task
 from signbank.video.models import GlossVideo
 
 
@@ -86,6 +86,10 @@ class UpdateGlossTestCase(TestCase):
         self.assertTrue(self.testgloss.idgloss == new_idgloss)
         # Check that the updated_by user has been updated.
         self.assertTrue(self.testgloss.updated_by == response.wsgi_request.user)
+        # The gloss's video files are renamed in the background
+        task = Task.objects.get()
+        self.assertEqual(task.name, "signbank.video.tasks.rename_glosses_videos")
+        self.assertEqual(task.kwargs, {"gloss_id": self.testgloss.pk})
 
         # Len value == 0 -> ' '
         response = self.client.post(reverse('dictionary:update_gloss', args=[self.testgloss.pk]),
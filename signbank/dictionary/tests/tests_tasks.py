@@ -1,19 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import io
 import random
 from unittest import mock
+from urllib.error import HTTPError, URLError
 
-from django.conf import settings
-from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
 from django.test.utils import override_settings
 
 from signbank.dictionary.models import SignLanguage, Dataset, FieldChoice, Gloss
-from signbank.dictionary.tasks import retrieve_videos_for_glosses
-from signbank.video.models import GlossVideo
+from signbank.dictionary.tasks import VideoRetrievalError, retrieve_videos_for_glosses
+from signbank.video.models import GlossVideo, MediaManifestEntry
 
 
+@override_settings(NZSL_SHARE_HOSTNAME="https://nzsl-share.test")
 class RetrieveVideoForGloss(TestCase):
     def setUp(self):
         self.signlanguage = SignLanguage.objects.create(pk=2, name="testsignlanguage",
@@ -33,35 +35,101 @@ class RetrieveVideoForGloss(TestCase):
         )
         self.gloss = Gloss.objects.create(idgloss="testgloss", dataset=self.dataset)
 
-    @override_settings(MEDIA_ROOT="")
+    def video_detail(self, name, video_type="finalexample1", gloss_pk=None):
+        return {
+            "url": f"/{name}.mp4",
+            "file_name": f"{self.gloss.pk}-{self.gloss.idgloss}.{self.gloss.pk}_{name}.mp4",
+            "gloss_pk": gloss_pk or self.gloss.pk,
+            "video_type": video_type,
+            "version": 0
+        }
+
+    def tearDown(self):
+        for video in GlossVideo.objects.all():
+            video.videofile.delete(save=False)
+
     def test_retrieve_videos_for_glosses(self):
-        video_details = [
-            {
-                "url": "/kiwifruit_1.mp4",
-                "file_name": (
-                    f"{settings.MEDIA_ROOT}/glossvideo/"
-                    f"{self.gloss.pk}-{self.gloss.idgloss}_finalexample_1.png"
-                ),
-                "gloss_pk": self.gloss.pk,
-                "video_type": "finalexample1",
-                "version": 0
-            }
-        ]
-        dummy_file = SimpleUploadedFile(
-            video_details[0]["file_name"], b'data \x00\x01', content_type="video/mp4")
-
-        with mock.patch("signbank.dictionary.tasks.urlretrieve") as mock_retrieve:
-            with mock.patch("signbank.dictionary.tasks.connection.close") as mock_close_connection:
-                mock_retrieve.return_value = (dummy_file, None)
-                mock_close_connection.return_value = None
-                retrieve_videos_for_glosses(video_details)
-                mock_retrieve.assert_called_once()
-                mock_close_connection.assert_called_once()
+        video_details = [self.video_detail("usageexample_1"), self.video_detail("video", video_type="main"),
+                         self.video_detail("deleted", gloss_pk=self.gloss.pk + 1)]
+
+        with mock.patch("signbank.dictionary.tasks.urlopen", side_effect=lambda *args, **kwargs: io.BytesIO(b"data")) \
+                as mock_urlopen:
+            outcomes = retrieve_videos_for_glosses(video_details)
+        self.assertEqual(2, mock_urlopen.call_count)
+        self.assertEqual(["retrieved", "retrieved", "gloss deleted"], [outcome["outcome"] for outcome in outcomes])
 
         videos = GlossVideo.objects.filter(gloss=self.gloss)
-        self.assertTrue(videos.exists())
-        self.assertEqual(videos.count(), 1)
-        video = videos.get()
+        self.assertEqual(videos.count(), 2)
+        video = videos.get(title=video_details[0]["file_name"])
         self.assertEqual(video.video_type, self.finalexample1_vt)
-        self.assertEqual(video.title, dummy_file.name)
+        self.assertEqual(video.dataset, self.dataset)
+        self.assertFalse(video.is_public)
+        self.assertEqual(b"data", video.videofile.read())
+        video.videofile.close()
+        self.assertEqual(self.main_vt, videos.get(title=video_details[1]["file_name"]).video_type)
+
+        # The new files are recorded in the media manifest in the background
+        call_command("runworker", "--once")
+        self.assertEqual(set(videos.values_list("videofile", flat=True)),
+                         set(MediaManifestEntry.objects.filter(exists=True).values_list("key", flat=True)))
+
+        # Videos that have been retrieved already are skipped
+        with mock.patch("signbank.dictionary.tasks.urlopen") as mock_urlopen:
+            outcomes = retrieve_videos_for_glosses(video_details[:1])
+        mock_urlopen.assert_not_called()
+        self.assertEqual("already retrieved", outcomes[0]["outcome"])
+        self.assertEqual(videos.count(), 2)
+
+    @mock.patch("signbank.dictionary.tasks.DOWNLOAD_RETRY_DELAY", 0)
+    def test_transient_failures_are_retried(self):
+        responses = [URLError("timed out"), io.BytesIO(b"data")]
+
+        def urlopen(*args, **kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch("signbank.dictionary.tasks.urlopen", side_effect=urlopen):
+            outcomes = retrieve_videos_for_glosses([self.video_detail("usageexample_1")])
+        self.assertEqual("retrieved", outcomes[0]["outcome"])
+        self.assertEqual(1, GlossVideo.objects.count())
+
+    @mock.patch("signbank.dictionary.tasks.DOWNLOAD_RETRY_DELAY", 0)
+    @override_settings(NZSL_SHARE_DOWNLOAD_ATTEMPTS=2)
+    def test_failed_videos_are_recorded(self):
+        def urlopen(request, **kwargs):
+            code = 404 if "missing" in request.full_url else 503
+            raise HTTPError(request.full_url, code, "Error", {}, None)
+
+        video_details = [self.video_detail("missing"), self.video_detail("unavailable")]
+        with mock.patch("signbank.dictionary.tasks.urlopen", side_effect=urlopen) as mock_urlopen:
+            with self.assertRaises(VideoRetrievalError) as cm:
+                retrieve_videos_for_glosses(video_details)
+        # Only the transient failure is tried again
+        self.assertEqual(3, mock_urlopen.call_count)
+        missing, unavailable = cm.exception.result
+        self.assertEqual(("failed", False), (missing["outcome"], missing["retry"]))
+        self.assertEqual(("failed", True), (unavailable["outcome"], unavailable["retry"]))
+        self.assertIn(video_details[1]["file_name"], str(cm.exception))
+        self.assertFalse(GlossVideo.objects.exists())
+
+        # Permanent failures alone don't fail the retrieval
+        with mock.patch("signbank.dictionary.tasks.urlopen", side_effect=urlopen):
+            outcomes = retrieve_videos_for_glosses(video_details[:1])
+        self.assertEqual("failed", outcomes[0]["outcome"])
 
+    @override_settings(GLOSS_VIDEO_FILE_STORAGE="storages.backends.s3boto3.S3Boto3Storage",
+                       AWS_STORAGE_BUCKET_NAME="signbank-test")
+    def test_videos_are_streamed_to_s3(self):
+        video_detail = self.video_detail("usageexample_1")
+        response = io.BytesIO(b"data")
+        with mock.patch("signbank.dictionary.tasks.urlopen", return_value=response), \
+                mock.patch("signbank.dictionary.tasks.boto3.client") as mock_client:
+            retrieve_videos_for_glosses([video_detail])
+        mock_client.return_value.upload_fileobj.assert_called_once_with(
+            response, "signbank-test", video_detail["file_name"])
+        video = GlossVideo.objects.get()
+        self.assertEqual(video_detail["file_name"], video.videofile.name)
+        # The file is in S3, not in the test storage
+        GlossVideo.objects.all().delete()
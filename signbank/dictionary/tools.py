@@ -1,10 +1,104 @@
-import json
+import datetime
+import os
 
 from django.conf import settings
+from django.contrib.sites.models import Site
+from django.db.models import ManyToManyField, Prefetch
+from django.urls import reverse
 from django.utils.translation import gettext as _
-from zipfile import ZipFile
 
-from signbank.dictionary.models import Dataset, Gloss
+from signbank.dictionary.models import Dataset, Gloss, GlossTranslations, PackageTombstone
+from signbank.video.models import GlossVideo
+
+
+class GlossDataSerializer:
+    """
+    Builds the same dicts as Gloss.get_fields_dict(fieldnames), for all the glosses of a queryset at once.
+
+    get_fields_dict() looks up the site, the Gloss fields and the dataset's languages, and then each related
+    object separately, for every gloss. Here the fields that are asked for are worked out once, and related
+    objects are loaded with select_related() and prefetch_related(), so that serializing a dataset takes the
+    same number of queries whatever the number of glosses.
+    """
+
+    def __init__(self, dataset, fieldnames):
+        self.fieldnames = fieldnames
+        self.domain = Site.objects.get_current().domain
+        #: Language id -> field name, for the languages of the dataset whose translations are asked for.
+        self.translation_fields = {}
+        for language in dataset.translation_languages.all():
+            field_name = f"{_('Gloss')}: {language.name}"
+            if field_name in fieldnames:
+                self.translation_fields[language.pk] = field_name
+        #: The (field, field name) of the Gloss fields that are asked for, in the order of the model's fields.
+        self.gloss_fields = []
+        for field in Gloss._meta.get_fields(include_hidden=True):
+            if not field.concrete:
+                continue
+            field_name = str(field.verbose_name).title()
+            if field_name in fieldnames:
+                self.gloss_fields.append((field, field_name))
+
+    def get_queryset(self, queryset):
+        select_related = []
+        prefetch_related = []
+        for field, _field_name in self.gloss_fields:
+            if isinstance(field, ManyToManyField):
+                prefetch_related.append(field.name)
+            elif field.is_relation:
+                select_related.append(field.name)
+        if self.translation_fields:
+            prefetch_related.append(Prefetch(
+                "glosstranslations_set",
+                queryset=GlossTranslations.objects.filter(language__in=self.translation_fields).order_by("pk"),
+                to_attr="api_translations"
+            ))
+        if "Video" in self.fieldnames:
+            prefetch_related.append(Prefetch(
+                "glossvideo_set",
+                queryset=GlossVideo.objects.filter(version=0).order_by("pk"),
+                to_attr="main_videos"
+            ))
+        return queryset.select_related(*select_related).prefetch_related(*prefetch_related)
+
+    def field_value(self, gloss, field):
+        if field.name == "updated_at":
+            return gloss.updated_at.date()
+        if field.name == "created_by":
+            return gloss.created_by.first_name if gloss.created_by and gloss.created_by.first_name else ""
+        if isinstance(field, ManyToManyField):
+            # Like Gloss.get_wordclasses_display()
+            return ", ".join(str(obj) for obj in getattr(gloss, field.name).all())
+        return str(getattr(gloss, field.name))
+
+    def serialize_gloss(self, gloss):
+        fields = {}
+        if "idgloss" in self.fieldnames:
+            fields["idgloss"] = gloss.idgloss
+        if self.translation_fields:
+            translations = {}
+            for glosstranslations in gloss.api_translations:
+                translations.setdefault(glosstranslations.language_id, glosstranslations.translations)
+            for language_id, field_name in self.translation_fields.items():
+                if language_id in translations:
+                    fields[field_name] = translations[language_id]
+        for field, field_name in self.gloss_fields:
+            field_value = self.field_value(gloss, field)
+            if field_value not in ["", "-", "None"]:
+                fields[field_name] = field_value
+        if "Link" in self.fieldnames:
+            fields["Link"] = f"{self.domain}{reverse('dictionary:public_gloss_view', kwargs={'pk': gloss.pk})}"
+        if "Video" in self.fieldnames and gloss.main_videos:
+            video_path = str(gloss.main_videos[0].videofile)
+            if video_path:
+                fields["Video"] = (
+                    f"{self.domain}{reverse('dictionary:protected_media', kwargs={'filename': video_path})}"
+                )
+        return fields
+
+    def serialize(self, queryset):
+        """Returns a dict of gloss id (as a string) -> the fields dict of the gloss."""
+        return {str(gloss.pk): self.serialize_gloss(gloss) for gloss in self.get_queryset(queryset)}
 
 
 def get_gloss_data(since_timestamp=0, dataset=None):
@@ -30,34 +124,35 @@ def get_gloss_data(since_timestamp=0, dataset=None):
     api_fields_2023.append("Video")
 
     glosses = Gloss.objects.filter(dataset=dataset)
-    gloss_data = {}
-    for gloss in glosses:
-        if since_timestamp and gloss.updated_at > since_timestamp:
-            gloss_data[str(gloss.pk)] = gloss.get_fields_dict(api_fields_2023)
-        else:
-            gloss_data[str(gloss.pk)] = gloss.get_fields_dict(api_fields_2023)
+    if since_timestamp:
+        glosses = glosses.filter(updated_at__gt=timestamp_to_datetime(since_timestamp))
+    return GlossDataSerializer(dataset, api_fields_2023).serialize(glosses)
 
-    return gloss_data
 
+def timestamp_to_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
 
-def create_zip_with_json_files(data_per_file, output_path):
-    """
-    This function is copied from Global Signbank.
-
-    Creates a zip file filled with the output of the functions supplied.
-    Data should either be a json string or a list, which will be transformed to json.
-    """
 
-    INDENTATION_CHARS = 4
+def package_media_key(name):
+    """The key of a media file in the video_urls and image_urls of a package."""
+    return os.path.splitext(os.path.basename(name))[0]
 
-    zip = ZipFile(output_path, 'w')
 
-    for filename, data in data_per_file.items():
-        if isinstance(data, list) or isinstance(data, dict):
-            try:
-                output = json.dumps(data, indent=INDENTATION_CHARS)
-            except TypeError:
-                print('problem processing json.dumps on ', filename)
-                output = ''
-            zip.writestr(filename + '.json', output)
-    zip.close()
+def get_deleted_data(since_timestamp, dataset):
+    """
+    Returns what has been deleted from the dataset since since_timestamp, as a dict of the
+    'deleted_glosses', 'deleted_videos' and 'deleted_images' lists of gloss ids and media keys.
+    """
+    lists = {
+        PackageTombstone.Kind.GLOSS: "deleted_glosses",
+        PackageTombstone.Kind.VIDEO: "deleted_videos",
+        PackageTombstone.Kind.IMAGE: "deleted_images",
+    }
+    deleted = {name: [] for name in lists.values()}
+    tombstones = PackageTombstone.objects\
+        .filter(dataset=dataset, deleted_at__gt=timestamp_to_datetime(since_timestamp))\
+        .order_by("deleted_at", "pk")\
+        .values_list("kind", "key")
+    for kind, key in tombstones:
+        deleted[lists[kind]].append(key)
+    return deleted
@@ -14,11 +14,9 @@ from django.http import (
     HttpResponseForbidden,
     HttpResponseNotAllowed,
     HttpResponseRedirect,
-    HttpResponseServerError,
 )
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 from django.utils.translation import gettext as _
-from guardian.shortcuts import get_perms
 
 from signbank.tagging.utils import normalize_tag_name
 
@@ -46,6 +44,8 @@ from .models import (
     RelationToForeignSign,
     build_choice_list,
 )
+from .permissions import has_dataset_perm
+from .taskqueue import enqueue
 
 
 @permission_required('dictionary.change_gloss')
@@ -57,7 +57,7 @@ def update_gloss(request, glossid):
     gloss = get_object_or_404(Gloss, id=glossid)
 
     # Make sure that the user has rights to edit this datasets glosses.
-    if 'view_dataset' not in get_perms(request.user, gloss.dataset):
+    if not has_dataset_perm(request.user, gloss.dataset):
         return HttpResponseForbidden(_("You do not have permissions to edit Glosses of this dataset/lexicon."))
 
     if request.method == "POST":
@@ -246,13 +246,9 @@ def update_gloss(request, glossid):
                     newvalue = valdict.get(value) or value
 
             # If field is idgloss and if the value has changed
-            # Then change the filename on system and in glossvideo.videofile
+            # Then change the filename on system and in glossvideo.videofile, in the background
             if field == 'idgloss' and newvalue != old_idgloss:
-                try:
-                    GlossVideo.rename_glosses_videos(gloss)
-                except (OSError, IOError):
-                    # Catch error, but don't do anything for now.
-                    return HttpResponseServerError(_("Error: Unable to change videofiles names."))
+                enqueue("signbank.video.tasks.rename_glosses_videos", {"gloss_id": gloss.pk})
 
         return HttpResponse(newvalue, content_type='text/plain')
 
@@ -608,7 +604,7 @@ def add_tag(request, glossid):
 
     if request.method == "POST":
         gloss = get_object_or_404(Gloss, id=glossid)
-        if 'view_dataset' not in get_perms(request.user, gloss.dataset):
+        if not has_dataset_perm(request.user, gloss.dataset):
             # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
             msg = _("You do not have permissions to add tags to glosses of this lexicon.")
             messages.error(request, msg)
@@ -651,7 +647,7 @@ def gloss_relation(request):
         form = GlossRelationForm(request.POST)
         if "delete" in form.data:
             glossrelation = get_object_or_404(GlossRelation, id=int(form.data["delete"]))
-            if 'view_dataset' not in get_perms(request.user, glossrelation.source.dataset):
+            if not has_dataset_perm(request.user, glossrelation.source.dataset):
                 # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
                 msg = _("You do not have permissions to delete relations from glosses of this lexicon.")
                 messages.error(request, msg)
@@ -665,7 +661,7 @@ def gloss_relation(request):
 
         if form.is_valid():
             source = get_object_or_404(Gloss, id=form.cleaned_data["source"])
-            if 'view_dataset' not in get_perms(request.user, source.dataset):
+            if not has_dataset_perm(request.user, source.dataset):
                 # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
                 msg = _("You do not have permissions to add relations to glosses of this lexicon.")
                 messages.error(request, msg)
@@ -79,6 +79,10 @@ urlpatterns = [
          csv_import.import_nzsl_share_gloss_csv, name='import_nzsl_share_gloss_csv'),
     path('advanced/import/csv/nzsl-share/confirm/',
          csv_import.confirm_import_nzsl_share_gloss_csv, name='confirm_import_nzsl_share_gloss_csv'),
+    path('advanced/import/csv/nzsl-share/<int:batch_id>/',
+         csv_import.nzsl_share_import_progress, name='nzsl_share_import_progress'),
+    path('advanced/import/csv/nzsl-share/<int:batch_id>/status/',
+         csv_import.nzsl_share_import_status, name='nzsl_share_import_status'),
     path('advanced/import/csv/qualtrics/',
          csv_import.import_qualtrics_csv, name='import_qualtrics_csv'),
     path('advanced/import/csv/qualtrics/confirm/',
@@ -88,6 +92,14 @@ urlpatterns = [
     path('advanced/import/csv/manual-validation/confirm/',
          csv_import.confirm_import_manual_validation, name='confirm_import_manual_validation_csv'),
 
+    # Background CSV exports of the advanced search
+    path('advanced/export/',
+         adminviews.create_export_job, name='create_export_job'),
+    path('advanced/export/<int:job_id>/',
+         adminviews.export_job_status, name='export_job_status'),
+    path('advanced/export/<int:job_id>/download/',
+         adminviews.export_job_download, name='export_job_download'),
+
     # AJAX urls
     path('ajax/keyword/<str:prefix>',
          views.keyword_value_list),
@@ -5,7 +5,7 @@ import os
 import json
 import time
 
-from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, Http404, StreamingHttpResponse
 from django.shortcuts import render
 from django.conf import settings
 from django.contrib import messages
@@ -18,17 +18,16 @@ from django.views.generic.list import ListView
 from django.views.generic import FormView
 from django.db.models import Q, F, Count, Case, Value, When, BooleanField
 from urllib.parse import quote
-from wsgiref.util import FileWrapper
 
-from guardian.shortcuts import get_perms, get_objects_for_user, get_users_with_perms
+from guardian.shortcuts import get_users_with_perms
 from notifications.signals import notify
 
 from signbank.dictionary.models import Dataset, Keyword, FieldChoice, Gloss, GlossRelation
 from signbank.dictionary.forms import GlossCreateForm, LexiconForm
-from signbank.dictionary import tools
+from signbank.dictionary.permissions import datasets_for_user, has_dataset_perm
+from signbank.dictionary import packages
 from signbank.tagging.utils import normalize_tag_name
 
-from signbank.video.models import GlossVideo
 from signbank.video.forms import GlossVideoForm
 
 
@@ -40,7 +39,7 @@ def create_gloss(request):
         glossvideoform = GlossVideoForm(request.POST, request.FILES)
         glossvideoform.fields['videofile'].required=False
         if form.is_valid() and glossvideoform.is_valid():
-            if 'view_dataset' not in get_perms(request.user, form.cleaned_data["dataset"]):
+            if not has_dataset_perm(request.user, form.cleaned_data["dataset"]):
                 # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
                 msg = _("You do not have permissions to create glosses for this lexicon.")
                 messages.error(request, msg)
@@ -61,11 +60,11 @@ def create_gloss(request):
 
         else:
             # Return bound fields with errors if the form is not valid.
-            allowed_datasets = get_objects_for_user(request.user, 'dictionary.view_dataset')
+            allowed_datasets = datasets_for_user(request.user)
             form.fields["dataset"].queryset = Dataset.objects.filter(id__in=[x.id for x in allowed_datasets])
             return render(request, 'dictionary/create_gloss.html', {'form': form, 'glossvideoform': glossvideoform})
     else:
-        allowed_datasets = get_objects_for_user(request.user, 'dictionary.view_dataset')
+        allowed_datasets = datasets_for_user(request.user)
         form = GlossCreateForm()
         glossvideoform = GlossVideoForm()
         form.fields["dataset"].queryset = Dataset.objects.filter(id__in=[x.id for x in allowed_datasets])
@@ -110,7 +109,7 @@ class ManageLexiconsListView(ListView):
 
     def get_queryset(self):
         # Get allowed datasets for user (django-guardian)
-        allowed_datasets = get_objects_for_user(self.request.user, 'dictionary.view_dataset')
+        allowed_datasets = datasets_for_user(self.request.user)
         # Get queryset
         qs = super().get_queryset()
         qs = qs.annotate(
@@ -147,7 +146,7 @@ def network_graph(request):
     context = dict()
     form = LexiconForm(request.GET, use_required_attribute=False)
     # Get allowed datasets for user (django-guardian)
-    allowed_datasets = get_objects_for_user(request.user, 'dictionary.view_dataset')
+    allowed_datasets = datasets_for_user(request.user)
     # Filter the forms dataset field for the datasets user has permission to.
     form.fields["dataset"].queryset = Dataset.objects.filter(id__in=[x.id for x in allowed_datasets])
     dataset = None
@@ -179,10 +178,8 @@ def package(request):
             dataset = Dataset.objects.get(name=request.GET['dataset_name'])
         else:
             dataset = Dataset.objects.get(name=settings.DEFAULT_DATASET_ACRONYM)
-        available_glosses = Gloss.objects.filter(dataset=dataset)
     else:
         dataset = Dataset.objects.get(name=settings.DEFAULT_DATASET_ACRONYM)
-        available_glosses = Gloss.objects.filter(dataset=dataset)
 
     first_part_of_file_name = 'signbank_pa'
 
@@ -190,7 +187,7 @@ def package(request):
 
     if 'since_timestamp' in request.GET:
         first_part_of_file_name += 'tch'
-        since_timestamp = int(request.GET['since_timestamp'])
+        since_timestamp = packages.since_timestamp_bucket(int(request.GET['since_timestamp']))
         timestamp_part_of_file_name = request.GET[
                                           'since_timestamp'] + '-' + timestamp_part_of_file_name
     else:
@@ -198,39 +195,15 @@ def package(request):
         since_timestamp = 0
 
     archive_file_name = '.'.join([first_part_of_file_name, timestamp_part_of_file_name, 'zip'])
-    archive_file_path = settings.SIGNBANK_PACKAGES_FOLDER + "/" + archive_file_name
-
-    available_glossvideos = GlossVideo.objects.filter(gloss__in=available_glosses)
-
-    video_urls = {
-        os.path.splitext(os.path.basename(gv.videofile.name))[0]: reverse(
-            'dictionary:protected_media',
-            kwargs={"filename": gv.videofile.name}
-        )
-        for gv in available_glossvideos
-        if os.path.exists(str(gv.videofile.path))
-        and os.path.getmtime(str(gv.videofile.path)) > since_timestamp
-        and gv.is_video()
-    }
-
-    image_urls = {
-        os.path.splitext(os.path.basename(gv.videofile.name))[0]: reverse(
-            'dictionary:protected_media', kwargs={"filename": gv.videofile.name}
-        )
-        for gv in available_glossvideos
-        if os.path.exists(str(gv.videofile.path))
-        and os.path.getmtime(str(gv.videofile.path)) > since_timestamp
-        and gv.is_image()
-    }
-
-    collected_data = {'video_urls': video_urls,
-                      'image_urls': image_urls,
-                      'glosses': tools.get_gloss_data(since_timestamp, dataset)}
-
-    tools.create_zip_with_json_files(collected_data, archive_file_path)
-
-    response = HttpResponse(FileWrapper(open(archive_file_path, 'rb')),
-                            content_type='application/zip')
+
+    archive_file_path = packages.cached_package_path(dataset, since_timestamp)
+    package_file = packages.open_cached_package(archive_file_path)
+    if package_file is not None:
+        response = FileResponse(package_file, content_type='application/zip')
+    else:
+        chunks = packages.zip_chunks(packages.package_data(dataset, since_timestamp))
+        response = StreamingHttpResponse(packages.caching_chunks(archive_file_path, chunks),
+                                         content_type='application/zip')
     response['Content-Disposition'] = 'attachment; filename=' + archive_file_name
     return response
 
@@ -240,8 +213,7 @@ def info(request):
     This view is copied from Global Signbank.
     It has been adapted to work for NZSL's data structure.
     """
-    user_datasets = get_objects_for_user(request.user, 'change_dataset',
-                                                            Dataset)
+    user_datasets = datasets_for_user(request.user, 'change_dataset')
     user_datasets_names = [dataset.name for dataset in user_datasets]
 
     # Put the default dataset in first position
@@ -154,6 +154,7 @@ INSTALLED_APPS = (
     'django.contrib.sessions',
     'django.contrib.sites',
     'django.contrib.messages',
+    'django.contrib.postgres',
     'modeltranslation',
     'django.contrib.admin',
     'django.contrib.admindocs',
@@ -216,6 +217,11 @@ pathlib.Path(WRITABLE_FOLDER).mkdir(parents=True, exist_ok=True)
 PACKAGES_FOLDER_NAME = os.getenv("PACKAGES_FOLDER_NAME", "packages")
 SIGNBANK_PACKAGES_FOLDER = os.path.join(WRITABLE_FOLDER, PACKAGES_FOLDER_NAME)
 pathlib.Path(SIGNBANK_PACKAGES_FOLDER).mkdir(parents=True, exist_ok=True)
+#: Number of packages of the package endpoint that are kept in SIGNBANK_PACKAGES_FOLDER.
+PACKAGE_CACHE_MAX_FILES = int(os.getenv("PACKAGE_CACHE_MAX_FILES", 20))
+#: The since_timestamp of incremental packages is rounded down to a multiple of this many seconds,
+#: so that requests made at around the same time get the same package.
+PACKAGE_SINCE_TIMESTAMP_BUCKET = int(os.getenv("PACKAGE_SINCE_TIMESTAMP_BUCKET", 60 * 60))
 LANGUAGE_NAME = os.getenv("LANGUAGE_NAME", "NZSL")
 COUNTRY_NAME = os.getenv("COUNTRY_NAME", "New Zealand")
 USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", 'false').lower() == 'true'
@@ -251,11 +257,50 @@ if os.getenv('AWS_STORAGE_BUCKET_NAME'):
     DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
     GLOSS_VIDEO_FILE_STORAGE = DEFAULT_FILE_STORAGE
     AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
+    # Background CSV exports are kept private in the same bucket as the gloss videos.
+    EXPORT_FILE_STORAGE = GLOSS_VIDEO_FILE_STORAGE
 else:
     GLOSS_VIDEO_FILE_STORAGE = 'signbank.video.models.GlossVideoStorage'
+    EXPORT_FILE_STORAGE = 'signbank.dictionary.models.ExportFileStorage'
+
+#: Hours after which the files of finished background CSV exports are deleted.
+EXPORT_JOB_EXPIRY_HOURS = int(os.getenv('EXPORT_JOB_EXPIRY_HOURS', 48))
+
+#: Seconds the gloss IDs of an advanced search are cached for the gloss detail page's result navigation.
+SEARCH_RESULTS_TTL = int(os.getenv('SEARCH_RESULTS_TTL', 60 * 60))
+#: Number of searches whose results are cached per user, the least recently used are evicted first.
+SEARCH_RESULTS_PER_USER = int(os.getenv('SEARCH_RESULTS_PER_USER', 5))
+#: Seconds the number of matches of a gloss list search is cached for.
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', 5 * 60))
+#: Seconds a user's dataset permissions are cached for. Changes to permissions invalidate them right away.
+DATASET_PERMISSIONS_CACHE_TTL = int(os.getenv('DATASET_PERMISSIONS_CACHE_TTL', 10 * 60))
+#: Seconds the context of a public gloss page is cached for. Changes to the gloss replace it sooner.
+PUBLIC_GLOSS_CACHE_TTL = int(os.getenv('PUBLIC_GLOSS_CACHE_TTL', 60 * 60))
+#: Seconds the rows of a CSV import are kept for, between its preview and its confirmation.
+IMPORT_BATCH_MAX_AGE = int(os.getenv('IMPORT_BATCH_MAX_AGE', 24 * 60 * 60))
+#: Number of rows of an NZSL Share import that are committed together in the background.
+NZSL_SHARE_IMPORT_CHUNK_SIZE = int(os.getenv('NZSL_SHARE_IMPORT_CHUNK_SIZE', 500))
+#: Number of times a background task is started before it is given up on.
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', 5))
+#: Seconds before the first retry of a failed background task. The delay doubles after each attempt.
+TASK_RETRY_DELAY = int(os.getenv('TASK_RETRY_DELAY', 60))
+#: Seconds after which a running background task is assumed to have lost its worker, and is started again.
+TASK_TIMEOUT = int(os.getenv('TASK_TIMEOUT', 60 * 60))
+#: Days finished background tasks are kept for, for the admin.
+TASK_KEEP_DAYS = int(os.getenv('TASK_KEEP_DAYS', 7))
+#: Days the video links of a ready for validation export stay valid for.
+GLOSS_VIDEO_TOKEN_EXPIRY_DAYS = int(os.getenv('GLOSS_VIDEO_TOKEN_EXPIRY_DAYS', 90))
+#: A video's existing link is reused by new exports while it stays valid for at least this many days.
+GLOSS_VIDEO_TOKEN_REUSE_MIN_DAYS = int(os.getenv('GLOSS_VIDEO_TOKEN_REUSE_MIN_DAYS', 30))
 
 NZSL_SHARE_HOSTNAME = os.getenv('NZSL_SHARE_HOSTNAME')
 NZSL_SHARE_BATCH_SIZE = 10
+#: Number of NZSL Share videos that are downloaded at once.
+NZSL_SHARE_DOWNLOAD_WORKERS = int(os.getenv('NZSL_SHARE_DOWNLOAD_WORKERS', 8))
+#: Number of times the download of an NZSL Share video is tried, when it fails with a transient error.
+NZSL_SHARE_DOWNLOAD_ATTEMPTS = int(os.getenv('NZSL_SHARE_DOWNLOAD_ATTEMPTS', 3))
+#: Seconds to wait for NZSL Share to respond to the download of a video.
+NZSL_SHARE_DOWNLOAD_TIMEOUT = int(os.getenv('NZSL_SHARE_DOWNLOAD_TIMEOUT', 60))
 
 mimetypes.add_type("video/mp4", ".mov", True)
 mimetypes.add_type("video/webm", ".webm", True)
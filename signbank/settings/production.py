@@ -15,12 +15,26 @@ from signbank.settings.base import *
 #    os.path.join(PROJECT_DIR, "signbank", "static"),
 # )
 
-#: Use Local-memory caching for specific views (if you have bigger needs, use something else).
+#: Cache in the memory of each process, in front of a cache in the database that all processes share,
+#: see signbank/cache.py. The database table is created by the createcachetable command.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'signbank.cache.TwoTierCache',
         'LOCATION': 'nzsl-signbank-localmemcache',
-    }
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': int(os.getenv('CACHE_L1_MAX_ENTRIES', 1000)),
+            'L1_TIMEOUT': int(os.getenv('CACHE_L1_TIMEOUT', 30)),
+            'L1_COUNTER_TIMEOUT': int(os.getenv('CACHE_L1_COUNTER_TIMEOUT', 1)),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'signbank_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
 }
 
 #: Absolute filesystem path to the directory that will hold user-uploaded files.
@@ -97,38 +97,47 @@ def remove_tag(obj, tag_name):
     ).delete()
 
 
-def filter_queryset_with_all_tags(queryset, tag_names):
+def tagged_object_ids(model, tag_names=None, tag_ids=None, match_all=True):
     """
-    Filter a queryset to objects that have ALL of the specified tags.
+    Return a subquery of the ids of `model` objects tagged with the given tags, by name or by id.
 
-    Works via taggit's GFK (TaggedItem). Prefer Model.objects.filter(tags__name=...)
-    for models that have a TaggableManager.
+    With `match_all` the objects must have all of the tags, which is expressed as a single
+    GROUP BY object_id HAVING COUNT(DISTINCT tag) query over TaggedItem, however many tags are
+    given. Otherwise objects with any of the tags are included.
     """
-    model = queryset.model
-
-    if not tag_names:
-        return model._default_manager.none()
+    content_type = ContentType.objects.get_for_model(model)
+    tagged_items = TaggedItem.objects.filter(content_type=content_type)
+    if tag_names is not None:
+        tags = {normalize_tag_name(name) for name in tag_names if name}
+        tagged_items = tagged_items.filter(tag__name__in=tags)
+    else:
+        tags = {int(tag_id) for tag_id in tag_ids if tag_id != ''}
+        tagged_items = tagged_items.filter(tag_id__in=tags)
+
+    if match_all:
+        tagged_items = tagged_items.values('object_id').annotate(
+            tag_count=Count('tag', distinct=True)
+        ).filter(tag_count=len(tags))
+    return tagged_items.values('object_id')
+
+
+def filter_queryset_with_all_tags(queryset, tag_names=None, tag_ids=None):
+    """
+    Filter a queryset to objects that have ALL of the specified tags, given by name or by id.
 
-    tag_names = [normalize_tag_name(name) for name in tag_names if name]
-    if not tag_names:
-        return model._default_manager.none()
+    Works via taggit's GFK (TaggedItem), so it also works for models without a TaggableManager.
+    Without any tags nothing matches.
+    """
+    if not any(tag_names or tag_ids or ()):
+        return queryset.none()
+    return queryset.filter(pk__in=tagged_object_ids(queryset.model, tag_names, tag_ids))
 
-    tags = Tag.objects.filter(name__in=tag_names)
-    if tags.count() != len(set(tag_names)):
-        return model._default_manager.none()
 
-    content_type = ContentType.objects.get_for_model(model)
-    tagged_items = TaggedItem.objects.filter(
-        content_type=content_type,
-        tag__in=tags,
-    ).values('object_id').annotate(
-        tag_count=Count('tag', distinct=True)
-    ).filter(tag_count=len(set(tag_names)))
-
-    object_ids = [item['object_id'] for item in tagged_items]
-    if object_ids:
-        return queryset.filter(pk__in=object_ids)
-    return model._default_manager.none()
+def exclude_queryset_with_any_tags(queryset, tag_names=None, tag_ids=None):
+    """Exclude the objects that have ANY of the specified tags, given by name or by id, from a queryset."""
+    if not any(tag_names or tag_ids or ()):
+        return queryset
+    return queryset.exclude(pk__in=tagged_object_ids(queryset.model, tag_names, tag_ids, match_all=False))
 
 
 def tags_used_for_model(model):
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-import os
 from django.contrib.auth.decorators import permission_required
 from django.contrib import messages
 from django.shortcuts import render
@@ -13,7 +12,7 @@ from django.utils.translation import gettext as _
 from django.conf import settings
 
 from signbank.dictionary.models import Gloss, Language, Translation, Keyword, Dataset, GlossRelation
-from signbank.video.models import GlossVideo
+from signbank.video.models import GlossVideo, MediaManifestEntry
 
 
 @permission_required("dictionary.search_gloss")
@@ -55,12 +54,13 @@ def infopage(request):
 
     # For users that are 'staff'.
     if request.user.is_staff:
-        # Find missing files
+        # Find missing files, as recorded in the media manifest (see the reconcile_media_manifest command).
         problems = list()
-        for vid in GlossVideo.objects.all():
-            if vid.videofile and not os.path.isfile(vid.videofile.path):
+        missing = set(MediaManifestEntry.objects.filter(exists=False).values_list("key", flat=True))
+        for vid in GlossVideo.objects.filter(Q(videofile__in=missing) | Q(posterfile__in=missing)):
+            if vid.videofile.name in missing:
                 problems.append({"id": vid.id, "file": vid.videofile, "type": "video", "url": vid.get_absolute_url()})
-            if vid.posterfile and not os.path.isfile(vid.posterfile.path):
+            if vid.posterfile.name in missing:
                 problems.append({"id": vid.id, "file": vid.posterfile, "type": "poster",
                                  "admin_url": reverse("admin:video_glossvideo_change", args=(vid.id,))})
         context["problems"] = problems
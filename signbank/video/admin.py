@@ -6,7 +6,7 @@ from django.db.models import Count
 from django.utils.translation import gettext as _
 from django.utils.translation import gettext_lazy as _lazy
 
-from .models import GlossVideo, GlossVideoToken
+from .models import GlossVideo, GlossVideoToken, MediaManifestEntry
 
 
 class HasGlossFilter(admin.SimpleListFilter):
@@ -108,7 +108,15 @@ class GlossVideoAdmin(admin.ModelAdmin):
 class GlossVideoTokenAdmin(admin.ModelAdmin):
     model = GlossVideoToken
 
-    list_display = ("video", "token")
+    list_display = ("video", "token", "expires_at")
+
+
+class MediaManifestEntryAdmin(admin.ModelAdmin):
+    model = MediaManifestEntry
+
+    list_display = ("key", "exists", "size", "modified_at", "checked_at")
+    list_filter = ("exists",)
+    search_fields = ("key",)
 
 class GlossVideoInline(admin.TabularInline):
     model = GlossVideo
@@ -117,3 +125,4 @@ class GlossVideoInline(admin.TabularInline):
 
 admin.site.register(GlossVideo, GlossVideoAdmin)
 admin.site.register(GlossVideoToken, GlossVideoTokenAdmin)
+admin.site.register(MediaManifestEntry, MediaManifestEntryAdmin)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from signbank.video.models import GlossVideoToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the GlossVideoTokens of ready for validation exports that have expired. "
+        "Meant to be run periodically, eg. daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only print how many tokens would be deleted.',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = GlossVideoToken.objects.filter(expires_at__lte=timezone.now()).count()
+            print(f"Would delete {count} expired GlossVideoTokens")
+            return
+        deleted = GlossVideoToken.delete_expired()
+        print(f"Deleted {deleted} expired GlossVideoTokens")
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from signbank.video.models import GlossVideo, MediaManifestEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the media manifest from a listing of the storage of GlossVideos: record the size, content hash, "
+        "modified time and existence of every videofile and posterfile, and delete the entries of files that "
+        "no GlossVideo refers to. Meant to be run periodically, eg. daily, and after files are changed in the "
+        "storage directly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only print how many entries would be changed.',
+        )
+
+    def handle(self, *args, **options):
+        storage = GlossVideo._meta.get_field('videofile').storage
+        changed, deleted = MediaManifestEntry.reconcile(storage, dry_run=options['dry_run'])
+        if options['dry_run']:
+            print(f"Would update {changed} and delete {deleted} media manifest entries")
+            return
+        print(f"Updated {changed} and deleted {deleted} media manifest entries")
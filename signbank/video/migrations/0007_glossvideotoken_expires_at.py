@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:03
+
+import signbank.video.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0006_alter_glossvideo_videofile_upload_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='glossvideotoken',
+            name='expires_at',
+            field=models.DateTimeField(default=signbank.video.models.glossvideotoken_expiry, verbose_name='Expires at'),
+        ),
+        migrations.AddIndex(
+            model_name='glossvideotoken',
+            index=models.Index(fields=['video', 'expires_at'], name='video_gloss_video_i_da00f3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='glossvideotoken',
+            index=models.Index(fields=['expires_at'], name='video_gloss_expires_ac12b7_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='glossvideotoken',
+            constraint=models.UniqueConstraint(fields=('token', 'video'), name='unique_glossvideotoken_token_video'),
+        ),
+    ]
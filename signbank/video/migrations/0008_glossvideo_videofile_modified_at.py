@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0007_glossvideotoken_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='glossvideo',
+            name='videofile_modified_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Video file modified at'),
+        ),
+    ]
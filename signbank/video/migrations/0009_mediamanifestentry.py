@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('video', '0008_glossvideo_videofile_modified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaManifestEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=1024, unique=True, verbose_name='Key')),
+                ('exists', models.BooleanField(default=True, verbose_name='Exists')),
+                ('size', models.BigIntegerField(blank=True, null=True, verbose_name='Size')),
+                ('content_hash', models.CharField(blank=True, max_length=64, verbose_name='Content hash')),
+                ('modified_at', models.DateTimeField(blank=True, null=True, verbose_name='Modified at')),
+                ('checked_at', models.DateTimeField(auto_now=True, verbose_name='Checked at')),
+            ],
+            options={
+                'verbose_name': 'Media manifest entry',
+                'verbose_name_plural': 'Media manifest entries',
+                'indexes': [models.Index(condition=models.Q(('exists', False)), fields=['key'], name='mediamanifest_missing_key')],
+            },
+        ),
+    ]
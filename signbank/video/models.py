@@ -3,17 +3,22 @@
 from __future__ import unicode_literals
 
 import datetime
+import hashlib
 import mimetypes
 import os
 import uuid
 
+from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
 from storages.backends.s3boto3 import S3Boto3Storage
 
+from signbank.dictionary.taskqueue import enqueue
+
 
 class GlossVideoStorage(FileSystemStorage):
     """Video storage, handles saving to directories based on filenames first two characters."""
@@ -64,6 +69,52 @@ class GlossVideoDynamicStorage(import_string(settings.GLOSS_VIDEO_FILE_STORAGE))
             Key=name
         )
 
+    def file_stat(self, name):
+        """
+        Return the (size, content hash, modified time) of the file `name`, or None if it doesn't exist.
+        The content hash is the ETag of the object in S3, or the MD5 of a local file.
+        """
+        if isinstance(self, S3Boto3Storage):
+            obj = self.bucket.Object(name)
+            try:
+                obj.load()
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                    return None
+                raise
+            return obj.content_length, obj.e_tag.strip('"'), obj.last_modified
+
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        return stat.st_size, md5.hexdigest(), datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc)
+
+    def list_file_stats(self):
+        """
+        Yield the (name, size, content hash, modified time) of every file in the storage. S3 is listed a
+        thousand objects per request. Local files are not read, their content hash is None.
+        """
+        if isinstance(self, S3Boto3Storage):
+            for obj in self.bucket.objects.all():
+                yield obj.key, obj.size, obj.e_tag.strip('"'), obj.last_modified
+            return
+
+        for root, _dirs, files in os.walk(self.location):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                yield name, stat.st_size, None, datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc)
+
 
 def glossvideo_upload_to(instance, filename):
     """Ignore the client basename; use a unique temp key until rename_video.
@@ -113,6 +164,8 @@ class GlossVideo(models.Model):
         help_text=_("The type of video this is for on the gloss"),
         limit_choices_to={'field': 'video_type'},
         null=True, on_delete=models.SET_NULL)
+    #: When the videofile was last uploaded or renamed. Used to select the media of incremental packages.
+    videofile_modified_at = models.DateTimeField(_("Video file modified at"), default=timezone.now, db_index=True)
 
     class Meta:
         ordering = ['version']
@@ -120,15 +173,15 @@ class GlossVideo(models.Model):
         verbose_name_plural = _('Gloss videos')
 
 
-    def _previous_visibility_state(self):
+    def _previous_state(self):
         if not self.pk:
-            return None, None
+            return None, None, None
         previous = type(self).objects.filter(pk=self.pk).values(
-            'is_public', 'videofile'
+            'is_public', 'videofile', 'posterfile'
         ).first()
         if not previous:
-            return None, None
-        return previous['is_public'], previous['videofile']
+            return None, None, None
+        return previous['is_public'], previous['videofile'], previous['posterfile']
 
     def _other_rows_reference_videofile(self, name, exclude_pk=None):
         if not name:
@@ -154,7 +207,9 @@ class GlossVideo(models.Model):
 
     def save(self, *args, **kwargs):
         creating = self._state.adding
-        previous_is_public, previous_videofile_name = self._previous_visibility_state()
+        previous_is_public, previous_videofile_name, previous_posterfile_name = self._previous_state()
+        if not creating and self.videofile.name != previous_videofile_name:
+            self.videofile_modified_at = timezone.now()
         if creating:
             # If no title is set, use the filename of the uploaded file.
             if not self.title:
@@ -168,19 +223,33 @@ class GlossVideo(models.Model):
             # Make sure glossvideo has the same dataset as gloss.
             self.dataset = self.gloss.dataset
             # Rename videofile.
+            renamed_from = self.videofile.name
             self.rename_video()
+            if self.videofile.name != renamed_from:
+                self.videofile_modified_at = timezone.now()
             # Save without args and kwargs.
             super(GlossVideo, self).save()
 
         if self._should_sync_s3_acl(creating, previous_is_public, previous_videofile_name):
             self._sync_s3_acl()
 
+        # Looking the files up in the storage takes a request to S3, or reading the whole file to hash it,
+        # so the media manifest is updated in the background.
+        names = [name for name, previous_name in ((self.videofile.name, previous_videofile_name),
+                                                  (self.posterfile.name, previous_posterfile_name))
+                 if name and name != previous_name]
+        if names:
+            enqueue("signbank.video.tasks.record_media_manifest", {"names": names})
+
     def delete(self, *args, **kwargs):
         if self.videofile and self.videofile.name:
             if self._other_rows_reference_videofile(self.videofile.name, exclude_pk=self.pk):
                 type(self).objects.filter(pk=self.pk).update(videofile='')
                 self.videofile.name = ''
-        super(GlossVideo, self).delete(*args, **kwargs)
+        names = [name for name in (self.videofile.name, self.posterfile.name) if name]
+        result = super(GlossVideo, self).delete(*args, **kwargs)
+        MediaManifestEntry.forget_unreferenced(names)
+        return result
 
     def next_version(self):
         """Return a next suitable version number."""
@@ -251,9 +320,11 @@ class GlossVideo(models.Model):
                 return
             # Clear a stale/orphan object at the target before writing the
             # canonical key (avoids leaving two DB rows pointing at one object
-            # if a previous upload failed mid-rename).
+            # if a previous upload failed mid-rename). Storages that overwrite files, like S3, replace
+            # it when the file is saved, so they aren't asked whether it exists (a request to S3).
             if (
-                not self._other_rows_reference_videofile(full_new_path, exclude_pk=self.pk)
+                not getattr(storage, 'file_overwrite', False)
+                and not self._other_rows_reference_videofile(full_new_path, exclude_pk=self.pk)
                 and storage.exists(full_new_path)
             ):
                 storage.delete(full_new_path)
@@ -263,6 +334,7 @@ class GlossVideo(models.Model):
             self.videofile = saved_file_path
             if old_name and old_name != saved_file_path:
                 storage.delete(old_name)
+                MediaManifestEntry.objects.filter(key=old_name).update(exists=False, size=None, content_hash='')
 
     def create_filename(self):
         """Returns a correctly named filename"""
@@ -322,7 +394,13 @@ class GlossVideo(models.Model):
         return False
 
     def get_videofile_modified_date(self):
-        """Return a Datetime object from filesystems last modified time of path."""
+        """
+        Return a Datetime object of the last modified time of the videofile, from the media manifest.
+        Files that are not in the manifest yet are looked up in the storage.
+        """
+        entry = MediaManifestEntry.objects.filter(key=self.videofile.name).only('exists', 'modified_at').first()
+        if entry is not None:
+            return entry.modified_at if entry.exists else None
         try:
             return self.videofile.storage.get_modified_time(self.videofile.name)
         except:
@@ -332,6 +410,166 @@ class GlossVideo(models.Model):
         return self.videofile.name
 
 
+class MediaManifestEntry(models.Model):
+    """
+    What is known about a file in the storage of GlossVideos, that a videofile or posterfile refers to,
+    so that pages can find out whether media exists, and its size and modified time, without asking
+    the storage (a request to S3) for every file. Entries are updated in the background when GlossVideos
+    are uploaded, renamed and retrieved from NZSL Share, and when they are deleted. The
+    reconcile_media_manifest command brings them in line with the storage.
+    """
+    #: Name of the file in the storage, as in GlossVideo.videofile and GlossVideo.posterfile.
+    key = models.CharField(_("Key"), max_length=1024, unique=True)
+    exists = models.BooleanField(_("Exists"), default=True)
+    size = models.BigIntegerField(_("Size"), null=True, blank=True)
+    #: The ETag of the object in S3, or the MD5 of a local file.
+    content_hash = models.CharField(_("Content hash"), max_length=64, blank=True)
+    modified_at = models.DateTimeField(_("Modified at"), null=True, blank=True)
+    checked_at = models.DateTimeField(_("Checked at"), auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["key"], name="mediamanifest_missing_key", condition=models.Q(exists=False)),
+        ]
+        verbose_name = _("Media manifest entry")
+        verbose_name_plural = _("Media manifest entries")
+
+    def __str__(self):
+        return self.key
+
+    @classmethod
+    def record_referenced(cls, names):
+        """
+        Look up the files in `names` in the storage of GlossVideos and update their entries, leaving out
+        the ones that no GlossVideo refers to anymore, eg. because they have been renamed since.
+        """
+        referenced = GlossVideo.objects.filter(models.Q(videofile__in=names) | models.Q(posterfile__in=names))\
+            .values_list('videofile', 'posterfile')
+        referenced = {name for names_of_video in referenced for name in names_of_video}
+        storage = GlossVideo._meta.get_field('videofile').storage
+        return [cls.record(storage, name) for name in names if name in referenced]
+
+    @classmethod
+    def record(cls, storage, name):
+        """Look up the file `name` in `storage` and update its entry."""
+        stat = storage.file_stat(name)
+        size, content_hash, modified_at = stat if stat is not None else (None, '', None)
+        entry, _created = cls.objects.update_or_create(key=name, defaults={
+            'exists': stat is not None,
+            'size': size,
+            'content_hash': content_hash,
+            'modified_at': modified_at,
+        })
+        return entry
+
+    @classmethod
+    def referenced_keys(cls):
+        """Return a queryset of the videofile and posterfile names of all GlossVideos."""
+        videofiles = GlossVideo.objects.exclude(videofile='').values_list('videofile', flat=True)
+        posterfiles = GlossVideo.objects.exclude(posterfile='').values_list('posterfile', flat=True)
+        return videofiles.union(posterfiles)
+
+    @classmethod
+    def forget_unreferenced(cls, names):
+        """Delete the entries of the files in `names` that no GlossVideo refers to anymore."""
+        if not names:
+            return
+        referenced = GlossVideo.objects.filter(models.Q(videofile__in=names) | models.Q(posterfile__in=names))
+        cls.objects.filter(key__in=names)\
+            .exclude(key__in=referenced.values('videofile'))\
+            .exclude(key__in=referenced.values('posterfile'))\
+            .delete()
+
+    @classmethod
+    def reconcile(cls, storage, dry_run=False):
+        """
+        Bring the entries in line with a listing of `storage`: create the entries of files that GlossVideos
+        refer to, update the ones that differ from the storage, and delete the ones nothing refers to.
+        Returns the number of entries that were (created or updated, deleted).
+        """
+        referenced = set(cls.referenced_keys())
+        listed = {}
+        for name, size, content_hash, modified_at in storage.list_file_stats():
+            if name in referenced:
+                listed[name] = (size, content_hash, modified_at)
+
+        entries = {entry.key: entry for entry in cls.objects.filter(key__in=referenced)}
+        changed = []
+        for key in referenced:
+            entry = entries.get(key) or cls(key=key)
+            size, content_hash, modified_at = listed.get(key, (None, '', None))
+            exists = key in listed
+            if exists and content_hash is None:
+                # Local files are only read to hash them when they don't match their entry.
+                if entry.exists and entry.size == size and entry.modified_at == modified_at:
+                    content_hash = entry.content_hash
+                else:
+                    stat = storage.file_stat(key)
+                    content_hash = stat[1] if stat is not None else ''
+            state = (exists, size, content_hash, modified_at)
+            if entry.pk is None or (entry.exists, entry.size, entry.content_hash, entry.modified_at) != state:
+                entry.exists, entry.size, entry.content_hash, entry.modified_at = state
+                changed.append(entry)
+
+        unreferenced = cls.objects.exclude(key__in=GlossVideo.objects.values('videofile'))\
+            .exclude(key__in=GlossVideo.objects.values('posterfile'))
+        if dry_run:
+            return len(changed), unreferenced.count()
+        cls.objects.bulk_create(
+            changed, batch_size=1000, update_conflicts=True, unique_fields=['key'],
+            update_fields=['exists', 'size', 'content_hash', 'modified_at', 'checked_at'],
+        )
+        deleted, _deleted_per_model = unreferenced.delete()
+        return len(changed), deleted
+
+
+def glossvideotoken_expiry():
+    return timezone.now() + datetime.timedelta(days=settings.GLOSS_VIDEO_TOKEN_EXPIRY_DAYS)
+
+
 class GlossVideoToken(models.Model):
+    """
+    Token in the link to a GlossVideo that is given out in the ready for validation export, and
+    redirects to a presigned URL of the video until it expires.
+    """
     token = models.UUIDField(default=uuid.uuid4)
     video = models.ForeignKey(to=GlossVideo, on_delete=models.CASCADE)
+    expires_at = models.DateTimeField(_("Expires at"), default=glossvideotoken_expiry)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["token", "video"], name="unique_glossvideotoken_token_video"),
+        ]
+        indexes = [
+            models.Index(fields=["video", "expires_at"]),
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self):
+        return str(self.token)
+
+    @classmethod
+    def tokens_for_videos(cls, videos):
+        """
+        Returns a dict of video id -> GlossVideoToken for the given videos. A token of a video is reused while
+        it is valid for at least GLOSS_VIDEO_TOKEN_REUSE_MIN_DAYS more days, otherwise a new one is created.
+        Uses one query to find the tokens, and one to create the missing ones.
+        """
+        video_ids = {video.pk for video in videos}
+        min_expiry = timezone.now() + datetime.timedelta(days=settings.GLOSS_VIDEO_TOKEN_REUSE_MIN_DAYS)
+        tokens = {}
+        # The token of each video that stays valid the longest.
+        for token in cls.objects.filter(video_id__in=video_ids, expires_at__gte=min_expiry)\
+                .order_by("video_id", "-expires_at").distinct("video_id"):
+            tokens[token.video_id] = token
+        new_tokens = cls.objects.bulk_create(
+            cls(video_id=video_id) for video_id in sorted(video_ids - set(tokens))
+        )
+        tokens.update((token.video_id, token) for token in new_tokens)
+        return tokens
+
+    @classmethod
+    def delete_expired(cls):
+        """Delete the tokens that have expired, returning how many were deleted."""
+        deleted, _deleted_per_model = cls.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
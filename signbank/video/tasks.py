@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from ..dictionary.models import Gloss
+from .models import GlossVideo, MediaManifestEntry
+
+
+def rename_glosses_videos(gloss_id):
+    """
+    Rename the video files of the gloss to match its idgloss. Queued when the idgloss of a gloss is
+    changed, see taskqueue.py.
+    """
+    gloss = Gloss.objects.filter(pk=gloss_id).first()
+    if gloss is not None:
+        GlossVideo.rename_glosses_videos(gloss)
+
+
+def record_media_manifest(names):
+    """
+    Record the files `names` of GlossVideos in the media manifest. Queued when files are uploaded, renamed
+    or retrieved from NZSL Share.
+    """
+    MediaManifestEntry.record_referenced(names)
@@ -1,13 +1,17 @@
+import datetime
+import hashlib
 from unittest.mock import patch
 
 from django.contrib.auth.models import Permission, User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase
 from django.urls import reverse
+from django.utils import timezone
 from guardian.shortcuts import assign_perm
 
 from signbank.dictionary.models import Dataset, FieldChoice, Gloss, SignLanguage
-from signbank.video.models import GlossVideo
+from signbank.video.models import GlossVideo, GlossVideoToken, MediaManifestEntry
 
 
 class GlossVideoAclSyncTestCase(TestCase):
@@ -159,3 +163,126 @@ class ChangeGlossVideoPublicityTestCase(TestCase):
         self.glossvideo.refresh_from_db()
         self.assertFalse(self.glossvideo.is_public)
         self.assertTrue(any(call[0][1] is False for call in mock_set_public.call_args_list))
+
+
+class GlossVideoTokenTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test')
+        signlanguage = SignLanguage.objects.create(
+            pk=2, name='testsignlanguage', language_code_3char='tst')
+        dataset = Dataset.objects.create(name='testdataset', signlanguage=signlanguage)
+        gloss = Gloss.objects.create(idgloss='testgloss', dataset=dataset, created_by=self.user,
+                                     updated_by=self.user)
+        self.videos = [
+            GlossVideo.objects.create(
+                gloss=gloss,
+                dataset=dataset,
+                videofile=SimpleUploadedFile('clip%s.mp4' % i, b'video-bytes', content_type='video/mp4'),
+            )
+            for i in range(2)
+        ]
+
+    def test_tokens_for_videos_creates_tokens(self):
+        tokens = GlossVideoToken.tokens_for_videos(self.videos)
+        self.assertEqual(set(tokens), {video.pk for video in self.videos})
+        self.assertEqual(GlossVideoToken.objects.count(), 2)
+        self.assertGreater(tokens[self.videos[0].pk].expires_at, timezone.now() + datetime.timedelta(days=89))
+
+    def test_tokens_for_videos_reuses_valid_tokens(self):
+        token = GlossVideoToken.objects.create(video=self.videos[0])
+        GlossVideoToken.objects.create(video=self.videos[1], expires_at=timezone.now() + datetime.timedelta(days=1))
+
+        with self.assertNumQueries(2):
+            tokens = GlossVideoToken.tokens_for_videos(self.videos)
+        self.assertEqual(tokens[self.videos[0].pk], token)
+        # The token that is about to expire is replaced
+        self.assertEqual(GlossVideoToken.objects.filter(video=self.videos[1]).count(), 2)
+        self.assertGreater(tokens[self.videos[1].pk].expires_at, timezone.now() + datetime.timedelta(days=89))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(GlossVideoToken.tokens_for_videos(self.videos), tokens)
+
+    def test_delete_expired(self):
+        valid = GlossVideoToken.objects.create(video=self.videos[0])
+        GlossVideoToken.objects.create(video=self.videos[1], expires_at=timezone.now())
+        self.assertEqual(GlossVideoToken.delete_expired(), 1)
+        self.assertEqual(list(GlossVideoToken.objects.all()), [valid])
+
+
+class MediaManifestEntryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test')
+        signlanguage = SignLanguage.objects.create(
+            pk=2, name='testsignlanguage', language_code_3char='tst')
+        self.dataset = Dataset.objects.create(name='testdataset', signlanguage=signlanguage)
+        self.gloss = Gloss.objects.create(idgloss='testgloss', dataset=self.dataset, created_by=self.user,
+                                          updated_by=self.user)
+        self.video = GlossVideo.objects.create(
+            gloss=self.gloss,
+            dataset=self.dataset,
+            videofile=SimpleUploadedFile('clip.mp4', b'video-bytes', content_type='video/mp4'),
+        )
+        self.storage = self.video.videofile.storage
+        # The media manifest is updated in the background.
+        call_command('runworker', '--once')
+
+    def test_upload_records_entry(self):
+        entry = MediaManifestEntry.objects.get(key=self.video.videofile.name)
+        self.assertTrue(entry.exists)
+        self.assertEqual(entry.size, len(b'video-bytes'))
+        self.assertEqual(entry.content_hash, hashlib.md5(b'video-bytes').hexdigest())
+        self.assertEqual(entry.modified_at, self.storage.get_modified_time(self.video.videofile.name))
+        # The name the file was uploaded with before it was renamed is not kept.
+        self.assertEqual(MediaManifestEntry.objects.count(), 1)
+
+    def test_get_videofile_modified_date_reads_manifest(self):
+        entry = MediaManifestEntry.objects.get(key=self.video.videofile.name)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.video.get_videofile_modified_date(), entry.modified_at)
+
+        entry.exists = False
+        entry.save()
+        self.assertIsNone(self.video.get_videofile_modified_date())
+
+    def test_delete_forgets_entry(self):
+        self.video.delete()
+        self.assertFalse(MediaManifestEntry.objects.exists())
+
+    def test_rename_updates_entries(self):
+        old_name = self.video.videofile.name
+        self.gloss.idgloss = 'renamed'
+        self.gloss.save()
+        GlossVideo.rename_glosses_videos(self.gloss)
+        self.video.refresh_from_db()
+        self.assertNotEqual(self.video.videofile.name, old_name)
+        self.assertFalse(MediaManifestEntry.objects.get(key=old_name).exists)
+
+        call_command('runworker', '--once')
+        self.assertTrue(MediaManifestEntry.objects.get(key=self.video.videofile.name).exists)
+
+    def test_rename_only_deletes_the_old_file_on_s3(self):
+        """Storages that overwrite files, like S3, aren't asked to clear the target of a rename first."""
+        old_name = self.video.videofile.name
+        storage = self.video.videofile.storage
+        self.gloss.idgloss = 'renamed'
+        self.gloss.save()
+        with patch.object(storage, 'file_overwrite', True, create=True), \
+                patch.object(storage, 'delete', wraps=storage.delete) as delete:
+            GlossVideo.rename_glosses_videos(self.gloss)
+        delete.assert_called_once_with(old_name)
+
+    def test_reconcile(self):
+        name = self.video.videofile.name
+        self.storage.delete(name)
+        MediaManifestEntry.objects.create(key='glossvideo/unreferenced.mp4')
+
+        self.assertEqual(MediaManifestEntry.reconcile(self.storage, dry_run=True), (1, 1))
+        self.assertTrue(MediaManifestEntry.objects.get(key=name).exists)
+
+        self.assertEqual(MediaManifestEntry.reconcile(self.storage), (1, 1))
+        entry = MediaManifestEntry.objects.get()
+        self.assertEqual(entry.key, name)
+        self.assertFalse(entry.exists)
+        self.assertIsNone(entry.size)
+        # Nothing changed since.
+        self.assertEqual(MediaManifestEntry.reconcile(self.storage), (0, 0))
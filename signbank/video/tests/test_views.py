@@ -3,8 +3,9 @@ from uuid import uuid4
 from django.contrib.auth.models import Permission, User
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from guardian.shortcuts import assign_perm
 from signbank.dictionary.models import (Dataset, FieldChoice, Gloss, Language,
                                         SignLanguage)
@@ -428,3 +429,22 @@ class GlossVideoTokenSignedUrlTestCase(TestCase):
             response.url,
             self.glossvid.videofile.storage.url(self.glossvid.videofile.name)
         )
+
+    def test_404_on_expired_token(self):
+        expired_token = GlossVideoToken.objects.create(video=self.glossvid, expires_at=timezone.now())
+        client = Client()
+        response = client.get(reverse("video:get_signed_glossvideo_url",
+                                      kwargs={"token": expired_token.token,
+                                              "videoid": self.glossvid.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_signed_url_is_cached(self):
+        client = Client()
+        url = reverse("video:get_signed_glossvideo_url",
+                      kwargs={"token": self.video_token.token, "videoid": self.glossvid.pk})
+        first_response = client.get(url)
+        with self.assertNumQueries(0):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, first_response.url)
@@ -6,35 +6,56 @@ from base64 import b64decode
 
 from django.contrib import messages
 from django.contrib.auth.decorators import permission_required
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.files.base import ContentFile
 from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotFound
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.utils.translation import gettext as _
 from django.views.generic.edit import FormView
 from django.views.generic.list import ListView
 from djqscsv import render_to_csv_response
-from guardian.shortcuts import get_objects_for_user, get_perms
 from storages.backends.s3boto3 import S3Boto3Storage
 
 from ..dictionary.models import Dataset, FieldChoice, Gloss
+from ..dictionary.permissions import datasets_for_user, has_dataset_perm
 from .forms import (GlossVideoForGlossForm, GlossVideoForm,
                     GlossVideoPosterForm, GlossVideoUpdateForm,
                     MultipleVideoUploadForm)
 from .models import GlossVideo, GlossVideoDynamicStorage, GlossVideoToken
 
 
+#: Seconds before a presigned URL expires that it stops being handed out from the cache.
+SIGNED_URL_EXPIRY_MARGIN = 60
+
+
 def get_signed_video_url_from_glossvideotoken(request, token, videoid):
     if not request.method == "GET":
         return HttpResponseNotAllowed(["GET"])
-    try:
-        video_token = GlossVideoToken.objects.get(token=token, video__pk=videoid)
-    except GlossVideoToken.DoesNotExist:
-        return HttpResponseNotFound()
 
-    video = video_token.video
-    url = video.videofile.storage.url(video.videofile.name)
+    # The presigned URL is cached for as long as both it and the token stay valid, so that
+    # repeated hits on the same link don't look up the token and sign a new URL every time.
+    key = "glossvideotoken_url:%s:%s" % (token, videoid)
+    url = cache.get(key)
+    if url is None:
+        now = timezone.now()
+        try:
+            video_token = GlossVideoToken.objects.select_related("video").get(
+                token=token, video__pk=videoid, expires_at__gt=now
+            )
+        except GlossVideoToken.DoesNotExist:
+            return HttpResponseNotFound()
+
+        video = video_token.video
+        storage = video.videofile.storage
+        url = storage.url(video.videofile.name)
+        # Storages other than S3 return URLs that don't expire, those are cached for an hour at most.
+        url_lifetime = getattr(storage, "querystring_expire", 60 * 60) - SIGNED_URL_EXPIRY_MARGIN
+        timeout = min(url_lifetime, int((video_token.expires_at - now).total_seconds()))
+        if timeout > 0:
+            cache.set(key, url, timeout)
     return redirect(url)
 
 
@@ -74,7 +95,7 @@ def upload_glossvideo_gloss(request):
         if form.is_valid():
             gloss = form.cleaned_data['gloss']
 
-            if 'view_dataset' not in get_perms(request.user, gloss.dataset):
+            if not has_dataset_perm(request.user, gloss.dataset):
                 # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
                 msg = _("You do not have permissions to upload videos for this lexicon.")
                 messages.error(request, msg)
@@ -118,7 +139,7 @@ def add_recorded_video_view(request):
         form = GlossVideoForGlossForm(post_values, request.FILES)
         if form.is_valid():
             gloss = form.cleaned_data['gloss']
-            if 'view_dataset' not in get_perms(request.user, gloss.dataset):
+            if not has_dataset_perm(request.user, gloss.dataset):
                 # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
                 msg = _("You do not have permissions to change order for videos of this lexicon.")
                 messages.error(request, msg)
@@ -155,7 +176,7 @@ def add_poster(request):
         # Get glossvideos pk from the submitted form data
         glossvideo_pk = form.data['pk']
         glossvideo = GlossVideo.objects.get(pk=glossvideo_pk)
-        if 'view_dataset' not in get_perms(request.user, glossvideo.gloss.dataset):
+        if not has_dataset_perm(request.user, glossvideo.gloss.dataset):
             # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
             msg = _("You do not have permissions to add/change poster images for glosses videos of this lexicon.")
             messages.error(request, msg)
@@ -185,7 +206,7 @@ class AddVideosView(FormView):
 
     def get_form(self, formclass=None):
         form = super(AddVideosView, self).get_form()
-        allowed_datasets = get_objects_for_user(self.request.user, 'dictionary.view_dataset')
+        allowed_datasets = datasets_for_user(self.request.user)
         # Make sure we only list datasets the user has permissions to.
         form.fields["dataset"].queryset = form.fields["dataset"].queryset.filter(id__in=[x.id for x in allowed_datasets])
         return form
@@ -197,7 +218,7 @@ class AddVideosView(FormView):
         if form.is_valid():
             data = form.cleaned_data
             dataset = data['dataset']
-            if 'view_dataset' not in get_perms(request.user, data["dataset"]):
+            if not has_dataset_perm(request.user, data["dataset"]):
                 # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
                 msg = _("You do not have permissions to upload videos for this lexicon.")
                 messages.error(request, msg)
@@ -243,12 +264,12 @@ class UploadedGlossvideosListView(ListView):
         context['page'] = page
         # Set get params in form
         form = GlossVideoUpdateForm(self.request.GET)
-        allowed_datasets = get_objects_for_user(self.request.user, 'dictionary.view_dataset')
+        allowed_datasets = datasets_for_user(self.request.user)
         # Make sure we only list datasets the user has permissions to.
         form.fields["dataset"].queryset = form.fields["dataset"].queryset.filter(
             id__in=[x.id for x in allowed_datasets])
         if 'dataset' in self.request.GET and self.request.GET.get('dataset'):
-            if 'view_dataset' in get_perms(self.request.user, Dataset.objects.get(id=self.request.GET.get('dataset'))):
+            if has_dataset_perm(self.request.user, Dataset.objects.get(id=self.request.GET.get('dataset'))):
                 # If user does have permissions to selected dataset, Set queryset for form.gloss
                 form.fields["gloss"].queryset = Gloss.objects.filter(dataset__id=self.request.GET.get("dataset"))
             context['gloss_choices'] = Gloss.objects.filter(dataset=self.request.GET.get('dataset'))
@@ -275,7 +296,7 @@ class UploadedGlossvideosListView(ListView):
 
     def render_to_response(self, context, **response_kwargs):
         if 'dataset' in self.request.GET and self.request.GET.get('dataset'):
-            if 'view_dataset' not in get_perms(self.request.user, Dataset.objects.get(id=self.request.GET.get('dataset'))):
+            if not has_dataset_perm(self.request.user, Dataset.objects.get(id=self.request.GET.get('dataset'))):
                 msg = _("You do not have permissions to view the selected lexicon.")
                 messages.error(self.request, msg)
                 raise PermissionDenied(msg)
@@ -300,7 +321,7 @@ def update_glossvideo(request):
                         glossvideo.gloss = Gloss.objects.get(pk=item['gloss'])
                         glossvideo.video_type = FieldChoice.objects.get(
                             machine_value=item['video_type'])
-                        if 'view_dataset' in get_perms(request.user, glossvideo.gloss.dataset):
+                        if has_dataset_perm(request.user, glossvideo.gloss.dataset):
                             # Set version number if there is not already one
                             if glossvideo.version is None:
                                 glossvideo.version = glossvideo.next_version()
@@ -333,7 +354,7 @@ def update_glossvideo(request):
                     glossvideo.video_type = FieldChoice.objects.get(
                         machine_value=post['video_type'])
                     # Make sure that the user has rights to edit this datasets glosses.
-                    if 'view_dataset' in get_perms(request.user, glossvideo.gloss.dataset):
+                    if has_dataset_perm(request.user, glossvideo.gloss.dataset):
                         # Set version number.
                         # Set version number if there is not already one
                         if glossvideo.version is None:
@@ -360,7 +381,7 @@ def poster(request, videoid):
     generate a redirect to the static server for this frame"""
 
     video = get_object_or_404(GlossVideo, pk=videoid)
-    if 'view_dataset' not in get_perms(request.user, video.gloss.dataset):
+    if not has_dataset_perm(request.user, video.gloss.dataset):
         # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
         msg = _("You do not have permissions to add/change poster images for this lexicon.")
         messages.error(request, msg)
@@ -388,7 +409,7 @@ def change_glossvideo_order(request):
     videoid = request.POST["videoid"]
     direction = request.POST["direction"]
     video = GlossVideo.objects.get(pk=videoid)
-    if 'view_dataset' not in get_perms(request.user, video.gloss.dataset):
+    if not has_dataset_perm(request.user, video.gloss.dataset):
         # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
         msg = _("You do not have permissions to change order of videos for this lexicon.")
         messages.error(request, msg)
@@ -414,7 +435,7 @@ def change_glossvideo_publicity(request):
         videoid = request.POST["videoid"]
         is_public = request.POST["is_public"] == "True"
         video = GlossVideo.objects.get(pk=videoid)
-        if 'view_dataset' not in get_perms(request.user, video.gloss.dataset):
+        if not has_dataset_perm(request.user, video.gloss.dataset):
             # If user has no permissions to dataset, raise PermissionDenied to show 403 template.
             msg = _("You do not have permissions to change order of videos for this lexicon.")
             messages.error(request, msg)